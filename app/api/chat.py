@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
 
 from app.services.chat import get_ordered_chat, handle_send_message
 
@@ -6,15 +7,17 @@ from app.schemas.chat import Chat, NewMessageRequest
 from app.schemas.common import SuccessMessage
 
 from ..logger import logger
+from ..settings import CHAT_PAGE_SIZE, CHAT_MAX_PAGE_SIZE, CHAT_CURSOR_PATTERN
 
 router = APIRouter()
 
 @router.get("/chat/{room_id}", response_model=Chat)
-async def get_chat_endpoint(room_id: str):
+async def get_chat_endpoint(room_id: str, after: Optional[str] = Query(default=None, pattern=CHAT_CURSOR_PATTERN), limit: int = Query(default=CHAT_PAGE_SIZE, ge=1, le=CHAT_MAX_PAGE_SIZE)):
+    """Get the messages sent after the `after` cursor, in order"""
 
-    logger.debug(f"Getting chat for room {room_id}")
+    logger.debug(f"Getting chat for room {room_id} after {after}")
     
-    chat = await get_ordered_chat(room_id) 
+    chat = await get_ordered_chat(room_id, after=after, limit=limit) 
     
 
     return chat
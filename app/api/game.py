@@ -12,7 +12,7 @@ router = APIRouter()
 @router.post("/game", response_model=SuccessMessage)
 async def start_game_endpoint(request: StartGameRequest):
     
-    response: SuccessMessage = await handle_start_game(request.room_id)
+    response: SuccessMessage = await handle_start_game(request.room_id, request.timer_mode)
 
     return response
 
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Response
-from app.services.room import get_room_safe, create_room, join_room, handle_player_ready, get_player_safe_by_id, get_player_safe_by_cookie
+from app.services.room import get_room_safe, create_room, join_room, leave_room, handle_player_ready, get_player_safe_by_id, get_player_safe_by_cookie
 
-from app.schemas.room import Room, JoinRoomRequest, PlayerReadyRequest, PlayerSafe
+from app.schemas.room import Room, JoinRoomRequest, LeaveRoomRequest, PlayerReadyRequest, PlayerSafe
 from app.schemas.common import SuccessMessage
 
 from ..logger import logger
@@ -34,6 +34,12 @@ async def join_room_endpoint(request: JoinRoomRequest, response: Response) -> Re
 
     return data.player
 
+@router.post("/room/leave", response_model=SuccessMessage)
+async def leave_room_endpoint(request: LeaveRoomRequest):
+    """Leave a room"""
+    await leave_room(request)
+    return SuccessMessage(success="Player left the room successfully!")
+
 @router.post("/room/ready", response_model=SuccessMessage)
 async def set_ready_endpoint(request: PlayerReadyRequest):
     """Set a player as ready"""
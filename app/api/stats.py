@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+
+from app.services.websocket import get_websocket_stats
+from app.services.commands import get_command_stats
+from app.services.envelope import get_envelope_stats
+from app.services.scheduler import scheduler
+from app.services.game_runner import game_runner
+from app.services.sweeper import room_sweeper
+from app.services.song import lyrics_client, lyrics_cache
+from app.repository.room_cache import room_cache
+from app.repository.room import get_room_io_stats
+from app.repository.catalog import catalog
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_stats_endpoint():
+    """Get the runtime counters of this worker"""
+
+    return {
+        "websocket": get_websocket_stats(),
+        "commands": get_command_stats(),
+        "envelope_cache": get_envelope_stats(),
+        "scheduler": scheduler.get_stats(),
+        "game_runner": game_runner.get_stats(),
+        "room_sweeper": room_sweeper.get_stats(),
+        "room_cache": room_cache.get_stats(),
+        "room_io": get_room_io_stats(),
+        "lyrics": lyrics_client.get_stats(),
+        "lyrics_cache": lyrics_cache.get_stats(),
+        "catalog": catalog.get_stats(),
+    }
@@ -4,8 +4,9 @@ from app.services.websocket import room_websocket, websocket_endpoint_test
 router = APIRouter()
 
 @router.websocket("/ws/{room_id}/{player_id}")
-async def websocket_route(websocket: WebSocket, room_id: str, player_id: str):
-    await room_websocket(websocket, room_id, player_id)
+async def websocket_route(websocket: WebSocket, room_id: str, player_id: str, batch: bool = False):
+    """Events are sent one per frame, or as arrays of the events queued within a few milliseconds with ?batch=1"""
+    await room_websocket(websocket, room_id, player_id, batch)
 
 @router.websocket("/ws/test")
 async def websocket_test_route(websocket: WebSocket):
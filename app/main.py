@@ -1,8 +1,23 @@
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from app.models.database import database
-from app.repository.room import init_redis as redis_room_init
+from app.repository.room import init_redis as redis_room_init, track_room_io, set_room_patch_handler
 from app.repository.chat import init_redis as redis_chat_init
+from app.repository.lyrics import init_redis as redis_lyrics_init
+from app.repository.catalog import load_catalog
+from app.repository.deck import init_redis as redis_deck_init, remaining_tables
+from app.repository.turn import init_redis as redis_turn_init
+from app.repository.game_loop import init_redis as redis_game_loop_init
+from app.repository.room_cache import room_cache
+from app.services.broadcast_bus import bus
+from app.services.websocket import deliver_local_event, set_command_handler, close_all_websockets, close_replaced_websockets, heartbeat, CONTROL_CONNECTION_REPLACED
+from app.services.scheduler import scheduler
+from app.services.song import lyrics_client
+from app.services.room import broadcast_room_patch
+from app.services.commands import handle_command
+from app.services.game import start_game, handle_end_phase, CONTROL_END_PHASE, turn_cancellations, turn_matchers
+from app.services.game_runner import game_runner, CONTROL_GAME_RELEASED
+from app.services.sweeper import room_sweeper
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,12 +25,17 @@ from app.api.websocket import router as websocket_router
 from app.api.room import router as room_router
 from app.api.chat import router as chat_router
 from app.api.game import router as game_router
+from app.api.stats import router as stats_router
 
 import redis
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import os 
+import asyncio
+import signal
+import threading
 from app.logger import logger
+from app.settings import ROOM_MAX_ROUND_TRIPS_PER_REQUEST, WEBSOCKET_RESTART_CLOSE_CODE
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")  # Default to localhost if not set
 
@@ -30,14 +50,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def refuse_new_games_while_draining(request: Request, call_next):
+    """A draining worker hands its games over: new rooms and games go to the other workers or to the next process."""
+    if game_runner.draining and request.method == "POST" and request.url.path in ("/room", "/game"):
+        return JSONResponse(status_code=503, content={"detail": "Server restarting, try again"}, headers={"Retry-After": "1"})
+    return await call_next(request)
+
+@app.middleware("http")
+async def count_room_io(request: Request, call_next):
+    """Report the room reads and writes of every request in its response headers."""
+    room_io = track_room_io()
+    response = await call_next(request)
+
+    response.headers["X-Room-Reads"] = str(room_io["reads"])
+    response.headers["X-Room-Cached-Reads"] = str(room_io["cached_reads"])
+    response.headers["X-Room-Writes"] = str(room_io["writes"])
+
+    if room_io["reads"] + room_io["writes"] > ROOM_MAX_ROUND_TRIPS_PER_REQUEST:
+        logger.warning(f"{request.method} {request.url.path} made {room_io['reads']} room reads and {room_io['writes']} room writes")
+    return response
+
+async def drain():
+    """Hand the games over and send the clients to another worker, while new rooms and games are refused."""
+    await game_runner.drain()
+    await close_all_websockets(WEBSOCKET_RESTART_CLOSE_CODE)
+
+def drain_on_sigterm():
+    """Drain as soon as SIGTERM is received, then let uvicorn shut down. Its shutdown hook only runs once it has stopped
+    listening and closed every websocket, too late to refuse new games."""
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    loop = asyncio.get_running_loop()
+    uvicorn_handler = signal.getsignal(signal.SIGTERM)
+    if not callable(uvicorn_handler):
+        return
+
+    async def drain_then_exit(sig, frame):
+        try:
+            await drain()
+        except Exception as e:
+            logger.error(f"Error while draining the worker: {e}")
+        finally:
+            uvicorn_handler(sig, frame)
+
+    def handle_sigterm(sig, frame):
+        # A second SIGTERM does not wait for the drain
+        if game_runner.draining:
+            uvicorn_handler(sig, frame)
+            return
+        logger.info("SIGTERM received, draining the worker")
+        game_runner.draining = True
+        loop.call_soon_threadsafe(lambda: loop.create_task(drain_then_exit(sig, frame)))
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
 @app.on_event("startup")
 async def startup():
     # await database.connect()
     await redis_room_init()
+    set_room_patch_handler(broadcast_room_patch)
+    set_command_handler(handle_command)
     await redis_chat_init()
+    await redis_lyrics_init()
+    await redis_deck_init()
+    await redis_turn_init()
+    await redis_game_loop_init()
+    load_catalog()
+    await room_cache.start()
+    bus.on_control(CONTROL_END_PHASE, handle_end_phase)
+    bus.on_control(CONTROL_GAME_RELEASED, game_runner.take_over)
+    bus.on_control(CONTROL_CONNECTION_REPLACED, close_replaced_websockets)
+    await bus.start(deliver_local_event)
+    scheduler.start()
+    await lyrics_client.start()
+    await game_runner.start(start_game)
+    room_sweeper.register("turn_cancellations", turn_cancellations)
+    room_sweeper.register("turn_matchers", turn_matchers)
+    room_sweeper.register("remaining_tables", remaining_tables)
+    await room_sweeper.start()
+    await heartbeat.start()
+    drain_on_sigterm()
 
 @app.on_event("shutdown")
 async def shutdown():
+    # Already drained on SIGTERM. Otherwise, e.g. on Ctrl+C, uvicorn has closed the websockets with 1012: hand the games over
+    await room_sweeper.stop()
+    await heartbeat.stop()
+    await game_runner.drain()
+    await bus.stop()
+    await room_cache.stop()
+    await scheduler.stop()
+    await lyrics_client.stop()
     await database.disconnect()
 
 # Include API routers
@@ -45,6 +150,7 @@ app.include_router(websocket_router)
 app.include_router(room_router)
 app.include_router(chat_router)
 app.include_router(game_router)
+app.include_router(stats_router)
 
 @app.get("/")
 def read_root():
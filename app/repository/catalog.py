@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+import random
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from ..logger import logger
+from ..schemas.game import Song
+from ..settings import SONG_CATALOG_PATH, SONG_CATALOG_SAMPLING_ATTEMPTS
+
+
+class AliasTable:
+    """Walker's alias method: draws one of the rows with probability proportional to its weight in O(1).
+
+    Built in O(n) (Vose): each of the n buckets holds its own row with probability prob[i], and another row otherwise."""
+
+    __slots__ = ("rows", "prob", "alias")
+
+    def __init__(self, rows: Sequence[int], weights: Sequence[float]):
+        n = len(rows)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights] if total > 0 else [1.0] * n
+
+        self.rows = array("I", rows)
+        self.prob = array("d", bytes(8 * n))
+        self.alias = array("I", bytes(4 * n))
+
+        small = [i for i, weight in enumerate(scaled) if weight < 1]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+
+        # Left overs are only off 1 by rounding errors
+        for i in small + large:
+            self.prob[i] = 1
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def draw(self) -> int:
+        i = random.randrange(len(self.rows))
+        return self.rows[i] if random.random() < self.prob[i] else self.rows[self.alias[i]]
+
+
+class SongCatalog:
+    """Read-only song catalog held in columns rather than one model per song.
+
+    Row i of the catalog is (ids[i], titles[i], artists[artist_codes[i]], ...). Artists, languages and genres are stored
+    once in a value table and referenced by a small integer code, ids and codes live in typed arrays. Songs are only built
+    as models when returned. Each filterable column has an index from value code to the rows holding it, and the
+    popularity of the songs weights the draws of the game decks."""
+
+    FILTERS = ("artist", "language", "genre")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.titles: List[str] = []
+        self.popularity = array("f")
+        self.codes: Dict[str, array] = {column: array("I") for column in self.FILTERS}
+        self.values: Dict[str, List[str]] = {column: [] for column in self.FILTERS}
+        self.value_codes: Dict[str, Dict[str, int]] = {column: {} for column in self.FILTERS}
+        self.indexes: Dict[str, List[array]] = {column: [] for column in self.FILTERS}
+        self.row_by_id: Dict[int, int] = {}
+        self.alias_table: AliasTable = None
+        self.load_time = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def get_code(self, column: str, value: str) -> int:
+        codes = self.value_codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.values[column])
+            self.values[column].append(value)
+            self.indexes[column].append(array("I"))
+        return code
+
+    def add(self, song_id: int, title: str, artist: str, language: str = "", genre: str = "", popularity: float = 1.0):
+        if song_id in self.row_by_id:
+            logger.warning(f"Duplicate song id {song_id} in the catalog, keeping the first one")
+            return
+
+        row = len(self.ids)
+        self.row_by_id[song_id] = row
+        self.ids.append(song_id)
+        self.titles.append(title)
+        self.popularity.append(popularity)
+        self.alias_table = None
+
+        for column, value in (("artist", artist), ("language", language), ("genre", genre)):
+            code = self.get_code(column, value or "")
+            self.codes[column].append(code)
+            self.indexes[column][code].append(row)
+
+    def load(self, path: str = SONG_CATALOG_PATH) -> "SongCatalog":
+        """Load songs from a JSONL or CSV file with id, title, artist, language, genre and popularity fields."""
+
+        start = time.perf_counter()
+        with open(path, newline="", encoding="utf-8") as file:
+            if path.endswith(".csv"):
+                records: Iterable[dict] = csv.DictReader(file)
+            else:
+                records = (json.loads(line) for line in file if line.strip())
+
+            for record in records:
+                self.add(int(record["id"]), record["title"], record["artist"], record.get("language", ""), record.get("genre", ""), float(record.get("popularity") or 1))
+
+        self.load_time = time.perf_counter() - start
+        logger.info(f"Loaded {len(self)} songs from {path} in {self.load_time:.2f}s")
+        return self
+
+    def get_alias_table(self) -> AliasTable:
+        """Table drawing any song of the catalog weighted by its popularity, built on first use."""
+        if self.alias_table is None:
+            self.alias_table = AliasTable(range(len(self)), self.popularity)
+        return self.alias_table
+
+    def get_row(self, row: int) -> Song:
+        return Song(id=self.ids[row], title=self.titles[row], artist=self.values["artist"][self.codes["artist"][row]])
+
+    def get_song(self, song_id: int) -> Optional[Song]:
+        row = self.row_by_id.get(song_id)
+        return None if row is None else self.get_row(row)
+
+    def sample(self, k: int, artist: str = None, language: str = None, genre: str = None) -> List[Song]:
+        """Up to k distinct random songs matching all the given filters."""
+
+        filters = {column: value for column, value in (("artist", artist), ("language", language), ("genre", genre)) if value is not None}
+
+        # Draw from the rows of the most selective filter, and check the others on the drawn rows only
+        candidates = []
+        for column, value in filters.items():
+            code = self.value_codes[column].get(value)
+            if code is None:
+                return []
+            candidates.append((self.indexes[column][code], column, code))
+
+        if not candidates:
+            return [self.get_row(row) for row in random.sample(range(len(self)), min(k, len(self)))]
+
+        candidates.sort(key=lambda candidate: len(candidate[0]))
+        pool, _, _ = candidates[0]
+        checks = [(self.codes[column], code) for _, column, code in candidates[1:]]
+
+        def matches(row: int) -> bool:
+            return all(codes[row] == code for codes, code in checks)
+
+        if not checks:
+            return [self.get_row(row) for row in random.sample(pool, min(k, len(pool)))]
+
+        # Rejection sampling: cheap while the other filters keep most of the pool
+        rows = set()
+        for _ in range(k * SONG_CATALOG_SAMPLING_ATTEMPTS):
+            row = pool[random.randrange(len(pool))]
+            if matches(row):
+                rows.add(row)
+                if len(rows) == k:
+                    return [self.get_row(row) for row in rows]
+
+        # Too few matches to find them at random: scan the pool
+        matching = [row for row in pool if matches(row)]
+        return [self.get_row(row) for row in random.sample(matching, min(k, len(matching)))]
+
+    def get_stats(self) -> dict:
+        return {
+            "songs": len(self),
+            "artists": len(self.values["artist"]),
+            "languages": len(self.values["language"]),
+            "genres": len(self.values["genre"]),
+            "load_time": self.load_time,
+        }
+
+
+# Catalog shared by the whole worker, loaded at startup
+catalog = SongCatalog()
+
+
+def load_catalog(path: str = SONG_CATALOG_PATH):
+    if not os.path.exists(path):
+        logger.warning(f"Song catalog {path} not found, using the default songs")
+        return
+    catalog.load(path)
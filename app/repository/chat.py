@@ -1,47 +1,61 @@
 
 import os
 from dotenv import load_dotenv
-import json
+from datetime import datetime
 from ..logger import logger
-import uuid
-from fastapi import HTTPException, FastAPI
-from ..schemas.room import Room
 from ..schemas.chat import Chat, Message, NewMessageRequest
+from ..settings import CHAT_MAX_MESSAGES, CHAT_PAGE_SIZE, ROOM_TTL, ROOM_FINISHED_TTL
+from .room import get_room_key
 import redis.asyncio as aioredis
 
 
 load_dotenv()
 REDIS_URL = os.getenv("REDIS_URL")
 redis = None
-MAX_PLAYERS_PER_ROOM = 5
 
 async def init_redis():
     global redis
     redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
 
 
-async def get_chat(room_id: str):
-    logger.info(f"Getting chat for room {room_id}")
+def get_chat_key(room_id: str) -> str:
+    return f"{room_id}:chat"
 
-    chat = await redis.get(f"{room_id}:chat")
+def get_message_timestamp(message_id: str) -> str:
+    """Stream IDs start with the server time in milliseconds"""
+    milliseconds = int(message_id.split("-", 1)[0])
+    return datetime.fromtimestamp(milliseconds / 1000).strftime("%Y-%m-%d %H:%M:%S")
 
-    if chat is None:
-        error_message = f"No chat found for room {room_id}"
-        logger.info(error_message)
-        raise HTTPException(status_code=404, detail=error_message)
-    chat = Chat.model_validate_json(chat)
-    logger.debug(f"Chat retrieved successfully for room {room_id}: {chat}")
+async def get_chat(room_id: str, after: str = None, limit: int = CHAT_PAGE_SIZE):
+    """Get the messages of a room in order, starting right after the `after` message ID if set."""
+    logger.info(f"Getting chat for room {room_id} after {after}")
+
+    entries = await redis.xrange(get_chat_key(room_id), min=f"({after}" if after else "-", max="+", count=limit)
+
+    messages = [Message(id=message_id, timestamp=get_message_timestamp(message_id), **fields) for message_id, fields in entries]
+    chat = Chat(room_id=room_id, messages=messages, next_cursor=messages[-1].id if messages else after)
+    logger.debug(f"Chat retrieved successfully for room {room_id}: {len(messages)} messages")
     return(chat)
 
-async def add_message(request: NewMessageRequest):
+async def add_message(request: NewMessageRequest, finished: bool = False):
+    """Append a message to the room's chat stream. The stream assigns the message ID and keeps only the last messages.
+    Chatting keeps the room alive, only for ROOM_FINISHED_TTL once its game is finished."""
 
     logger.info(f"Adding message to room {request.room_id} with content: {request.message.content} from {request.message.sender_id}")
 
-    chat = await get_chat(request.room_id)
-
     message = request.message
-    chat.messages.append(message)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.xadd(
+            get_chat_key(request.room_id),
+            {"content": message.content, "sender_id": message.sender_id},
+            maxlen=CHAT_MAX_MESSAGES,
+            approximate=True,
+        )
+        ttl = ROOM_FINISHED_TTL if finished else ROOM_TTL
+        pipe.expire(get_chat_key(request.room_id), ttl)
+        pipe.expire(get_room_key(request.room_id), ttl)
+        message.id, _, _ = await pipe.execute()
+    message.timestamp = get_message_timestamp(message.id)
 
-    await redis.set(f"{request.room_id}:chat", chat.model_dump_json())
     logger.info(f"Message sent successfully to room {request.room_id} with content: {message}")
-    return(True)
\ No newline at end of file
+    return(message)
@@ -0,0 +1,77 @@
+import os
+from dotenv import load_dotenv
+from typing import Dict, List, Set
+from ..logger import logger
+from ..schemas.game import Song
+from ..settings import SONG_DECK_DRAW_ATTEMPTS, ROOM_TTL
+from .catalog import catalog, AliasTable
+import redis.asyncio as aioredis
+
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+redis = None
+
+async def init_redis():
+    global redis
+    redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+
+
+# Alias tables rebuilt for the games that already played most of the popular songs, by room
+remaining_tables: Dict[str, AliasTable] = {}
+
+
+def get_deck_key(room_id: str) -> str:
+    """Redis set of the ids of the songs already offered in the room's game. Small integer sets are stored compactly."""
+    return f"{room_id}:deck"
+
+def draw_rows(table: AliasTable, drawn: Set[int], k: int) -> List[int]:
+    """Draw up to k rows not drawn yet, rejecting the ones already drawn."""
+    rows = []
+    for _ in range(k * SONG_DECK_DRAW_ATTEMPTS):
+        row = table.draw()
+        if row not in drawn:
+            drawn.add(row)
+            rows.append(row)
+            if len(rows) == k:
+                break
+    return rows
+
+def build_remaining_table(drawn: Set[int]) -> AliasTable:
+    rows = [row for row in range(len(catalog)) if row not in drawn]
+    return AliasTable(rows, [catalog.popularity[row] for row in rows])
+
+async def draw_songs(room_id: str, k: int) -> List[Song]:
+    """Draw k songs never offered before in the room's game, weighted by popularity.
+
+    Draws are O(1) on the catalog's alias table, rejecting the songs already played. When the rejections pile up, the
+    game gets its own table without them, so a draw never rescans the catalog more than once every many turns."""
+
+    key = get_deck_key(room_id)
+    drawn = {catalog.row_by_id[song_id] for song_id in map(int, await redis.smembers(key)) if song_id in catalog.row_by_id}
+
+    if len(catalog) - len(drawn) < k:
+        logger.info(f"Deck of room {room_id} exhausted, shuffling every song back in")
+        drawn.clear()
+        remaining_tables.pop(room_id, None)
+        await redis.delete(key)
+
+    table = remaining_tables.get(room_id) or catalog.get_alias_table()
+    rows = draw_rows(table, drawn, k)
+
+    if len(rows) < k:
+        logger.debug(f"Rebuilding the deck of room {room_id} without its {len(drawn)} songs already played")
+        table = remaining_tables[room_id] = build_remaining_table(drawn)
+        rows += draw_rows(table, drawn, k - len(rows))
+
+    if rows:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, *[catalog.ids[row] for row in rows])
+            pipe.expire(key, ROOM_TTL)
+            await pipe.execute()
+    return [catalog.get_row(row) for row in rows]
+
+async def reset_deck(room_id: str):
+    """Start a new game with every song back in the deck."""
+    remaining_tables.pop(room_id, None)
+    await redis.delete(get_deck_key(room_id))
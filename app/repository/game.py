@@ -9,6 +9,8 @@ from ..schemas.game import *
 from ..schemas.common import *
 
 from .room import get_room, update_room
+from .catalog import catalog
+from .deck import draw_songs
 from random import shuffle
 from ..services.websocket import broadcast_event
 
@@ -27,10 +29,13 @@ async def init_redis():
 
 
 
-async def setup_new_game(room_id: str):
+def setup_new_game(room: Room, timer_mode: str = None):
+    """Set up the rounds and the game state of a room. The caller stores the room, see RoomSession."""
+    room_id = room.room_id
     logger.debug(f"Setting up new game for room {room_id}")
-    
-    room: Room = await get_room(room_id)
+
+    if timer_mode:
+        room.game.config.timer_mode = timer_mode
 
     logger.debug(f"Current round: {room.game.current_round}")
     logger.debug(f"Current turn: {room.game.current_round}")
@@ -63,8 +68,6 @@ async def setup_new_game(room_id: str):
     room.game.status = GameStatus(type=GAME_PHASE_PICKING_SONG, detail=None)
     room.room_state = ROOM_STATUS_PLAYING
     
-    await update_room(room)
-    
 async def update_turn(room: Room):
     """Updates the current turn in the game and broadcasts the updated state to all connected clients"""
     
@@ -77,7 +80,7 @@ async def update_turn(room: Room):
             return
         
         await broadcast_event(BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_TURN_CHANGE), RoundAndTurnMessage(turn=room.game.current_turn, round=room.game.current_round))
-        await update_room(room)
+        await update_room(room, ["current_turn"])
         return
     
     except Exception as e:
@@ -96,15 +99,33 @@ async def update_round(room: Room):
             return
         
         room.game.current_turn = 0
-        await update_room(room)
+        await update_room(room, ["current_round", "current_turn"])
         await broadcast_event(BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_ROUND_CHANGE), RoundAndTurnMessage(turn=room.game.current_turn, round=room.game.current_round))
 
     except Exception as e:
         logger.error(f"Error in updating round for room {room.room_id}: {str(e)}")
 
 
-async def retrieve_songs():
-    """Retrieve 3 songs."""
+async def end_game(room: Room):
+    """Mark the room's game as finished. From then on, writes to the room only keep it alive for ROOM_FINISHED_TTL."""
+
+    logger.debug(f"Ending game for room {room.room_id}")
+    room.room_state = ROOM_STATUS_FINISHED
+    room.game.status = GameStatus(type=GAME_STATUS_FINISHED, detail=None)
+    await update_room(room, ["room_state", "game_status"])
+
+
+async def retrieve_songs(room_id: str = None, artist: str = None, language: str = None, genre: str = None):
+    """Retrieve random songs from the catalog: from the room's deck, or matching the given filters. Falls back to 3 default songs without a catalog."""
+
+    if len(catalog):
+        if room_id and not (artist or language or genre):
+            songs: List[Song] = await draw_songs(room_id, GAME_CONFIG_NUMBER_OF_SONG_CHOICES)
+        else:
+            songs = catalog.sample(GAME_CONFIG_NUMBER_OF_SONG_CHOICES, artist=artist, language=language, genre=genre)
+        if songs:
+            return songs
+        logger.warning(f"No song in the catalog for artist {artist}, language {language} and genre {genre}")
 
     song_1 = Song(id=1, title="Ma meilleure ennemie", artist="Stromae")
     song_2 = Song(id=2, title="La Quête", artist="Orelsan")
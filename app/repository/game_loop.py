@@ -0,0 +1,129 @@
+import os
+import socket
+import time
+import uuid
+from dotenv import load_dotenv
+from typing import List, Optional
+from ..logger import logger
+from ..schemas.room import Room
+from ..settings import GAME_LEASE_TTL, GAMES_ACTIVE_KEY, ROOM_TTL
+from .room import get_room_key
+from .chat import get_chat_key
+from .deck import get_deck_key
+from .turn import get_turn_key
+import redis.asyncio as aioredis
+
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+redis = None
+renew_lease_script = None
+release_lease_script = None
+
+# Identifies this worker as the owner of the leases it takes
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Renew or release a lease only if this worker still holds it
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+async def init_redis():
+    global redis, renew_lease_script, release_lease_script
+    redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+    renew_lease_script = redis.register_script(RENEW_LEASE_SCRIPT)
+    release_lease_script = redis.register_script(RELEASE_LEASE_SCRIPT)
+
+
+def get_lease_key(room_id: str) -> str:
+    """Worker running the game loop of the room, expires unless renewed."""
+    return f"{room_id}:game:lease"
+
+def get_phase_key(room_id: str) -> str:
+    """Phase the game loop of the room is in, and its wall clock deadline: where a worker taking over resumes."""
+    return f"{room_id}:game:phase"
+
+async def acquire_lease(room_id: str) -> bool:
+    return bool(await redis.set(get_lease_key(room_id), WORKER_ID, nx=True, px=int(GAME_LEASE_TTL * 1000)))
+
+async def acquire_leases(room_ids: List[str]) -> List[bool]:
+    """Take the free leases of the given rooms in one round trip. False for the leases another worker holds."""
+    async with redis.pipeline(transaction=False) as pipe:
+        for room_id in room_ids:
+            pipe.set(get_lease_key(room_id), WORKER_ID, nx=True, px=int(GAME_LEASE_TTL * 1000))
+        return [bool(acquired) for acquired in await pipe.execute()]
+
+async def renew_leases(room_ids: List[str]) -> List[bool]:
+    """Extend the leases of the given rooms in one round trip. False for the leases this worker lost."""
+    async with redis.pipeline(transaction=False) as pipe:
+        for room_id in room_ids:
+            await renew_lease_script(keys=[get_lease_key(room_id)], args=[WORKER_ID, int(GAME_LEASE_TTL * 1000)], client=pipe)
+        return [bool(renewed) for renewed in await pipe.execute()]
+
+async def release_lease(room_id: str) -> bool:
+    return bool(await release_lease_script(keys=[get_lease_key(room_id)], args=[WORKER_ID]))
+
+async def get_lease_owner(room_id: str) -> Optional[str]:
+    return await redis.get(get_lease_key(room_id))
+
+async def get_lease_owners(room_ids: List[str]) -> List[Optional[str]]:
+    """Owners of the leases of the given rooms in one round trip, None for the expired ones."""
+    return await redis.mget([get_lease_key(room_id) for room_id in room_ids])
+
+async def add_active_game(room_id: str):
+    await redis.sadd(GAMES_ACTIVE_KEY, room_id)
+
+async def remove_active_game(room_id: str):
+    """The game is over: forget its loop."""
+    logger.debug(f"Removing game of room {room_id} from the active games")
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.srem(GAMES_ACTIVE_KEY, room_id)
+        pipe.delete(get_phase_key(room_id))
+        await pipe.execute()
+
+async def get_active_games() -> List[str]:
+    return list(await redis.smembers(GAMES_ACTIVE_KEY))
+
+async def set_phase_checkpoint(room_id: str, round_number: int, turn_number: int, phase: str, deadline: float):
+    key = get_phase_key(room_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={"round": round_number, "turn": turn_number, "phase": phase, "deadline": deadline})
+        pipe.expire(key, ROOM_TTL)
+        await pipe.execute()
+
+async def pause_phase_checkpoint(room_id: str):
+    """Freeze the time left in the phase, for a loop handed over on purpose: the restart does not eat into the phase."""
+    key = get_phase_key(room_id)
+    deadline = await redis.hget(key, "deadline")
+    if deadline is not None:
+        await redis.hset(key, "remaining", max(0.0, float(deadline) - time.time()))
+
+async def get_phase_checkpoint(room_id: str) -> Optional[dict]:
+    """Round, turn and phase in progress, and the seconds it has left, None if the loop never started one."""
+    data = await redis.hgetall(get_phase_key(room_id))
+    if not data:
+        return None
+
+    remaining = float(data["remaining"]) if "remaining" in data else float(data["deadline"]) - time.time()
+    return {"round": int(data["round"]), "turn": int(data["turn"]), "phase": data["phase"], "remaining": max(0.0, remaining)}
+
+async def expire_room_keys(room: Room, ttl: int):
+    """Set the time to live of every key of a room: its hash, chat, deck and turns."""
+    keys = [get_room_key(room.room_id), get_chat_key(room.room_id), get_deck_key(room.room_id)]
+    keys += [get_turn_key(room.room_id, round_number, turn_number) for round_number, turns in enumerate(room.game.rounds) for turn_number in range(len(turns))]
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.expire(key, ttl)
+        await pipe.execute()
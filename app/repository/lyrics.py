@@ -0,0 +1,34 @@
+import os
+import json
+from dotenv import load_dotenv
+from typing import Optional, Tuple
+from ..logger import logger
+import redis.asyncio as aioredis
+
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+redis = None
+
+async def init_redis():
+    global redis
+    redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+
+
+def get_lyrics_key(title: str, artist: str) -> str:
+    return f"lyrics:{artist.strip().lower()}:{title.strip().lower()}"
+
+async def get_cached_lyrics(title: str, artist: str) -> Tuple[bool, Optional[str]]:
+    """Lyrics shared by all the workers. Returns whether the song is cached, and its lyrics: None for a song the API does not know."""
+
+    value = await redis.get(get_lyrics_key(title, artist))
+    if value is None:
+        return False, None
+
+    return True, json.loads(value)["lyrics"]
+
+async def cache_lyrics(title: str, artist: str, lyrics: Optional[str], ttl: int):
+    """Store the lyrics of a song for ttl seconds, None to remember that the API does not know it."""
+
+    logger.debug(f"Caching lyrics of {title} by {artist} for {ttl}s")
+    await redis.set(get_lyrics_key(title, artist), json.dumps({"lyrics": lyrics}), ex=ttl)
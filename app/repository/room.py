@@ -6,19 +6,170 @@ from ..logger import logger
 import uuid
 from fastapi import HTTPException, FastAPI
 from ..schemas.room import Room, Player, PlayerSafe, get_player_safe
-from ..schemas.chat import Chat
-from ..schemas.game import Game, GameStatus, GameConfig
+from ..schemas.game import Game, GameStatus, GameConfig, Turn
 import redis.asyncio as aioredis
-from typing import Dict, List
+from pydantic import TypeAdapter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from contextvars import ContextVar
 from ..settings import *
+from .room_scripts import JOIN_ROOM_SCRIPT, LEAVE_ROOM_SCRIPT, SET_PLAYER_READY_SCRIPT, SET_PLAYER_CONNECTED_SCRIPT, WRITE_ROOM_FIELDS_SCRIPT
+from .room_cache import room_cache
 
 load_dotenv()
 REDIS_URL = os.getenv("REDIS_URL")
 redis = None
+join_room_script = None
+leave_room_script = None
+set_player_ready_script = None
+set_player_connected_script = None
+write_room_fields_script = None
+
+# Trailing arguments of every room script (see room_scripts.py)
+ROOM_VERSION_ARGS = [ROOM_TTL, ROOM_STATUS_FINISHED, ROOM_FINISHED_TTL, ROOM_VERSIONS_CHANNEL]
 
 async def init_redis():
-    global redis
+    global redis, join_room_script, leave_room_script, set_player_ready_script, set_player_connected_script, write_room_fields_script
     redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+    join_room_script = redis.register_script(JOIN_ROOM_SCRIPT)
+    leave_room_script = redis.register_script(LEAVE_ROOM_SCRIPT)
+    set_player_ready_script = redis.register_script(SET_PLAYER_READY_SCRIPT)
+    set_player_connected_script = redis.register_script(SET_PLAYER_CONNECTED_SCRIPT)
+    write_room_fields_script = redis.register_script(WRITE_ROOM_FIELDS_SCRIPT)
+
+
+# A room is stored as a Redis hash, one field per part of the room, so that a mutation only writes what changed
+# and a reader can only fetch what it needs. The hash also holds a version, bumped by every write (see room_scripts.py)
+ROOM_FIELDS = ["room_id", "owner", "room_state", "players", "game_status", "game_config", "current_round", "current_turn", "rounds"]
+
+players_adapter = TypeAdapter(List[PlayerSafe])
+rounds_adapter = TypeAdapter(List[List[Turn]])
+
+ROOM_FIELD_GETTERS = {
+    "room_id": lambda room: room.room_id,
+    "owner": lambda room: room.owner,
+    "room_state": lambda room: room.room_state,
+    "players": lambda room: room.players,
+    "game_status": lambda room: room.game.status,
+    "game_config": lambda room: room.game.config,
+    "current_round": lambda room: room.game.current_round,
+    "current_turn": lambda room: room.game.current_turn,
+    "rounds": lambda room: room.game.rounds,
+}
+
+ROOM_FIELD_ENCODERS = {
+    "room_id": lambda value: value,
+    "owner": lambda value: value or "",
+    "room_state": lambda value: value,
+    "players": lambda value: players_adapter.dump_json(value).decode(),
+    "game_status": lambda value: value.model_dump_json(),
+    "game_config": lambda value: value.model_dump_json(),
+    "current_round": str,
+    "current_turn": str,
+    "rounds": lambda value: rounds_adapter.dump_json(value).decode(),
+}
+
+# Room patches: JSON-Patch-like operations on the room as returned by GET /room/{room_id}, players being addressed by id.
+# The values of the operations are built from the encoded hash values, without encoding the room again
+ROOM_FIELD_PATHS = {
+    "room_id": "/room_id",
+    "owner": "/owner",
+    "room_state": "/room_state",
+    "players": "/players",
+    "game_status": "/game/status",
+    "game_config": "/game/config",
+    "current_round": "/game/current_round",
+    "current_turn": "/game/current_turn",
+    "rounds": "/game/rounds",
+}
+
+ROOM_FIELD_JSON = {
+    "room_id": json.dumps,
+    "owner": lambda value: json.dumps(value or None),
+    "room_state": json.dumps,
+    "players": lambda value: value,
+    "game_status": lambda value: value,
+    "game_config": lambda value: value,
+    "current_round": lambda value: value,
+    "current_turn": lambda value: value,
+    "rounds": lambda value: value,
+}
+
+ROOM_FIELD_DECODERS = {
+    "room_id": lambda value: value,
+    "owner": lambda value: value or None,
+    "room_state": lambda value: value,
+    "players": players_adapter.validate_json,
+    "game_status": GameStatus.model_validate_json,
+    "game_config": GameConfig.model_validate_json,
+    "current_round": int,
+    "current_turn": int,
+    "rounds": rounds_adapter.validate_json,
+}
+
+# Room reads and writes of the current request or game step, and of the whole worker
+room_io_counter: ContextVar[Optional[Dict[str, int]]] = ContextVar("room_io_counter", default=None)
+room_io_stats = {"reads": 0, "cached_reads": 0, "writes": 0}
+
+def track_room_io() -> Dict[str, int]:
+    """Start counting the room reads and writes of the current request or game step. Returns the counter."""
+    counter = {"reads": 0, "cached_reads": 0, "writes": 0}
+    room_io_counter.set(counter)
+    return counter
+
+def count_room_io(kind: str):
+    room_io_stats[kind] += 1
+    counter = room_io_counter.get()
+    if counter is not None:
+        counter[kind] += 1
+
+def get_room_io_stats() -> dict:
+    return dict(room_io_stats)
+
+def get_room_key(room_id: str) -> str:
+    return f"{room_id}:room"
+
+def dump_room_fields(room: Room, fields: List[str] = ROOM_FIELDS) -> Dict[str, str]:
+    """Encode the given fields of a room into Redis hash values."""
+    return {field: ROOM_FIELD_ENCODERS[field](ROOM_FIELD_GETTERS[field](room)) for field in fields}
+
+def load_room(data: Dict[str, str]) -> Room:
+    """Build a room from all the fields of its Redis hash."""
+    fields = {field: ROOM_FIELD_DECODERS[field](value) for field, value in data.items() if field in ROOM_FIELD_DECODERS}
+
+    game = None
+    if "game_status" in fields:
+        game = Game(status=fields["game_status"], config=fields["game_config"], current_round=fields["current_round"], current_turn=fields["current_turn"], rounds=fields["rounds"])
+
+    return Room(room_id=fields["room_id"], owner=fields["owner"], players=fields["players"], game=game, room_state=fields["room_state"], version=int(data.get("version", 0)))
+
+def get_patch_op(op: str, path: str, value: str = None) -> str:
+    """One operation of a room patch, value being already JSON."""
+    if value is None:
+        return f'{{"op":"{op}","path":"{path}"}}'
+    return f'{{"op":"{op}","path":"{path}","value":{value}}}'
+
+def get_field_ops(mapping: Dict[str, str]) -> List[str]:
+    """Replace operations of the encoded fields written."""
+    return [get_patch_op("replace", ROOM_FIELD_PATHS[field], ROOM_FIELD_JSON[field](value)) for field, value in mapping.items()]
+
+# Called with the room id and the JSON patch after every write of a room, set by the service broadcasting the patches
+RoomPatchHandler = Callable[[str, str], Awaitable[Any]]
+room_patch_handler: RoomPatchHandler = None
+
+def set_room_patch_handler(handler: RoomPatchHandler):
+    global room_patch_handler
+    room_patch_handler = handler
+
+async def publish_room_patch(room_id: str, version: int, ops: List[str]):
+    """Send the operations that turned the previous version of the room into this one."""
+    if room_patch_handler is None or not ops:
+        return
+
+    try:
+        await room_patch_handler(room_id, f'{{"version":{version},"ops":[{",".join(ops)}]}}')
+    except Exception as e:
+        # Clients detect the missing version and resync
+        logger.error(f"Error publishing patch {version} of room {room_id}: {e}")
 
 
 async def create_room():
@@ -28,35 +179,95 @@ async def create_room():
     game_config: GameConfig = GameConfig(num_rounds=GAME_CONFIG_NUMBER_OF_ROUNDS, turn_duration=GAME_CONFIG_ROUND_DURATION) 
     game: Game = Game(status=GameStatus(type=GAME_STATUS_INITIALIZED), current_round=0, current_turn=0, rounds=[], config=game_config)
     
-    room = Room(room_id=room_id, players=[], game=game, room_state="waiting").model_dump_json()
-    chat = Chat(room_id=room_id, messages=[]).model_dump_json()
+    room = Room(room_id=room_id, players=[], game=game, room_state="waiting")
     
-    await redis.set(f"{room_id}:room", room)
-    await redis.set(f"{room_id}:chat", chat)
+    # The chat stream is created with the first message. The room expires unless written again
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(get_room_key(room_id), mapping={**dump_room_fields(room), "version": 0})
+        pipe.expire(get_room_key(room_id), ROOM_TTL)
+        await pipe.execute()
+    count_room_io("writes")
     logger.info(f"Created room {room_id}")
     return(room_id)
 
+def cache_room(data: Dict[str, str]) -> Room:
+    """Decode a whole room hash and keep it in the worker's cache."""
+    room = load_room(data)
+    room_cache.put(room.room_id, room.version, room)
+    return room
+
+async def write_room_fields(room_id: str, mapping: Dict[str, str]) -> int:
+    """Write some fields of an existing room, bump its version, invalidate the cached copies and publish the patch. Returns the new version."""
+
+    args = [value for item in mapping.items() for value in item]
+    version = await write_room_fields_script(keys=[get_room_key(room_id)], args=[*args, *ROOM_VERSION_ARGS])
+    count_room_io("writes")
+
+    if not version:
+        error_message = f"Room {room_id} does not exist"
+        logger.info(error_message)
+        raise HTTPException(status_code=404, detail=error_message)
+
+    room_cache.invalidate(room_id, version)
+    await publish_room_patch(room_id, version, get_field_ops(mapping))
+    return version
+
 async def get_room(room_id: str):
 
     logger.info(f"Getting room {room_id}")
-    room = await redis.get(f"{room_id}:room")
+
+    room = room_cache.get(room_id)
+    if room is not None:
+        count_room_io("cached_reads")
+        return room
+
+    room = await redis.hgetall(get_room_key(room_id))
+    count_room_io("reads")
     
-    if room is None:
+    if not room:
         error_message = f"Room {room_id} does not exist"
         logger.info(error_message)
         raise HTTPException(status_code=404, detail=error_message)
 
-    return(Room.model_validate_json(room))
+    return(cache_room(room))
+
+async def get_room_fields(room_id: str, *fields: str) -> Dict[str, Any]:
+    """Get only some fields of a room, decoded."""
+
+    room = room_cache.get(room_id)
+    if room is not None:
+        count_room_io("cached_reads")
+        return {field: ROOM_FIELD_GETTERS[field](room) for field in fields}
+
+    values = await redis.hmget(get_room_key(room_id), ["room_id", *fields])
+    count_room_io("reads")
+
+    if values[0] is None:
+        error_message = f"Room {room_id} does not exist"
+        logger.info(error_message)
+        raise HTTPException(status_code=404, detail=error_message)
+
+    return {field: ROOM_FIELD_DECODERS[field](value) for field, value in zip(fields, values[1:])}
+
+async def room_exists(room_id: str) -> bool:
+    count_room_io("reads")
+    return bool(await redis.exists(get_room_key(room_id)))
+
+async def get_existing_rooms(room_ids: List[str]) -> List[bool]:
+    """Whether each room still exists, in one round trip."""
+    async with redis.pipeline(transaction=False) as pipe:
+        for room_id in room_ids:
+            pipe.exists(get_room_key(room_id))
+        return [bool(exists) for exists in await pipe.execute()]
+
+async def get_players(room_id: str) -> List[PlayerSafe]:
+    return (await get_room_fields(room_id, "players"))["players"]
 
 async def set_owner(player_id: str, room_id: str):
 
     try:
         logger.info(f"Setting owner for room {room_id} to {player_id}")
-        tmp_room = await redis.get(f"{room_id}:room")
-        logger.debug(f"Temporary room state: {tmp_room} in room {room_id} before setting owner")
-        room = Room.model_validate_json(tmp_room)
-        room.owner = player_id
-        await redis.set(f"{room_id}:room", room.model_dump_json())
+        await write_room_fields(room_id, {"owner": player_id})
         
         logger.info(f"Owner set successfully for room {room_id}")
         return(True)
@@ -83,36 +294,179 @@ async def add_player(player_name: str, room_id: str):
     player_cookie = str(uuid.uuid4())
     player = Player(name=player_name, id=player_id, cookie=player_cookie)
 
-    room = Room.model_validate_json(await redis.get(f"{room_id}:room"))
-    room.players.append(player)
-    await redis.set(f"{room_id}:room", room.model_dump_json())
+    players = await get_players(room_id)
+    players.append(player)
+    await write_room_fields(room_id, {"players": ROOM_FIELD_ENCODERS["players"](players)})
     
-    logger.debug(f"Current players in room {room_id}: {room.players}")
+    logger.debug(f"Current players in room {room_id}: {players}")
     return(player)
 
-async def get_chat(room_id: str):
-    pass
-
 async def update_players(room_id: str, players: List[Player]):
     logger.debug(f"Updating players in room {room_id} with {players}")
     
-    room = Room.model_validate_json(await redis.get(f"{room_id}:room"))
-    room.players = players
-    await redis.set(f"{room_id}:room", room.model_dump_json())
+    await write_room_fields(room_id, {"players": ROOM_FIELD_ENCODERS["players"](players)})
     
-    logger.debug(f"Players updated successfully in room {room_id}: {room.players}")
+    logger.debug(f"Players updated successfully in room {room_id}: {players}")
     return(True)
 
-async def update_room(room: Room):
+async def update_room(room: Room, fields: List[str] = ROOM_FIELDS):
+    """Store a room. Only the given fields are written when set."""
     try:
 
-        logger.debug(f"Updating room {room.room_id} with {room}")
+        logger.debug(f"Updating fields {fields} of room {room.room_id} with {room}")
 
-        await redis.set(f"{room.room_id}:room", room.model_dump_json())
+        await write_room_fields(room.room_id, dump_room_fields(room, fields))
         
         logger.debug(f"Room updated successfully in room {room.room_id}")
     
+    except HTTPException:
+        raise
     except Exception as e:
         error_message = f"Error updating room {room.room_id}: {e}"
         logger.error(error_message)
-        raise HTTPException(status_code=500, detail=error_message)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=error_message)
+
+class RoomSession:
+    """Unit of work on a room: loads the room once, then writes every field changed on it in a single round trip.
+
+    Changes are found by comparing the encoded fields with the ones loaded, so callers mutate the room freely:
+
+        async with RoomSession(room_id) as room:
+            room.game.status = GameStatus(type=GAME_PHASE_GUESSING_SONG)
+
+    Nothing is written if the block raises. A room already loaded by the caller can be given to skip the read."""
+
+    def __init__(self, room_id: str, room: Room = None):
+        self.room_id = room_id
+        self.room: Room = None
+        self.snapshot: Dict[str, str] = {}
+        self.version: int = None
+        if room is not None:
+            self.attach(room)
+
+    def attach(self, room: Room):
+        self.room = room
+        self.snapshot = dump_room_fields(room)
+
+    async def load(self) -> Room:
+        if self.room is None:
+            self.attach(await get_room(self.room_id))
+        return self.room
+
+    async def flush(self) -> List[str]:
+        """Write the fields changed since the room was loaded or last flushed. Returns the fields written."""
+        if self.room is None:
+            return []
+
+        current = dump_room_fields(self.room)
+        changed = {field: value for field, value in current.items() if value != self.snapshot[field]}
+        if changed:
+            logger.debug(f"Flushing fields {list(changed)} of room {self.room_id}")
+            self.version = await write_room_fields(self.room_id, changed)
+            self.snapshot = current
+
+        return list(changed)
+
+    async def __aenter__(self) -> Room:
+        return await self.load()
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.flush()
+
+def get_waiting_ops(room: Room, owner_changed: bool, status_changed: bool) -> List[str]:
+    """Replace operations of the owner and the game status, for the ones a room script changed."""
+    ops = []
+    if owner_changed:
+        ops.append(get_patch_op("replace", "/owner", json.dumps(room.owner)))
+    if status_changed:
+        ops.append(get_patch_op("replace", "/game/status", room.game.status.model_dump_json()))
+    return ops
+
+def parse_script_reply(room_id: str, reply: List[str], extra_values: int = 0):
+    """Raise the error returned by a room script, or return its extra values and the room it returned."""
+
+    if reply[0] == "error":
+        error_message = f"{reply[2]} (room {room_id})"
+        logger.info(error_message)
+        raise HTTPException(status_code=int(reply[1]), detail=error_message)
+
+    values = reply[1:1 + extra_values]
+    fields = reply[1 + extra_values:]
+    room = cache_room(dict(zip(fields[::2], fields[1::2])))
+    return values, room
+
+async def join_room_atomic(player_name: str, room_id: str):
+    """Add a new player to a room in a single round trip: checks the name and the room capacity, sets the owner and the game status. Returns the player and the updated room."""
+    logger.info(f"Adding player {player_name} to room {room_id}")
+
+    player = Player(name=player_name, id=str(uuid.uuid4()), cookie=str(uuid.uuid4()))
+
+    count_room_io("writes")
+    reply = await join_room_script(
+        keys=[get_room_key(room_id)],
+        args=[get_player_safe(player).model_dump_json(), MAX_PLAYERS, ROOM_STATUS_WAITING, GAME_STATUS_WAITING_PLAYERS, GAME_STATUS_WAITING_OWNER, *ROOM_VERSION_ARGS],
+    )
+    (owner_changed, status_changed), room = parse_script_reply(room_id, reply, extra_values=2)
+
+    # The owner is only set by the first join, and the status only changes while the room is waiting
+    await publish_room_patch(room_id, room.version, [
+        get_patch_op("add", f"/players/{player.id}", get_player_safe(player).model_dump_json()),
+        *get_waiting_ops(room, owner_changed == "1", status_changed == "1"),
+    ])
+
+    logger.debug(f"Current players in room {room_id}: {room.players}")
+    return player, room
+
+async def leave_room_atomic(player_id: str, room_id: str) -> Room:
+    """Remove a player from a room in a single round trip, handing the ownership over if needed. Returns the updated room."""
+    logger.info(f"Removing player {player_id} from room {room_id}")
+
+    count_room_io("writes")
+    reply = await leave_room_script(
+        keys=[get_room_key(room_id)],
+        args=[player_id, ROOM_STATUS_WAITING, GAME_STATUS_WAITING_PLAYERS, GAME_STATUS_WAITING_OWNER, *ROOM_VERSION_ARGS],
+    )
+    (owner_changed, status_changed), room = parse_script_reply(room_id, reply, extra_values=2)
+
+    await publish_room_patch(room_id, room.version, [
+        get_patch_op("remove", f"/players/{player_id}"),
+        *get_waiting_ops(room, owner_changed == "1", status_changed == "1"),
+    ])
+    return room
+
+async def set_player_ready_atomic(player_name: str, ready: bool, room_id: str):
+    """Set the ready state of a player and update the game status in a single round trip. Returns whether all players are ready and the updated room."""
+    logger.info(f"Setting player {player_name} {'ready' if ready else 'not ready'} in room {room_id}")
+
+    count_room_io("writes")
+    reply = await set_player_ready_script(
+        keys=[get_room_key(room_id)],
+        args=[player_name, "1" if ready else "0", ROOM_STATUS_WAITING, GAME_STATUS_WAITING_PLAYERS, GAME_STATUS_WAITING_OWNER, *ROOM_VERSION_ARGS],
+    )
+    (all_ready, status_changed), room = parse_script_reply(room_id, reply, extra_values=2)
+
+    player = next(player for player in room.players if player.name == player_name)
+    await publish_room_patch(room_id, room.version, [
+        get_patch_op("replace", f"/players/{player.id}/ready", json.dumps(ready)),
+        *get_waiting_ops(room, False, status_changed == "1"),
+    ])
+    return all_ready == "1", room
+
+async def set_player_connected_atomic(player_id: str, connection_id: str, connected: bool, room_id: str):
+    """Mark a player connected with the given socket, or disconnected if that socket is still its current one, in a single
+    round trip. Returns the previous connection of the player, whether its connected state changed and the updated room."""
+    logger.info(f"Setting player {player_id} {'connected' if connected else 'disconnected'} in room {room_id}")
+
+    count_room_io("writes")
+    reply = await set_player_connected_script(
+        keys=[get_room_key(room_id)],
+        args=[player_id, connection_id, "1" if connected else "0", *ROOM_VERSION_ARGS],
+    )
+    (previous, changed), room = parse_script_reply(room_id, reply, extra_values=2)
+
+    if changed == "1":
+        await publish_room_patch(room_id, room.version, [
+            get_patch_op("replace", f"/players/{player_id}/connected", json.dumps(connected)),
+        ])
+    return previous or None, changed == "1", room
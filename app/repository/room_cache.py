@@ -0,0 +1,144 @@
+import os
+import asyncio
+from collections import OrderedDict
+from dotenv import load_dotenv
+import redis.asyncio as aioredis
+from typing import Optional, Tuple
+
+from ..logger import logger
+from ..schemas.room import Room
+from ..settings import ROOM_CACHE_SIZE, ROOM_VERSIONS_CHANNEL
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+
+
+def copy_room(room: Room) -> Room:
+    """Copy the models and lists of a room that callers may mutate. Much cheaper than a deep copy."""
+
+    game = room.game
+    if game is not None:
+        game = game.model_copy(update={
+            "status": game.status.model_copy(),
+            "config": game.config.model_copy(),
+            "rounds": [[turn.model_copy(update={"guessers": list(turn.guessers or [])}) for turn in round] for round in game.rounds],
+        })
+
+    return room.model_copy(update={"players": [player.model_copy() for player in room.players], "game": game})
+
+
+class RoomCache:
+    """Per-worker cache of decoded rooms, keyed by room id and version.
+
+    Every write to a room bumps its version and publishes it on ROOM_VERSIONS_CHANNEL: each worker then drops its older
+    copy of the room. An invalidated room is kept as a tombstone holding the latest known version, so that a read
+    started before the invalidation can not put the outdated room back."""
+
+    def __init__(self, max_size: int = ROOM_CACHE_SIZE):
+        self.max_size = max_size
+        self.rooms: "OrderedDict[str, Tuple[int, Optional[Room]]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+        self.redis = None
+        self.pubsub = None
+        self.listener_task: asyncio.Task = None
+
+    @property
+    def enabled(self) -> bool:
+        # Without the versions of the other workers, a cached room could be outdated
+        return self.listener_task is not None
+
+    def get(self, room_id: str) -> Optional[Room]:
+        """Copy of the cached room, None if not cached."""
+        if not self.enabled:
+            return None
+
+        entry = self.rooms.get(room_id)
+        if entry is None or entry[1] is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        self.rooms.move_to_end(room_id)
+        return copy_room(entry[1])
+
+    def put(self, room_id: str, version: int, room: Room):
+        if not self.enabled:
+            return
+
+        entry = self.rooms.get(room_id)
+        if entry is not None and entry[0] > version:
+            return
+
+        self.rooms[room_id] = (version, copy_room(room))
+        self.rooms.move_to_end(room_id)
+        if len(self.rooms) > self.max_size:
+            self.rooms.popitem(last=False)
+
+    def invalidate(self, room_id: str, version: int):
+        """Drop the cached room if older than the version."""
+        entry = self.rooms.get(room_id)
+        if entry is not None and entry[0] >= version:
+            return
+
+        self.rooms[room_id] = (version, None)
+        self.stats["invalidations"] += 1
+        if len(self.rooms) > self.max_size:
+            self.rooms.popitem(last=False)
+
+    def discard(self, room_id: str):
+        self.rooms.pop(room_id, None)
+
+    async def start(self):
+        self.redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(ROOM_VERSIONS_CHANNEL)
+        self.listener_task = asyncio.create_task(self.listen())
+        logger.info("Room cache started")
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+        if self.pubsub:
+            await self.pubsub.aclose()
+        if self.redis:
+            await self.redis.aclose()
+        self.redis = None
+        self.pubsub = None
+        self.listener_task = None
+        self.rooms.clear()
+        logger.info("Room cache stopped")
+
+    async def listen(self):
+        while True:
+            try:
+                event = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if event is None or event["type"] != "message":
+                    continue
+
+                room_id, version = event["data"].split(" ", 1)
+                self.invalidate(room_id, int(version))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while listening to room versions: {e}")
+                # Versions may have been missed: nothing cached can be trusted anymore
+                self.rooms.clear()
+                await asyncio.sleep(1)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": sum(1 for _, room in self.rooms.values() if room is not None),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+# Cache shared by the whole worker
+room_cache = RoomCache()
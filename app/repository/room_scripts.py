@@ -0,0 +1,257 @@
+# Lua scripts run by Redis on the room hash (see repository/room.py for its fields).
+# Each script validates, mutates the room and updates the game status atomically, bumps the room's version, then returns
+# {"ok", <extra values>..., <HGETALL of the room>...} or {"error", <HTTP status code>, <message>}.
+# The last four arguments of every script are the time to live of the room, refreshed by every write, the finished room state
+# and the shorter time to live of a finished room, and the channel the new version is published on.
+
+# Shared helpers, prepended to every script
+LUA_HELPERS = """
+local function error_reply(code, message)
+    return {'error', code, message}
+end
+
+-- cjson encodes empty tables as objects
+local function encode_list(list)
+    if #list == 0 then
+        return '[]'
+    end
+    return cjson.encode(list)
+end
+
+-- Bump the version of the room, keep it alive and tell the other workers to drop their cached copy.
+-- A finished room is only kept alive for the shorter time to live, so that it is reaped soon after its game
+local function bump_version(key)
+    local version = redis.call('HINCRBY', key, 'version', 1)
+    local ttl = ARGV[#ARGV - 3]
+    if redis.call('HGET', key, 'room_state') == ARGV[#ARGV - 2] then
+        ttl = ARGV[#ARGV - 1]
+    end
+    redis.call('EXPIRE', key, ttl)
+    redis.call('PUBLISH', ARGV[#ARGV], redis.call('HGET', key, 'room_id') .. ' ' .. version)
+    return version
+end
+
+-- Game status of a waiting room: waiting for the players that are not ready, or for the owner to start.
+-- Returns whether the status changed
+local function update_waiting_status(key, players, waiting_state, waiting_players, waiting_owner)
+    if redis.call('HGET', key, 'room_state') ~= waiting_state then
+        return false
+    end
+
+    local not_ready = {}
+    for _, player in ipairs(players) do
+        if not player.ready then
+            table.insert(not_ready, player.id)
+        end
+    end
+
+    local status
+    if #players > 0 and #not_ready == 0 then
+        status = '{"type":' .. cjson.encode(waiting_owner) .. ',"detail":null}'
+    else
+        status = '{"type":' .. cjson.encode(waiting_players) .. ',"detail":' .. encode_list(not_ready) .. '}'
+    end
+    if redis.call('HGET', key, 'game_status') == status then
+        return false
+    end
+    redis.call('HSET', key, 'game_status', status)
+    return true
+end
+"""
+
+# KEYS[1]: room key
+# ARGV: player json, max players, waiting room state, waiting players status, waiting owner status, room ttl, finished room state, finished room ttl, versions channel
+# Extra values: "1" if the owner changed, "1" if the game status changed
+JOIN_ROOM_SCRIPT = LUA_HELPERS + """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return error_reply('404', 'Room does not exist')
+end
+
+local players = cjson.decode(redis.call('HGET', key, 'players'))
+local player = cjson.decode(ARGV[1])
+
+for _, other in ipairs(players) do
+    if other.name == player.name then
+        return error_reply('400', 'Player ' .. player.name .. ' is already in the room')
+    end
+end
+
+if #players >= tonumber(ARGV[2]) then
+    return error_reply('400', 'Room is full. Cannot join.')
+end
+
+table.insert(players, player)
+redis.call('HSET', key, 'players', encode_list(players))
+
+-- The first player to join owns the room
+local owner_changed = false
+if redis.call('HGET', key, 'owner') == '' then
+    redis.call('HSET', key, 'owner', player.id)
+    owner_changed = true
+end
+
+local status_changed = update_waiting_status(key, players, ARGV[3], ARGV[4], ARGV[5])
+
+bump_version(key)
+
+local reply = {'ok', owner_changed and '1' or '0', status_changed and '1' or '0'}
+for _, value in ipairs(redis.call('HGETALL', key)) do
+    table.insert(reply, value)
+end
+return reply
+"""
+
+# KEYS[1]: room key
+# ARGV: player id, waiting room state, waiting players status, waiting owner status, room ttl, finished room state, finished room ttl, versions channel
+# Extra values: "1" if the owner changed, "1" if the game status changed
+LEAVE_ROOM_SCRIPT = LUA_HELPERS + """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return error_reply('404', 'Room does not exist')
+end
+
+local players = cjson.decode(redis.call('HGET', key, 'players'))
+local remaining = {}
+local found = false
+
+for _, player in ipairs(players) do
+    if player.id == ARGV[1] then
+        found = true
+    else
+        table.insert(remaining, player)
+    end
+end
+
+if not found then
+    return error_reply('404', 'Player ' .. ARGV[1] .. ' is not in the room')
+end
+
+redis.call('HSET', key, 'players', encode_list(remaining))
+redis.call('HDEL', key, 'connection:' .. ARGV[1])
+
+-- The ownership goes to the oldest remaining player
+local owner_changed = false
+if redis.call('HGET', key, 'owner') == ARGV[1] then
+    local owner = ''
+    if #remaining > 0 then
+        owner = remaining[1].id
+    end
+    redis.call('HSET', key, 'owner', owner)
+    owner_changed = true
+end
+
+local status_changed = update_waiting_status(key, remaining, ARGV[2], ARGV[3], ARGV[4])
+
+bump_version(key)
+
+local reply = {'ok', owner_changed and '1' or '0', status_changed and '1' or '0'}
+for _, value in ipairs(redis.call('HGETALL', key)) do
+    table.insert(reply, value)
+end
+return reply
+"""
+
+# KEYS[1]: room key
+# ARGV: player name, ready ("1" or "0"), waiting room state, waiting players status, waiting owner status, room ttl, finished room state, finished room ttl, versions channel
+# Extra values: "1" if all the players are ready, "1" if the game status changed
+SET_PLAYER_READY_SCRIPT = LUA_HELPERS + """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return error_reply('404', 'Room does not exist')
+end
+
+local players = cjson.decode(redis.call('HGET', key, 'players'))
+local found = false
+local all_ready = true
+
+for _, player in ipairs(players) do
+    if player.name == ARGV[1] then
+        player.ready = ARGV[2] == '1'
+        found = true
+    end
+    if not player.ready then
+        all_ready = false
+    end
+end
+
+if not found then
+    return error_reply('404', 'Player ' .. ARGV[1] .. ' is not in the room')
+end
+
+redis.call('HSET', key, 'players', encode_list(players))
+local status_changed = update_waiting_status(key, players, ARGV[3], ARGV[4], ARGV[5])
+
+bump_version(key)
+
+local reply = {'ok', all_ready and '1' or '0', status_changed and '1' or '0'}
+for _, value in ipairs(redis.call('HGETALL', key)) do
+    table.insert(reply, value)
+end
+return reply
+"""
+
+# KEYS[1]: room key
+# ARGV: player id, connection id, connected ("1" or "0"), room ttl, finished room state, finished room ttl, versions channel
+# Extra values: the connection of the player before, "" if none, and "1" if its connected state changed.
+# The current connection of each player is kept in a "connection:<player id>" field: only the socket that connected last
+# can mark its player disconnected, so that a reconnection is never undone by the old socket going away
+SET_PLAYER_CONNECTED_SCRIPT = LUA_HELPERS + """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return error_reply('404', 'Room does not exist')
+end
+
+local connection_field = 'connection:' .. ARGV[1]
+local previous = redis.call('HGET', key, connection_field) or ''
+local connected = ARGV[3] == '1'
+
+local players = cjson.decode(redis.call('HGET', key, 'players'))
+local player = nil
+for _, other in ipairs(players) do
+    if other.id == ARGV[1] then
+        player = other
+    end
+end
+
+if not player then
+    return error_reply('404', 'Player ' .. ARGV[1] .. ' is not in the room')
+end
+
+local changed = false
+if connected then
+    redis.call('HSET', key, connection_field, ARGV[2])
+    changed = player.connected ~= true
+elseif previous == ARGV[2] then
+    redis.call('HDEL', key, connection_field)
+    changed = player.connected ~= false
+end
+
+if changed then
+    player.connected = connected
+    redis.call('HSET', key, 'players', encode_list(players))
+    bump_version(key)
+end
+
+local reply = {'ok', previous, changed and '1' or '0'}
+for _, value in ipairs(redis.call('HGETALL', key)) do
+    table.insert(reply, value)
+end
+return reply
+"""
+
+# KEYS[1]: room key
+# ARGV: field, value, field, value, ..., room ttl, finished room state, finished room ttl, versions channel
+# Returns the new version, or 0 if the room does not exist
+WRITE_ROOM_FIELDS_SCRIPT = LUA_HELPERS + """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return 0
+end
+
+for i = 1, #ARGV - 4, 2 do
+    redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+end
+
+return bump_version(key)
+"""
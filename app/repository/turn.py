@@ -0,0 +1,52 @@
+import os
+from dotenv import load_dotenv
+from typing import List, Optional
+from pydantic import TypeAdapter
+from ..logger import logger
+from ..schemas.game import Song
+from ..settings import ROOM_TTL
+import redis.asyncio as aioredis
+
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+redis = None
+
+async def init_redis():
+    global redis
+    redis = aioredis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+
+
+# The songs offered to the singer and the song picked are secret: they are kept out of the room, which every player reads,
+# in a hash per turn only read by the singer path and the guess matcher
+songs_adapter = TypeAdapter(List[Song])
+
+def get_turn_key(room_id: str, round_number: int, turn_number: int) -> str:
+    return f"{room_id}:turn:{round_number}:{turn_number}"
+
+async def set_song_choices(room_id: str, round_number: int, turn_number: int, songs: List[Song]):
+    """Store the songs offered to the singer, forgetting the song picked in a previous game."""
+    key = get_turn_key(room_id, round_number, turn_number)
+    logger.debug(f"Storing song choices of round {round_number} - turn {turn_number} in room {room_id}")
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, "song_choices", songs_adapter.dump_json(songs).decode())
+        pipe.hdel(key, "song")
+        pipe.expire(key, ROOM_TTL)
+        await pipe.execute()
+
+async def get_song_choices(room_id: str, round_number: int, turn_number: int) -> List[Song]:
+    value = await redis.hget(get_turn_key(room_id, round_number, turn_number), "song_choices")
+    return songs_adapter.validate_json(value) if value else []
+
+async def set_turn_song(room_id: str, round_number: int, turn_number: int, song: Song):
+    key = get_turn_key(room_id, round_number, turn_number)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(key, "song", song.model_dump_json(exclude={"lyrics"}))
+        pipe.expire(key, ROOM_TTL)
+        await pipe.execute()
+
+async def get_turn_song(room_id: str, round_number: int, turn_number: int) -> Optional[Song]:
+    """Song picked for the turn, None until the singer picks it."""
+    value = await redis.hget(get_turn_key(room_id, round_number, turn_number), "song")
+    return Song.model_validate_json(value) if value else None
@@ -5,6 +5,7 @@ from typing import Optional, List
 class Message(BaseModel):
     content: str
     sender_id: str
+    id: Optional[str] = None # Sequence ID assigned by the server
     timestamp: Optional[str] = None
 
 class NewMessageRequest(BaseModel):
@@ -14,3 +15,4 @@ class NewMessageRequest(BaseModel):
 class Chat(BaseModel):
     room_id: str
     messages: List[Message]
+    next_cursor: Optional[str] = None # Pass as `after` to only get the newer messages
@@ -1,6 +1,6 @@
 from fastapi import WebSocket
 from pydantic import BaseModel
-from typing import Union, Any, Literal
+from typing import Union, Any, Literal, Optional, Dict
 
 class SuccessMessage(BaseModel):
     success: str
@@ -11,11 +11,21 @@ class BroadcastMessage(BaseModel):
 
 class BroadcastMessageRequest(BaseModel):
     room_id: str
-    type: Literal["waiting_for_players","all_players_ready","new_message","player_ready","room_state","game_start","turn_ended_prematurely","no_song_chosen","round_change","turn_change","phase_change","pick_song","timer","singer_song_data"]
+    type: Literal["waiting_for_players","all_players_ready","new_message","player_ready","room_state","room_patch","game_start","turn_ended_prematurely","no_song_chosen","round_change","turn_change","phase_change","pick_song","timer","phase_deadline","timer_sync","singer_song_data","player_presence"]
 
 class Text(BaseModel):
     content: Union[str,int]
 
-class PlayerWebsocket(BaseModel):
-    websocket: Any
-    player_id: str
\ No newline at end of file
+class WebsocketCommand(BaseModel):
+    id: Optional[str] = None # Request id, echoed back in the ack
+    command: Literal["chat", "ready", "pick_song", "resync"]
+    payload: Dict[str, Any] = {}
+
+class CommandAck(BaseModel):
+    id: Optional[str] = None
+    ok: bool
+    status: int = 200
+    error: Optional[str] = None
+
+class Ping(BaseModel):
+    server_time: float # Clients answer with a pong frame, and can use it to correct their clock
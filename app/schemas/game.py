@@ -13,9 +13,7 @@ class Phase(BaseModel):
 
 class Turn(BaseModel):
     player_id: str
-    song: Optional[Song] = None #TODO: hide or store somewhere else
-    song_choices: Optional[List[Song]] = [] #TODO: hide or store somewhere else
-    guessers: Optional[List[str]] = []
+    guessers: Optional[List[str]] = [] # The song choices and the song picked are secret, see repository/turn.py
 
 class Round(BaseModel):
     turns: List[Turn] = []
@@ -27,6 +25,7 @@ class GameStatus(BaseModel):
 class GameConfig(BaseModel):
     num_rounds: int
     turn_duration: int # in seconds
+    timer_mode: Literal["tick", "deadline"] = "tick"
 
 class Game(BaseModel):
     status: GameStatus
@@ -37,6 +36,7 @@ class Game(BaseModel):
 
 class StartGameRequest(BaseModel):
     room_id: str
+    timer_mode: Optional[Literal["tick", "deadline"]] = None
 
 class PickSongRequest(BaseModel):
     room_id: str
@@ -55,6 +55,17 @@ class TimerMessage(BaseModel):
     remaining_time: int
     current_phase: Literal["picking_song", "guessing_song", "scoreboard"]
 
+class PhaseDeadlineMessage(BaseModel):
+    """Sent at the start of a phase and then sparsely to resync the countdown clients render locally"""
+    round: int
+    turn: int
+    current_phase: Literal["picking_song", "guessing_song", "scoreboard"]
+    duration: int # Length of the phase, in seconds
+    deadline: float # Server timestamp of the end of the phase
+    server_time: float # Server timestamp when the frame was sent
+    remaining_time: float
+    cancelled: bool = False
+
 class RoundAndTurnMessage(BaseModel):
     round: int
     turn: int
\ No newline at end of file
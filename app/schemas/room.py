@@ -31,6 +31,7 @@ class Room(BaseModel):
     players: List[PlayerSafe] = Field(default=[])
     game: Optional[Game] = None
     room_state: Literal["waiting", "playing", "finished"]
+    version: int = 0 # Bumped by every write, see the room_patch events
 
     def are_all_players_ready(self):
         if all(player.ready for player in self.players): return True
@@ -53,6 +54,10 @@ class JoinRoomRequest(BaseModel):
     player_name: str
     room_id: str
 
+class LeaveRoomRequest(BaseModel):
+    player_id: str
+    room_id: str
+
 class PlayerReadyRequest(BaseModel):
     player_name: str
     room_id: str
@@ -60,4 +65,8 @@ class PlayerReadyRequest(BaseModel):
 
 class PlayerReady(BaseModel):
     player_name: str
-    ready: bool
\ No newline at end of file
+    ready: bool
+
+class PlayerPresence(BaseModel):
+    player_id: str
+    connected: bool
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import json
+import asyncio
+from dotenv import load_dotenv
+import redis.asyncio as aioredis
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from ..logger import logger
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Handler called for every event received from Redis: (room_id, message, player_id, droppable)
+EventHandler = Callable[[str, str, Optional[str], bool], Awaitable[bool]]
+
+# Handler called for the control messages about a room sent to every worker, e.g. to end the phase of a game loop run elsewhere:
+# (room_id, **fields) with the fields given when publishing
+ControlHandler = Callable[..., Awaitable[None]]
+
+# Channel every worker subscribes to
+WORKERS_CHANNEL = "workers:events"
+
+
+def get_room_channel(room_id: str) -> str:
+    return f"{room_id}:events"
+
+
+def get_room_id_from_channel(channel: str) -> str:
+    return channel.rsplit(":", 1)[0]
+
+
+class BroadcastBus:
+    """Redis pub/sub bus used to fan out room events to every worker.
+
+    Each worker subscribes to the channels of the rooms it holds websockets for.
+    An event is published once, and every subscribed worker delivers it to its local sockets."""
+
+    def __init__(self, redis_url: str = None):
+        self.redis_url = redis_url or REDIS_URL
+        self.redis = None
+        self.pubsub = None
+        self.handler: EventHandler = None
+        self.listener_task: asyncio.Task = None
+        self.rooms: Set[str] = set()
+        self.control_handlers: Dict[str, ControlHandler] = {}
+
+    @property
+    def connected(self) -> bool:
+        return self.redis is not None
+
+    async def start(self, handler: EventHandler):
+        self.handler = handler
+        self.redis = aioredis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+
+        # Subscribe to a worker-wide channel so the pub/sub connection exists before any room is joined
+        await self.pubsub.subscribe(WORKERS_CHANNEL)
+        self.listener_task = asyncio.create_task(self.listen())
+        logger.info("Broadcast bus started")
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+        if self.pubsub:
+            await self.pubsub.aclose()
+        if self.redis:
+            await self.redis.aclose()
+        self.redis = None
+        self.pubsub = None
+        self.listener_task = None
+        self.rooms.clear()
+        logger.info("Broadcast bus stopped")
+
+    async def subscribe_room(self, room_id: str):
+        if not self.connected or room_id in self.rooms:
+            return
+        self.rooms.add(room_id)
+        await self.pubsub.subscribe(get_room_channel(room_id))
+        logger.debug(f"Broadcast bus subscribed to room {room_id}")
+
+    async def unsubscribe_room(self, room_id: str):
+        if not self.connected or room_id not in self.rooms:
+            return
+        self.rooms.discard(room_id)
+        await self.pubsub.unsubscribe(get_room_channel(room_id))
+        logger.debug(f"Broadcast bus unsubscribed from room {room_id}")
+
+    async def publish(self, room_id: str, message: str, player_id: str = None, droppable: bool = False) -> int:
+        """Publish an already formatted message to every worker holding sockets for the room. Returns the number of workers reached."""
+        # The message is already JSON: append it to the header instead of escaping it a second time
+        header = json.dumps({"player_id": player_id, "droppable": droppable})
+        payload = f"{header}\n{message}"
+        return await self.redis.publish(get_room_channel(room_id), payload)
+
+    def on_control(self, control: str, handler: ControlHandler):
+        self.control_handlers[control] = handler
+
+    async def publish_control(self, control: str, room_id: str, **fields) -> int:
+        """Send a control message about a room to every worker. Returns the number of workers reached."""
+        return await self.redis.publish(WORKERS_CHANNEL, json.dumps({"control": control, "room_id": room_id, "fields": fields}))
+
+    async def handle_control(self, data: str):
+        control = json.loads(data)
+        handler = self.control_handlers.get(control.get("control"))
+        if handler:
+            await handler(control["room_id"], **control.get("fields", {}))
+
+    async def listen(self):
+        while True:
+            try:
+                event = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if event is None or event["type"] != "message":
+                    continue
+
+                if event["channel"] == WORKERS_CHANNEL:
+                    await self.handle_control(event["data"])
+                    continue
+
+                room_id = get_room_id_from_channel(event["channel"])
+                header, message = event["data"].split("\n", 1)
+                header = json.loads(header)
+                await self.handler(room_id, message, header.get("player_id"), header.get("droppable", False))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while listening on the broadcast bus: {e}")
+                await asyncio.sleep(1)
+
+
+# Bus shared by the whole worker
+bus = BroadcastBus()
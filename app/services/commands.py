@@ -0,0 +1,114 @@
+from fastapi import HTTPException
+from pydantic import ValidationError
+from ..repository.room import get_room_fields
+from ..schemas.chat import Message, NewMessageRequest
+from ..schemas.common import CommandAck, WebsocketCommand
+from .connections import PlayerWebsocket
+from ..schemas.room import PlayerReadyRequest
+from .chat import handle_send_message
+from .game import handle_pick_song
+from .room import handle_player_ready
+from .websocket import enqueue_message, send_room_state
+from .envelope import encode_event
+from ..logger import logger
+from ..settings import GAME_PHASE_PICKING_SONG, MESSAGE_TYPE_ACK
+import json
+import time
+
+# Counters of the commands received on the sockets of this worker
+command_stats = {"commands": 0, "failed_commands": 0, "total_time": 0.0, "max_time": 0.0}
+
+
+async def handle_chat_command(player_websocket: PlayerWebsocket, payload: dict):
+    message = Message(content=payload.get("content", ""), sender_id=player_websocket.player_id)
+    await handle_send_message(NewMessageRequest(room_id=player_websocket.room_id, message=message))
+
+async def handle_ready_command(player_websocket: PlayerWebsocket, payload: dict):
+    player = await get_player(player_websocket)
+    await handle_player_ready(PlayerReadyRequest(room_id=player_websocket.room_id, player_name=player.name, ready=payload.get("ready", True)))
+
+async def handle_pick_song_command(player_websocket: PlayerWebsocket, payload: dict):
+    room = await get_room_fields(player_websocket.room_id, "game_status", "current_round", "current_turn", "rounds")
+    try:
+        singer_id = room["rounds"][room["current_round"]][room["current_turn"]].player_id
+    except IndexError:
+        singer_id = None
+
+    if singer_id != player_websocket.player_id:
+        error_message = f"Player {player_websocket.player_id} is not the singer of the current turn in room {player_websocket.room_id}"
+        logger.error(error_message)
+        raise HTTPException(status_code=403, detail=error_message)
+
+    # Picking again while the others guess would change the answer and cut the phase short
+    if room["game_status"].type != GAME_PHASE_PICKING_SONG:
+        error_message = f"Room {player_websocket.room_id} is not in the {GAME_PHASE_PICKING_SONG} phase"
+        logger.error(error_message)
+        raise HTTPException(status_code=409, detail=error_message)
+
+    await handle_pick_song(player_websocket.room_id, payload.get("song_id"))
+
+async def handle_resync_command(player_websocket: PlayerWebsocket, payload: dict):
+    await send_room_state(player_websocket)
+
+COMMAND_HANDLERS = {
+    "chat": handle_chat_command,
+    "ready": handle_ready_command,
+    "pick_song": handle_pick_song_command,
+    "resync": handle_resync_command,
+}
+
+
+async def get_player(player_websocket: PlayerWebsocket):
+    room = await get_room_fields(player_websocket.room_id, "players")
+    player = next((player for player in room["players"] if player.id == player_websocket.player_id), None)
+    if player is None:
+        error_message = f"Player {player_websocket.player_id} is not in room {player_websocket.room_id}"
+        logger.error(error_message)
+        raise HTTPException(status_code=403, detail=error_message)
+    return player
+
+def send_ack(player_websocket: PlayerWebsocket, ack: CommandAck):
+    enqueue_message(player_websocket, encode_event(MESSAGE_TYPE_ACK, ack))
+
+async def handle_command(player_websocket: PlayerWebsocket, data: str) -> bool:
+    """Run a {"id", "command", "payload"} frame sent by a client and acknowledge it to that client only.
+
+    The sender is the player of the socket, never a field of the payload. Returns False if the frame is not a command."""
+
+    try:
+        frame = json.loads(data)
+    except ValueError:
+        return False
+    if not isinstance(frame, dict) or "command" not in frame:
+        return False
+
+    start = time.perf_counter()
+    command_stats["commands"] += 1
+    request_id = frame.get("id") if isinstance(frame.get("id"), str) else None
+
+    try:
+        command = WebsocketCommand.model_validate(frame)
+        await COMMAND_HANDLERS[command.command](player_websocket, command.payload)
+        send_ack(player_websocket, CommandAck(id=command.id, ok=True))
+
+    except ValidationError as e:
+        command_stats["failed_commands"] += 1
+        send_ack(player_websocket, CommandAck(id=request_id, ok=False, status=422, error=str(e.errors()[0]["msg"])))
+    except HTTPException as e:
+        command_stats["failed_commands"] += 1
+        send_ack(player_websocket, CommandAck(id=request_id, ok=False, status=e.status_code, error=str(e.detail)))
+    except Exception as e:
+        command_stats["failed_commands"] += 1
+        logger.error(f"Error handling command {frame.get('command')} of player {player_websocket.player_id} in room {player_websocket.room_id}: {e}")
+        send_ack(player_websocket, CommandAck(id=request_id, ok=False, status=500, error="Internal error"))
+
+    elapsed = time.perf_counter() - start
+    command_stats["total_time"] += elapsed
+    command_stats["max_time"] = max(command_stats["max_time"], elapsed)
+    return True
+
+def get_command_stats() -> dict:
+    return {
+        **command_stats,
+        "average_time": command_stats["total_time"] / command_stats["commands"] if command_stats["commands"] else 0.0,
+    }
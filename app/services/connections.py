@@ -0,0 +1,102 @@
+import time
+import uuid
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Sockets of a room without any
+EMPTY_ROOM = MappingProxyType({})
+EMPTY_SOCKETS = ()
+
+
+class PlayerWebsocket:
+    """A socket of a player in a room, with its outbound queue. Slotted: it is read on every frame sent or received."""
+
+    __slots__ = ("websocket", "player_id", "room_id", "queue", "writer", "dropped", "evicted", "batch", "binary", "connection_id", "last_seen")
+
+    def __init__(self, websocket: Any, player_id: str, room_id: str = None, batch: bool = False, binary: bool = False):
+        self.websocket = websocket
+        self.player_id = player_id
+        self.room_id = room_id
+        self.queue = None # Bounded outbound queue
+        self.writer = None # Task sending the queued messages
+        self.dropped = 0
+        self.evicted = False
+        self.batch = batch # Send the queued messages as array frames
+        self.binary = binary # Send MessagePack frames instead of JSON text
+        self.connection_id = uuid.uuid4().hex # Tells this socket from the other ones of the player
+        self.last_seen = time.monotonic() # Time of the last frame received
+
+
+class ConnectionRegistry:
+    """Sockets of this worker, indexed by room and by (room, player).
+
+    Each room maps its players to their socket, so that the socket of a player is found, added or removed in O(1). The
+    fan-out iterates a tuple of the room's sockets in the order they connected, rebuilt only when a socket is added or
+    removed: broadcasts far outnumber connections. A player has at most one socket per worker, adding one replaces the
+    previous one. A room left without sockets stays known until the sweeper drops it."""
+
+    __slots__ = ("rooms", "sockets", "size")
+
+    def __init__(self):
+        self.rooms: Dict[str, Dict[str, PlayerWebsocket]] = {}
+        self.sockets: Dict[str, Tuple[PlayerWebsocket, ...]] = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self.rooms
+
+    def __iter__(self) -> Iterator[PlayerWebsocket]:
+        for sockets in self.sockets.values():
+            yield from sockets
+
+    def room(self, room_id: str) -> Tuple[PlayerWebsocket, ...]:
+        """Sockets of a room, a snapshot that later adds and removes do not change."""
+        return self.sockets.get(room_id, EMPTY_SOCKETS)
+
+    def get(self, room_id: str, player_id: str) -> Optional[PlayerWebsocket]:
+        return self.rooms.get(room_id, EMPTY_ROOM).get(player_id)
+
+    def count(self, room_id: str) -> int:
+        return len(self.rooms.get(room_id, EMPTY_ROOM))
+
+    def room_ids(self) -> List[str]:
+        return list(self.rooms)
+
+    def add(self, player_websocket: PlayerWebsocket) -> Optional[PlayerWebsocket]:
+        """Add a socket in place of the previous one of its player, in one step. Returns the socket replaced."""
+        room = self.rooms.setdefault(player_websocket.room_id, {})
+        replaced = room.pop(player_websocket.player_id, None)
+        room[player_websocket.player_id] = player_websocket
+        self.sockets[player_websocket.room_id] = tuple(room.values())
+        if replaced is None:
+            self.size += 1
+        return replaced
+
+    def remove(self, player_websocket: PlayerWebsocket) -> bool:
+        """Remove a socket, unless another one replaced it. Returns whether it was removed."""
+        room = self.rooms.get(player_websocket.room_id)
+        if room is None or room.get(player_websocket.player_id) is not player_websocket:
+            return False
+        del room[player_websocket.player_id]
+        self.sockets[player_websocket.room_id] = tuple(room.values())
+        self.size -= 1
+        return True
+
+    def drop_room(self, room_id: str) -> bool:
+        """Forget a room left without sockets. Returns whether it was dropped."""
+        if room_id not in self.rooms or self.rooms[room_id]:
+            return False
+        del self.rooms[room_id]
+        del self.sockets[room_id]
+        return True
+
+    def get_counts(self) -> Dict[str, int]:
+        """Number of sockets of each room with at least one."""
+        return {room_id: len(room) for room_id, room in self.rooms.items() if room}
+
+
+# Sockets of the whole worker
+connections = ConnectionRegistry()
@@ -0,0 +1,115 @@
+from pydantic import BaseModel
+from collections import OrderedDict
+from typing import List, Union
+import json
+import msgpack
+
+from ..settings import ENVELOPE_CACHE_SIZE, MESSAGE_TYPE_CODES
+
+# Recently encoded envelopes, e.g. the identical timer frames sent within a room
+envelope_cache: "OrderedDict[tuple, str]" = OrderedDict()
+envelope_cache_stats = {"hits": 0, "misses": 0}
+
+# MessagePack frames of recent messages, by message. The same str is queued for every recipient so its hash is computed once
+msgpack_cache: "OrderedDict[str, bytes]" = OrderedDict()
+msgpack_cache_stats = {"hits": 0, "misses": 0}
+
+CACHEABLE_TYPES = (str, int, float, bool, type(None))
+
+
+class RawText(str):
+    """Queued text which is not a JSON event, like the echoed messages. Marked when queued, as the text may look like JSON."""
+
+
+def encode_content(model: Union[BaseModel, List[BaseModel], str]) -> str:
+    """Serialize the content of an event to JSON. Strings are expected to already be JSON."""
+
+    if isinstance(model, list):
+        return "[" + ",".join(m.model_dump_json() for m in model) + "]"
+
+    if isinstance(model, str):
+        return model or "null"
+
+    return model.model_dump_json()
+
+
+def get_cache_key(message_type: str, model) -> tuple:
+    """Key identifying a small flat model by its values, None if the model can not be cached."""
+
+    if not isinstance(model, BaseModel):
+        return None
+
+    values = tuple(model.__dict__.values())
+    if not all(isinstance(value, CACHEABLE_TYPES) for value in values):
+        return None
+
+    return (message_type, type(model), values)
+
+
+def encode_event(message_type: str, model: Union[BaseModel, List[BaseModel], str]) -> str:
+    """Build the {"type", "content"} envelope of an event, serializing the content exactly once."""
+
+    key = get_cache_key(message_type, model)
+    if key is not None:
+        message = envelope_cache.get(key)
+        if message is not None:
+            envelope_cache.move_to_end(key)
+            envelope_cache_stats["hits"] += 1
+            return message
+
+    message = '{"type":' + json.dumps(message_type) + ',"content":' + encode_content(model) + '}'
+
+    if key is not None:
+        envelope_cache_stats["misses"] += 1
+        envelope_cache[key] = message
+        if len(envelope_cache) > ENVELOPE_CACHE_SIZE:
+            envelope_cache.popitem(last=False)
+
+    return message
+
+
+def encode_msgpack(message: str) -> bytes:
+    """MessagePack frame of a message, built the first time a binary client receives it: [type code, content] for
+    an event, the text itself for anything else."""
+
+    if isinstance(message, RawText):
+        return msgpack.packb(str(message))
+
+    frame = msgpack_cache.get(message)
+    if frame is not None:
+        msgpack_cache.move_to_end(message)
+        msgpack_cache_stats["hits"] += 1
+        return frame
+
+    try:
+        event = json.loads(message)
+        frame = msgpack.packb([MESSAGE_TYPE_CODES.get(event["type"], event["type"]), event["content"]])
+    except (ValueError, TypeError, KeyError):
+        frame = msgpack.packb(message)
+
+    msgpack_cache_stats["misses"] += 1
+    msgpack_cache[message] = frame
+    if len(msgpack_cache) > ENVELOPE_CACHE_SIZE:
+        msgpack_cache.popitem(last=False)
+    return frame
+
+
+def encode_batch(messages: List[str], binary: bool = False) -> Union[str, bytes]:
+    """One array frame holding the messages in order."""
+
+    if binary:
+        return msgpack.Packer().pack_array_header(len(messages)) + b"".join(encode_msgpack(message) for message in messages)
+
+    # Text which is not a JSON event is sent as a JSON string
+    return "[" + ",".join(json.dumps(message) if isinstance(message, RawText) else message for message in messages) + "]"
+
+
+def get_envelope_stats() -> dict:
+    lookups = envelope_cache_stats["hits"] + envelope_cache_stats["misses"]
+    return {
+        **envelope_cache_stats,
+        "size": len(envelope_cache),
+        "hit_rate": envelope_cache_stats["hits"] / lookups if lookups else 0.0,
+        "msgpack_hits": msgpack_cache_stats["hits"],
+        "msgpack_misses": msgpack_cache_stats["misses"],
+    }
@@ -1,65 +1,162 @@
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
 
-from app.services.song import retrieve_lyrics
-from ..repository.room import create_room, get_room
+from app.services.song import retrieve_lyrics, prefetch_lyrics
+from ..repository.room import create_room, get_room, get_room_fields, RoomSession, track_room_io
 from ..repository.chat import get_chat, add_message
 from ..repository.game import *
-
-from .websocket import active_rooms_websockets,  broadcast_event
+from ..repository.deck import reset_deck
+from ..repository.turn import set_song_choices, get_song_choices, set_turn_song, get_turn_song
+from ..repository.game_loop import acquire_lease, release_lease, set_phase_checkpoint, get_phase_checkpoint, expire_room_keys
+
+from .connections import connections
+from .websocket import broadcast_event
+from .scheduler import scheduler, PhaseCancellation
+from .broadcast_bus import bus
+from .game_runner import game_runner
+from .guess import GuessMatcher
 from ..schemas.room import Room
 from ..schemas.chat import Message, NewMessageRequest
 from ..schemas.common import BroadcastMessageRequest, SuccessMessage, Text
-from ..schemas.game import GameTasks, Turn
+from ..schemas.game import Turn
 
 from ..logger import logger
-from ..settings import MESSAGE_TYPE_GAME_START, MESSAGE_TYPE_PHASE_ENDED_PREMATURELY
+from ..settings import MESSAGE_TYPE_GAME_START, MESSAGE_TYPE_PHASE_ENDED_PREMATURELY, ROOM_FINISHED_TTL
 import asyncio
+import math
+import time
 import copy
 import random
 
-all_game_tasks = {}
+# Bus control message ending the current phase of a game loop, sent when the loop runs on another worker
+CONTROL_END_PHASE = "end_phase"
+
 turn_cancellations = {}
+turn_matchers = {} # Singer and guess matcher of the current turn of each room: (round, turn, singer id, matcher)
 
-async def handle_start_game(room_id: str):
+async def handle_start_game(room_id: str, timer_mode: str = None):
     logger.info(f"Received request to start game for room {room_id}")
 
-    # Conditions
-    room = await get_room(room_id)
+    # The lease of the room's game loop is only free when no game runs: starting a running game again costs a single call
+    if not await acquire_lease(room_id):
+        logger.info(f"Game already running in room {room_id}")
+        return SuccessMessage(success=f"Game already started in room {room_id}")
 
-    logger.debug(f"Retrieved room: {room}, type: {type(room)}, is None: {room is None}")
-    # If room does not exist
-    if room is None:
-        error_message = f"Error starting the game: room {room_id} does not exist"
-        logger.error(error_message)
-        raise HTTPException(status_code=404, detail=error_message)
-    
-    # If all players are ready
-    if not(room.are_all_players_ready()):
-        error_message = f"Not all players are ready in room {room_id}"
-        logger.error(error_message)
-        raise HTTPException(status_code=400, detail=error_message)
+    try:
+        await setup_game(room_id, timer_mode)
+    except Exception:
+        await release_lease(room_id)
+        raise
 
-    # Initialize the room and the game state
-    await setup_new_game(room_id)
+    # Every song is back in the deck for the new game
+    await reset_deck(room_id)
 
-    # Run the game loop
-    task: asyncio.Task = asyncio.create_task(start_game(room_id))
-    game_tasks = GameTasks(main=task, round=None)
-    all_game_tasks[room_id] = game_tasks
+    # Run the game loop, on this worker as long as it renews the lease
+    game_runner.run_game(room_id)
 
     return SuccessMessage(success=f"Game started in room {room_id}")
 
+async def setup_game(room_id: str, timer_mode: str = None):
+    """Check that the game can start, then set it up."""
+
+    # Conditions are checked and the game is set up on a single load of the room, stored in one write
+    async with RoomSession(room_id) as room:
+
+        logger.debug(f"Retrieved room: {room}, type: {type(room)}, is None: {room is None}")
+        # If room does not exist
+        if room is None:
+            error_message = f"Error starting the game: room {room_id} does not exist"
+            logger.error(error_message)
+            raise HTTPException(status_code=404, detail=error_message)
+        
+        # If all players are ready
+        if not(room.are_all_players_ready()):
+            error_message = f"Not all players are ready in room {room_id}"
+            logger.error(error_message)
+            raise HTTPException(status_code=400, detail=error_message)
+
+        # Initialize the room and the game state
+        setup_new_game(room, timer_mode)
+
 async def handle_cancellation_event_registration(room_id):
     # Register or reset the cancellation event for this room
 
     if room_id not in turn_cancellations:
-        turn_cancellations[room_id] = asyncio.Event()
+        turn_cancellations[room_id] = PhaseCancellation()
     else:
         turn_cancellations[room_id].clear()
 
-async def start_phase_pick_song(room_id: str, round_number: int, turn_number: int):
+async def run_phase_countdown(room_id: str, round_number: int, turn_number: int, phase: str, duration: int, timer_mode: str = TIMER_MODE_TICK) -> bool:
+    """Count a phase down with the room's timer protocol. Returns True if the phase was cancelled before its end."""
+
+    if timer_mode == TIMER_MODE_DEADLINE:
+        return await run_deadline_countdown(room_id, round_number, turn_number, phase, duration)
+
+    # Each second is an absolute deadline on the worker's timing wheel so that the countdown does not drift
+    phase_start = scheduler.time()
+    for elapsed, timer in enumerate(range(duration, -1, -1)):
+
+        # Broadcast the timer event
+        try:
+            await broadcast_event(
+                BroadcastMessageRequest(room_id=room_id, type=MESSAGE_TYPE_TIMER),
+                TimerMessage(round=round_number, turn=turn_number, remaining_time=timer, current_phase=phase),
+                debug=False
+            )
+        except Exception as e:
+            logger.error(f"Error broadcasting timer for room {room_id}: {str(e)}")
+
+        # Wait until the next second, but exit early if cancellation is triggered
+        try:
+            if await turn_cancellations[room_id].wait_until(phase_start + elapsed + 1):
+                return True
+        except Exception as e:
+            logger.error(f"Error in start_turn for room {room_id}: {str(e)}")
+
+    return False
+
+async def run_deadline_countdown(room_id: str, round_number: int, turn_number: int, phase: str, duration: int) -> bool:
+    """Send the phase deadline once, then only sparse sync frames: clients render the countdown locally."""
+
+    phase_start = scheduler.time()
+    deadline = time.time() + duration
+
+    async def broadcast_deadline(message_type: str, cancelled: bool = False):
+        now = time.time()
+        try:
+            await broadcast_event(
+                BroadcastMessageRequest(room_id=room_id, type=message_type),
+                PhaseDeadlineMessage(round=round_number, turn=turn_number, current_phase=phase, duration=duration, deadline=deadline, server_time=now, remaining_time=max(deadline - now, 0), cancelled=cancelled),
+                debug=False
+            )
+        except Exception as e:
+            logger.error(f"Error broadcasting deadline for room {room_id}: {str(e)}")
+
+    await broadcast_deadline(MESSAGE_TYPE_PHASE_DEADLINE)
+
+    # Wake up only for the sync frames and the end of the phase
+    sync_offsets = list(range(TIMER_SYNC_INTERVAL, duration, TIMER_SYNC_INTERVAL)) + [duration]
+    for offset in sync_offsets:
+        if await turn_cancellations[room_id].wait_until(phase_start + offset):
+            await broadcast_deadline(MESSAGE_TYPE_TIMER_SYNC, cancelled=True)
+            return True
+
+        if offset < duration:
+            await broadcast_deadline(MESSAGE_TYPE_TIMER_SYNC)
+
+    return False
+
+async def start_phase_pick_song(room_id: str, round_number: int, turn_number: int, duration: int = None):
+    """Run the picking phase of a turn. A worker taking the game over passes the time the phase had left."""
     logger.info(f"Picking song for round {round_number} - turn {turn_number} in room {room_id}")
 
+    resume = duration is not None
+    if duration is None:
+        duration = GAME_CONFIG_PICK_SONG_DURATION
+
+    # Taking over after the singer picked: go on with the guessing phase
+    if resume and await get_turn_song(room_id, round_number, turn_number):
+        return
+
     # Broadcast phase change event
     await broadcast_event(
         BroadcastMessageRequest(room_id=room_id, type="phase_change"),
@@ -70,21 +167,24 @@ async def start_phase_pick_song(room_id: str, round_number: int, turn_number: in
     # Register or reset the cancellation event for this round
     await handle_cancellation_event_registration(room_id)
 
-    # Retrieve the room for further processing
-    room: Room = await get_room(room_id)
+    # Retrieve possible songs, the ones already offered when taking over
+    songs: List[Song] = await get_song_choices(room_id, round_number, turn_number) if resume else []
+    if not songs:
+        songs = await retrieve_songs(room_id)
+        logger.debug(f"Got songs for round {round_number}: {songs}")
 
-    # Retrieve possible songs
-    songs: List[Song] = await retrieve_songs()
-    logger.debug(f"Got songs for round {round_number}: {songs}")
+        # Store the song choices apart from the room, the other players must not see them
+        await set_song_choices(room_id, round_number, turn_number, songs)
 
-    # Update song choices in room
-    room.game.rounds[round_number][turn_number].song_choices = songs[:]
+    # Fetch the lyrics of every choice while the singer picks, so that the song data goes out as soon as they do
+    prefetch_lyrics(songs)
 
     # Update game phase in room
-    room.game.status = GameStatus(type=GAME_PHASE_PICKING_SONG, detail=None)
+    async with RoomSession(room_id) as room:
+        room.game.status = GameStatus(type=GAME_PHASE_PICKING_SONG, detail=None)
 
-    # Update room with new data
-    await update_room(room)
+    # Where another worker resumes the game if this one stops
+    await set_phase_checkpoint(room_id, round_number, turn_number, GAME_PHASE_PICKING_SONG, time.time() + duration)
     
     # Send the possible songs to the player currently playing
     turn: Turn = room.game.rounds[round_number][turn_number]
@@ -96,34 +196,16 @@ async def start_phase_pick_song(room_id: str, round_number: int, turn_number: in
     )
 
     # Countdown timer
-    for timer in range(GAME_CONFIG_PICK_SONG_DURATION, -1, -1):
-
-        # Broadcast the timer event
-        try:
-            await broadcast_event(
-                BroadcastMessageRequest(room_id=room_id, type="timer"),
-                TimerMessage(round=round_number, turn=turn_number, remaining_time=timer, current_phase=GAME_PHASE_PICKING_SONG),
-                debug=False
-            )
-        except Exception as e:
-            logger.error(f"Error broadcasting timer for room {room_id}: {str(e)}")
-
-        # Wait for 1 second, but exit early if cancellation is triggered
-        try:
-            await asyncio.wait_for(turn_cancellations[room_id].wait(), timeout=1)
-
-            # Turn was canceled, broadcast the premature turn end message
-            logger.info(f"Turn {turn_number} in room {room_id} ended prematurely.")
-            await broadcast_event(
-                BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_PHASE_ENDED_PREMATURELY),
-                Text(content="Picking song phase ended prematurely"),
-                debug=True
-            )
-            return  
-        except asyncio.TimeoutError:
-            pass  # Continue the countdown if no cancellation
-        except Exception as e:
-            logger.error(f"Error in start_turn for room {room_id}: {str(e)}")
+    cancelled = await run_phase_countdown(room_id, round_number, turn_number, GAME_PHASE_PICKING_SONG, duration, room.game.config.timer_mode)
+    if cancelled:
+        # Turn was canceled, broadcast the premature turn end message
+        logger.info(f"Turn {turn_number} in room {room_id} ended prematurely.")
+        await broadcast_event(
+            BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_PHASE_ENDED_PREMATURELY),
+            Text(content="Picking song phase ended prematurely"),
+            debug=True
+        )
+        return
 
     # If we reach here, it means the player hasn't chosen any song
     logger.info(f"No song chosen for turn {turn_number} in room {room_id}")
@@ -133,15 +215,16 @@ async def start_phase_pick_song(room_id: str, round_number: int, turn_number: in
         debug=True
     )
 
-    # Pick default song choice
-    await handle_pick_song(room_id)
+    # Pick default song choice, the room is already up to date
+    await handle_pick_song(room_id, room=room)
 
     return
 
     # Cleanup: reset event so next round isn't immediately canceled
     turn_cancellations[room_id].clear()
 
-async def start_phase_guess_song(room_id: str, round_number: int, turn_number: int):
+async def start_phase_guess_song(room_id: str, round_number: int, turn_number: int, duration: int = None):
+    """Run the guessing phase of a turn. A worker taking the game over passes the time the phase had left."""
     logger.info(f"Starting round {round_number} in room {room_id}")
 
     # Broadcast phase change event
@@ -153,101 +236,145 @@ async def start_phase_guess_song(room_id: str, round_number: int, turn_number: i
     # Register or reset the cancellation event for this round
     await handle_cancellation_event_registration(room_id)
 
-    # Retrieve the room for further processing
-    room: Room = await get_room(room_id)
-
     # Update room with new game phase
-    room.game.status = GameStatus(type=GAME_PHASE_GUESSING_SONG, detail=None)
-    await update_room(room)
+    async with RoomSession(room_id) as room:
+        room.game.status = GameStatus(type=GAME_PHASE_GUESSING_SONG, detail=None)
 
-    # Countdown timer
-    for timer in range(room.game.config.turn_duration, -1, -1):
+    if duration is None:
+        duration = room.game.config.turn_duration
+    await set_phase_checkpoint(room_id, round_number, turn_number, GAME_PHASE_GUESSING_SONG, time.time() + duration)
 
-        # Broadcast the timer event
-        try:
-            await broadcast_event(
-                BroadcastMessageRequest(room_id=room_id, type="timer"),
-                TimerMessage(round=round_number, turn=turn_number, remaining_time=timer, current_phase=GAME_PHASE_GUESSING_SONG),
-                debug=False
-            )
-        except Exception as e:
-            logger.error(f"Error broadcasting timer for room {room_id}: {str(e)}")
-
-        # Wait for 1 second, but exit early if cancellation is triggered
-        try:
-            await asyncio.wait_for(turn_cancellations[room_id].wait(), timeout=1)
-
-            # Turn was canceled, broadcast the premature turn end message
-            logger.info(f"Turn {turn_number} in room {room_id} ended prematurely.")
-            await broadcast_event(
-                BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_PHASE_ENDED_PREMATURELY),
-                Text(content="Guessing song phase ended prematurely"),
-                debug=True
-            )
-            return  
-        except asyncio.TimeoutError:
-            pass  # Continue the countdown if no cancellation
-        except Exception as e:
-            logger.error(f"Error in start_turn for room {room_id}: {str(e)}")
+    # Countdown timer
+    cancelled = await run_phase_countdown(room_id, round_number, turn_number, GAME_PHASE_GUESSING_SONG, duration, room.game.config.timer_mode)
+    if cancelled:
+        # Turn was canceled, broadcast the premature turn end message
+        logger.info(f"Turn {turn_number} in room {room_id} ended prematurely.")
+        await broadcast_event(
+            BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_PHASE_ENDED_PREMATURELY),
+            Text(content="Guessing song phase ended prematurely"),
+            debug=True
+        )
+        return
 
     # Cleanup: reset event so next round isn't immediately canceled
     turn_cancellations[room_id].clear()
 
 
-async def start_game(room_id: str):
-    logger.info(f"Starting game for room {room_id}")
+async def start_game(room_id: str, resume: bool = False):
+    """Game loop of a room, run by the worker holding its lease. When resuming, it goes on from the round, turn and
+    phase persisted by the previous owner, with the time that phase had left."""
+    logger.info(f"{'Resuming' if resume else 'Starting'} game for room {room_id}")
     
-    if not room_id in active_rooms_websockets:
+    if not bus.connected and not room_id in connections:
         # The room can only start if there is an active websocket
         error_message = f"Can not start game: no active websocket for room {room_id} found"
         logger.error(error_message)
         raise HTTPException(status_code=404, detail=error_message)
 
     # Game start
-    await broadcast_event(BroadcastMessageRequest(room_id=room_id, type=MESSAGE_TYPE_GAME_START), Text(content="Game started!"))
+    if not resume:
+        await broadcast_event(BroadcastMessageRequest(room_id=room_id, type=MESSAGE_TYPE_GAME_START), Text(content="Game started!"))
 
     # Retrieve the room for further processing
     room: Room = await get_room(room_id)
+    checkpoint = await get_phase_checkpoint(room_id) if resume else None
 
     try:
         # Game Loop over the different rounds
-        for round in room.game.rounds:
+        for round_number in range(room.game.current_round, len(room.game.rounds)):
 
-            for turn in round:
+            for turn_number in range(room.game.current_turn, len(room.game.rounds[round_number])):
+                turn = room.game.rounds[round_number][turn_number]
+
+                # Count the room reads and writes of each turn apart from the request that started the game
+                room_io = track_room_io()
+
+                # Resume the phase the previous owner was in, with the time it had left
+                phase, remaining = None, None
+                if checkpoint and (checkpoint["round"], checkpoint["turn"]) == (round_number, turn_number):
+                    phase, remaining = checkpoint["phase"], math.ceil(checkpoint["remaining"])
+                    logger.info(f"Resuming {phase} phase of round {round_number} - turn {turn_number} in room {room_id} with {remaining}s left")
+                checkpoint = None
 
                 # Pick a song
-                await start_phase_pick_song(room_id, room.game.current_round, room.game.current_turn)
+                if phase != GAME_PHASE_GUESSING_SONG:
+                    await start_phase_pick_song(room_id, round_number, turn_number, remaining)
+                    remaining = None
 
                 # Guess the song
-                await start_phase_guess_song(room_id, room.game.current_round, room.game.current_turn)
+                await start_phase_guess_song(room_id, round_number, turn_number, remaining)
 
                 # Update turn
                 await update_turn(room)
+                logger.debug(f"Room reads and writes for the turn of player {turn.player_id} in room {room_id}: {room_io}")
 
             # Update round
             await update_round(room)
             
         logger.info(f"Game loop ended for room {room_id} at round {room.game.current_round}")
 
+        # The room is reaped soon after its game
+        await end_game(room)
+        await expire_room_keys(room, ROOM_FINISHED_TTL)
+
     except Exception as e:
         logger.error(f"Error in game loop for room {room_id}: {str(e)}")
 
-#TODO: implement logic
+async def end_phase(room_id: str):
+    """End the current phase of the room's game loop, on whichever worker runs it."""
+    if game_runner.owns(room_id) or not bus.connected:
+        await handle_end_phase(room_id)
+    else:
+        await bus.publish_control(CONTROL_END_PHASE, room_id)
+
+async def handle_end_phase(room_id: str):
+    """Set the cancellation of the phase, if this worker runs the room's loop. Registered on the bus for the other workers."""
+    cancellation = turn_cancellations.get(room_id)
+    if cancellation and game_runner.owns(room_id):
+        cancellation.set()
+
+async def get_turn_matcher(room_id: str):
+    """Singer and guess matcher of the room's current turn, None before the song is picked. Built on the first guess on a worker that did not handle the pick."""
+
+    fields = await get_room_fields(room_id, "current_round", "current_turn")
+    current_round, current_turn = fields["current_round"], fields["current_turn"]
+
+    entry = turn_matchers.get(room_id)
+    if entry is not None and entry[:2] == (current_round, current_turn):
+        return entry[2:]
+
+    song = await get_turn_song(room_id, current_round, current_turn)
+    if song is None:
+        return None
+
+    rounds = (await get_room_fields(room_id, "rounds"))["rounds"]
+    entry = (current_round, current_turn, rounds[current_round][current_turn].player_id, GuessMatcher(song))
+    turn_matchers[room_id] = entry
+    return entry[2:]
+
 async def handle_guess(room_id: str, message: Message):
     logger.info(f"Received guess from {message.sender_id} in room {room_id} with content {message.content}")
 
-    if message.content == "S3CR3T":
-        logger.info(f"Secret word found in room {room_id}")
-        turn_cancellations[room_id].set()
+    entry = await get_turn_matcher(room_id)
+    if entry is None:
+        return False
+
+    # The singer knows the song: their messages are only chat
+    singer_id, matcher = entry
+    if message.sender_id != singer_id and matcher.match(message.content):
+        logger.info(f"Song guessed by {message.sender_id} in room {room_id}")
+        await end_phase(room_id)
         return True
     return(False)
 
 #TODO: implement logic
-async def handle_pick_song(room_id: str, song_id: int = None):
+async def handle_pick_song(room_id: str, song_id: int = None, room: Room = None):
+    """Store the song picked for the current turn, a random one if none matches. The game loop passes the room it already loaded."""
     logger.info(f"Handling song picked with id {song_id} in room {room_id}")
 
-    # Retrieve the room for further processing
-    room: Room = await get_room(room_id)
+    # Retrieve the room for further processing, unless given
+    if room is None:
+        room = await get_room(room_id)
 
     # If room does not exist
     if room is None:
@@ -259,7 +386,11 @@ async def handle_pick_song(room_id: str, song_id: int = None):
     current_turn = room.game.current_turn
 
     # Retrieve song choices for the current turn
-    songs = room.game.rounds[current_round][current_turn].song_choices
+    songs = await get_song_choices(room_id, current_round, current_turn)
+    if not songs:
+        error_message = f"No song to pick from in room {room_id}"
+        logger.error(error_message)
+        raise HTTPException(status_code=400, detail=error_message)
 
     if song_id:
         # Find songs with matching id in the song choices
@@ -279,17 +410,17 @@ async def handle_pick_song(room_id: str, song_id: int = None):
         rand =  random.randint(0, len(songs)-1)
         song = copy.copy(songs[rand])
 
-    room.game.rounds[current_round][current_turn].song = song
-    await update_room(room)
+    await set_turn_song(room_id, current_round, current_turn, song)
 
-    # Retrieve song lyrics
+    # Normalize the answers once, before the first guess
+    turn_matchers[room_id] = (current_round, current_turn, room.game.rounds[current_round][current_turn].player_id, GuessMatcher(song))
+
+    # Retrieve song lyrics. Without them, e.g. while the lyrics API is down, the singer still gets the song and the turn goes on
     try:
-        lyrics = await retrieve_lyrics(song.title, song.artist)
-        song.lyrics = lyrics
+        song.lyrics = await retrieve_lyrics(song.title, song.artist)
     except Exception as e:
-        error_message = f"Error retrieving lyrics of song {song.title} by {song.artist} for room {room_id}"
-        logger.error(error_message)
-        raise HTTPException(status_code=404, detail=error_message)
+        logger.warning(f"Sending song {song.title} by {song.artist} without lyrics to room {room_id}: {e}")
+        song.lyrics = None
 
     # Send song data only to the singer through websocket
     await broadcast_event(
@@ -300,6 +431,6 @@ async def handle_pick_song(room_id: str, song_id: int = None):
     )
 
     # Force picking_song phase to end
-    turn_cancellations[room_id].set()
+    await end_phase(room_id)
 
     return SuccessMessage(success=f"Song with id {song_id} picked by singer in {room_id}")
\ No newline at end of file
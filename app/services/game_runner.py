@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from ..logger import logger
+from ..repository.game_loop import WORKER_ID, acquire_lease, acquire_leases, renew_leases, get_lease_owners, release_lease, add_active_game, remove_active_game, get_active_games, pause_phase_checkpoint
+from ..repository.room import get_existing_rooms
+from .broadcast_bus import bus
+from ..settings import GAME_LEASE_RENEW_INTERVAL, GAME_WATCHER_INTERVAL
+
+# Bus control message telling the other workers that a game was handed over and can be taken over right away
+CONTROL_GAME_RELEASED = "game_released"
+
+# Game loop of a room: (room_id, resume). Resuming continues from the phase persisted by the previous owner
+GameLoop = Callable[[str, bool], Awaitable[None]]
+
+
+class GameRunner:
+    """Runs the game loops owned by this worker.
+
+    A worker owns the loop of a room while it holds the room's lease in Redis, renewed every few seconds for all its loops
+    at once. Starting a game takes the lease, so starting it again is a single failed SET. The rooms with a loop are listed
+    in the games:active set: when a worker dies its leases expire, and the watcher of another worker takes its games over
+    from the phase they were in.
+
+    Before a restart, the worker drains: it stops its loops, freezes the time left in their phases and releases their
+    leases, so that another worker, or the new process at startup, resumes them at once."""
+
+    def __init__(self):
+        self.loop: GameLoop = None
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.task: asyncio.Task = None
+        self.draining = False
+        self.stats = {"started": 0, "taken_over": 0, "finished": 0, "lost": 0, "drained": 0}
+
+    def owns(self, room_id: str) -> bool:
+        return room_id in self.tasks
+
+    async def start(self, loop: GameLoop):
+        self.loop = loop
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"Game runner started on worker {WORKER_ID}")
+
+    async def stop(self):
+        """Stop the loops without releasing their leases: other workers take the games over once they expire."""
+        tasks = [self.task, *self.tasks.values()] if self.task else list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+        self.tasks.clear()
+        logger.info("Game runner stopped")
+
+    async def drain(self):
+        """Hand the games of this worker over before it stops."""
+        self.draining = True
+        room_ids = list(self.tasks)
+        await self.stop()
+
+        for room_id in room_ids:
+            try:
+                await pause_phase_checkpoint(room_id)
+                await release_lease(room_id)
+                if bus.connected:
+                    await bus.publish_control(CONTROL_GAME_RELEASED, room_id)
+                self.stats["drained"] += 1
+            except Exception as e:
+                logger.error(f"Error while handing the game of room {room_id} over, it resumes when its lease expires: {e}")
+
+        logger.info(f"Drained {len(room_ids)} game loops")
+
+    def run_game(self, room_id: str, resume: bool = False):
+        """Run the loop of a room whose lease this worker just acquired."""
+        self.stats["taken_over" if resume else "started"] += 1
+        self.tasks[room_id] = asyncio.create_task(self.own(room_id, resume))
+
+    async def own(self, room_id: str, resume: bool):
+        try:
+            await add_active_game(room_id)
+            try:
+                await self.loop(room_id, resume)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Game loop of room {room_id} failed: {e}")
+
+            # The game is over, or can not go on: no other worker should resume it
+            await remove_active_game(room_id)
+            await release_lease(room_id)
+            self.stats["finished"] += 1
+
+        finally:
+            if self.tasks.get(room_id) is asyncio.current_task():
+                del self.tasks[room_id]
+
+    async def abandon(self, room_id: str):
+        """Stop the loop of a room that no longer exists and forget its game."""
+        task = self.tasks.pop(room_id, None)
+        if task:
+            task.cancel()
+        await remove_active_game(room_id)
+        await release_lease(room_id)
+        logger.info(f"Abandoned the game loop of room {room_id}")
+
+    async def renew(self):
+        room_ids = list(self.tasks)
+        if not room_ids:
+            return
+
+        for room_id, renewed in zip(room_ids, await renew_leases(room_ids)):
+            if renewed:
+                continue
+
+            # Another worker took the game over, e.g. after this one was stalled longer than the lease
+            logger.warning(f"Lost the lease of the game loop of room {room_id}, stopping it")
+            self.stats["lost"] += 1
+            task = self.tasks.pop(room_id, None)
+            if task:
+                task.cancel()
+
+    async def take_over(self, room_id: str):
+        """Resume the game of a room if its lease is free. Registered on the bus for the games released by a draining worker."""
+        if self.draining or self.owns(room_id) or not await acquire_lease(room_id):
+            return
+        await self.resume_games([room_id])
+
+    async def resume_games(self, room_ids: List[str]):
+        """Run the loops of the rooms whose leases this worker just took over, forgetting the games of the rooms that expired."""
+        for room_id, exists in zip(room_ids, await get_existing_rooms(room_ids)):
+            if not exists:
+                await remove_active_game(room_id)
+                await release_lease(room_id)
+                continue
+
+            logger.info(f"Taking over the game loop of room {room_id}")
+            self.run_game(room_id, resume=True)
+
+    async def watch(self):
+        """Take over the active games whose owner stopped renewing its lease.
+
+        The leases of all the active games are read in one round trip, and only the expired ones are taken, in another."""
+        if self.draining:
+            return
+
+        room_ids = [room_id for room_id in await get_active_games() if not self.owns(room_id)]
+        if not room_ids:
+            return
+        expired = [room_id for room_id, owner in zip(room_ids, await get_lease_owners(room_ids)) if owner is None]
+        if not expired:
+            return
+        acquired = [room_id for room_id, taken in zip(expired, await acquire_leases(expired)) if taken]
+        if acquired:
+            await self.resume_games(acquired)
+
+    async def run(self):
+        next_watch = time.monotonic()
+        while True:
+            try:
+                await self.renew()
+                if time.monotonic() >= next_watch:
+                    next_watch = time.monotonic() + GAME_WATCHER_INTERVAL
+                    await self.watch()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while renewing or watching the game loops: {e}")
+
+            await asyncio.sleep(GAME_LEASE_RENEW_INTERVAL)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "owned": len(self.tasks)}
+
+
+# Runner shared by the whole worker
+game_runner = GameRunner()
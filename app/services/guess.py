@@ -0,0 +1,111 @@
+import re
+import unicodedata
+from typing import List, Set
+
+from ..schemas.game import Song
+from ..settings import GUESS_ARTICLES, GUESS_MAX_TYPOS
+
+# French elided articles and pronouns: l'été, d'amour, qu'il, j'ai
+ELISION = re.compile(r"\b(?:l|d|j|m|n|s|t|c|qu)['’]")
+# Remix, live, featuring... details in parentheses or brackets, and after a dash
+DETAILS = re.compile(r"\s*(?:\([^)]*\)|\[[^\]]*\]|\s-\s.*$)")
+NOT_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+ARTICLES = frozenset(GUESS_ARTICLES)
+
+
+def normalize(text: str) -> str:
+    """Lower case words without accents, punctuation nor articles, separated by single spaces."""
+
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    text = text.replace("&", " and ")
+    text = ELISION.sub(" ", text)
+    text = text.replace("'", "").replace("’", "")
+    words = NOT_ALPHANUMERIC.sub(" ", text).split()
+    return " ".join(word for word in words if word not in ARTICLES)
+
+
+def get_max_typos(length: int) -> int:
+    """Typos tolerated in an answer of the given length: none for short answers, more for longer ones."""
+    for max_length, max_typos in GUESS_MAX_TYPOS:
+        if length <= max_length:
+            return max_typos
+    return GUESS_MAX_TYPOS[-1][1]
+
+
+def bounded_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance between a and b, or max_distance + 1 as soon as it is known to be larger.
+
+    Only the diagonal band of width 2 * max_distance + 1 of the matrix is computed, and the computation stops as soon as
+    no cell of a row can lead to a distance within max_distance: the cost so far, plus the difference between the lengths
+    left to compare, exceeds it."""
+
+    if a == b:
+        return 0
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    if len(a) > len(b):
+        a, b = b, a
+
+    too_far = max_distance + 1
+    # Lengths left to compare after cell (i, j) differ by |offset + j - i|
+    offset = len(a) - len(b)
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        start = max(1, i - max_distance)
+        end = min(len(b), i + max_distance)
+
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= max_distance else too_far
+        character = a[i - 1]
+        row_min = too_far
+
+        for j in range(start, end + 1):
+            cost = previous[j - 1] + (character != b[j - 1])
+            deletion = previous[j] + 1
+            insertion = current[j - 1] + 1
+            value = min(cost, deletion, insertion, too_far)
+            current[j] = value
+            bound = value + abs(offset + j - i)
+            if bound < row_min:
+                row_min = bound
+
+        if row_min > max_distance:
+            return too_far
+        previous = current
+
+    return min(previous[len(b)], too_far)
+
+
+class GuessMatcher:
+    """Answers of a turn, normalized once when the song is picked so that each guess only costs a few bounded comparisons.
+
+    A guess matches the title, with or without its details, alone or together with the artist."""
+
+    __slots__ = ("song_id", "answers", "max_length")
+
+    def __init__(self, song: Song):
+        self.song_id = song.id
+
+        titles = {normalize(song.title), normalize(DETAILS.sub("", song.title))}
+        artist = normalize(song.artist)
+        answers: Set[str] = set()
+        for title in titles:
+            if title:
+                answers.update((title, f"{title} {artist}", f"{artist} {title}"))
+
+        # Answer and its tolerance, longest answers first
+        self.answers: List[tuple] = sorted(((answer, get_max_typos(len(answer))) for answer in answers), key=lambda answer: -len(answer[0]))
+        self.max_length = max(len(answer) + max_typos for answer, max_typos in self.answers) if self.answers else 0
+
+    def match(self, guess: str) -> bool:
+        # Chat messages much longer than any answer are not guesses
+        if len(guess) > 4 * self.max_length:
+            return False
+
+        guess = normalize(guess)
+        for answer, max_typos in self.answers:
+            if bounded_distance(guess, answer, max_typos) <= max_typos:
+                return True
+        return False
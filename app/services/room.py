@@ -1,12 +1,12 @@
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
-from ..repository.room import create_room, get_room, get_room_safe, add_player, update_players, set_owner, update_room
-from ..schemas.room import Room, RoomSafe, JoinRoomRequest, PlayerReadyRequest, PlayerReady, Player, PlayerSafe, get_player_safe, JoinRoomResponse
+from ..repository.room import create_room, get_room, get_room_safe, join_room_atomic, leave_room_atomic, set_player_ready_atomic
+from ..schemas.room import Room, RoomSafe, JoinRoomRequest, LeaveRoomRequest, PlayerReadyRequest, PlayerReady, Player, PlayerSafe, get_player_safe, JoinRoomResponse
 from ..schemas.common import BroadcastMessage, BroadcastMessageRequest, Text
 from ..schemas.game import GameStatus
 from .websocket import broadcast_event
 from typing import Dict, List
 from ..logger import logger
-from ..settings import MAX_PLAYERS, MSG_ALL_PLAYERS_READY, MESSAGE_TYPE_ALL_PLAYERS_READY, MESSAGE_TYPE_PLAYER_READY, MESSAGE_TYPE_ROOM_STATE, GAME_STATUS_WAITING_OWNER, GAME_STATUS_WAITING_PLAYERS, MESSAGE_TYPE_WAITING_FOR_PLAYERS, ROOM_STATUS_WAITING
+from ..settings import MAX_PLAYERS, MSG_ALL_PLAYERS_READY, MESSAGE_TYPE_ALL_PLAYERS_READY, MESSAGE_TYPE_PLAYER_READY, MESSAGE_TYPE_ROOM_STATE, MESSAGE_TYPE_ROOM_PATCH, GAME_STATUS_WAITING_OWNER, GAME_STATUS_WAITING_PLAYERS, MESSAGE_TYPE_WAITING_FOR_PLAYERS, ROOM_STATUS_WAITING
 import json
 
 async def get_new_room(player_name: str):
@@ -20,42 +20,15 @@ async def join_room(request: JoinRoomRequest):
     logger.info(f"Received request to join room {request.room_id} from player {request.player_name}")
 
     try: 
-        room: Room = await get_room(request.room_id)
-        logger.debug(f"Room state before adding player {request.player_name}: {room}")
+        # Check the conditions for joining the room, add the player, set the owner and the game status in one atomic step
+        player, room = await join_room_atomic(request.player_name, request.room_id)
 
-        # Conditions for joining the room
-        if room is None:
-            error_message = f"Room {request.room_id} does not exist."
-            logger.info(error_message)
-            raise HTTPException(status_code=404, detail=error_message)
-
-        if request.player_name in [player.name for player in room.players]:
-            error_message = f"Player {request.player_name} is already in room {request.room_id}"
-            logger.info(error_message)
-            raise HTTPException (status_code=400, detail=error_message)
-        
-        if len(room.players) >= MAX_PLAYERS:
-            error_message=f"Room {request.room_id} is full. Cannot join."
-            logger.info(error_message)
-            raise HTTPException (status_code=400, detail=error_message)
-        
-        # Add player to the room and store it in the Redis database
-        player: Player = await add_player(request.player_name, request.room_id)
-
-        # If the room has no owner, set the player as the owner
-        if not room.owner:
-            await set_owner(player.id, request.room_id)
-
-        # Set the game status to WAITING_PLAYERS
+        # Broadcast the players we are waiting for
         # Only if the room is in WAITING mode
-        room = await get_room(room.room_id)
         if room.room_state == ROOM_STATUS_WAITING:
-            room = await handle_players_not_ready(room)
-            await update_room(room)
+            await broadcast_players_not_ready(room)
         
-        # Send updated room state to all connected clients
-        room_safe = await get_room_safe(request.room_id)
-        await broadcast_event(BroadcastMessageRequest(room_id=request.room_id, type=MESSAGE_TYPE_ROOM_STATE), room_safe)
+        # The connected clients already received the new player in a room patch
 
         # Retrieve the player safe and its cookie
         player_safe: PlayerSafe = get_player_safe(player)
@@ -65,54 +38,55 @@ async def join_room(request: JoinRoomRequest):
         logger.debug(f"Cookie for player {request.player_name}: {cookie} retrieved successfully")
         return JoinRoomResponse(player=player_safe, cookie=cookie)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error joining room: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred while joining the room: {e}")
 
-async def handle_player_ready(request: PlayerReadyRequest):
-    logger.info(f"Player {request.player_name} is {'ready' if request.ready else 'not ready'} in room {request.room_id}")
+async def leave_room(request: LeaveRoomRequest):
+    """Remove a player from a room. Broadcast the updated room state to all connected clients."""
+    logger.info(f"Received request to leave room {request.room_id} from player {request.player_id}")
+
     try:
-        players = (await get_room(request.room_id)).players
-        
-        # Conditions for player ready status change
-        if request.player_name not in [player.name for player in players]:
-            error_message = f"Player {request.player_name} is not in room {request.room_id}"
-            logger.info(error_message)
-            raise HTTPException(status_code=404, detail=error_message)
-        
-        # Update player ready status in the room and store it in the Redis database
-        player = next((p for p in players if p.name == request.player_name), None)
-        if player:
-            player.ready = request.ready
+        room: Room = await leave_room_atomic(request.player_id, request.room_id)
 
-        players_updated = await update_players(request.room_id, players)
+        if room.room_state == ROOM_STATUS_WAITING:
+            if room.game.status.type == GAME_STATUS_WAITING_OWNER:
+                await broadcast_event(BroadcastMessageRequest(room_id=request.room_id, type=MESSAGE_TYPE_ALL_PLAYERS_READY), "")
+            else:
+                await broadcast_players_not_ready(room)
 
-        if not players_updated:
-            error_message = f"Failed to update player {request.player_name}'s ready status in room {request.room_id}"
-            logger.info(error_message)
-            raise HTTPException(status_code=500, detail=error_message)
+        logger.info(f"Player {request.player_id} left room {request.room_id} successfully")
 
-        # Retrieve the room for further processing
-        room: Room = await get_room(request.room_id)
-        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error leaving room: {e}")
+        raise HTTPException(status_code=500, detail=f"An error occurred while leaving the room: {e}")
+
+async def handle_player_ready(request: PlayerReadyRequest):
+    logger.info(f"Player {request.player_name} is {'ready' if request.ready else 'not ready'} in room {request.room_id}")
+    try:
+        # Update player ready status and the game status in one atomic step
+        all_ready, room = await set_player_ready_atomic(request.player_name, request.ready, request.room_id)
 
         # Broadast that a player is ready
         await broadcast_event(BroadcastMessageRequest(room_id=request.room_id, type=MESSAGE_TYPE_PLAYER_READY), PlayerReady(player_name=request.player_name, ready=request.ready))
 
-        # If all players are ready, broadcast a "all players ready" event and change the game's state
+        # If all players are ready, broadcast a "all players ready" event, the game's state is already waiting for the owner
         # Only if room is in WAITING mode
         if room.room_state == ROOM_STATUS_WAITING:
-            players = (await get_room(request.room_id)).players
-            if all(player.ready for player in players):
+            if all_ready:
                 await broadcast_event(BroadcastMessageRequest(room_id=request.room_id, type=MESSAGE_TYPE_ALL_PLAYERS_READY), "")
-                room.game.status = GameStatus(type=GAME_STATUS_WAITING_OWNER)
                 logger.info(f"All players in room {request.room_id} are ready")
             
-            # If at least one player is not ready, change the game's state to waiting for players
+            # If at least one player is not ready, the game's state is waiting for players
             else:
-                room: Room = await handle_players_not_ready(room)
-            await update_room(room)
+                await broadcast_players_not_ready(room)
 
+    except HTTPException:
+        raise
     except Exception as e:
         error_message = f"Error handling player ready status in room {request.room_id}: {str(e)}"
         logger.error(error_message)
@@ -156,9 +130,11 @@ async def get_player_safe_by_cookie(room_id: str, cookie: str):
         raise HTTPException(status_code=500, detail=error_message)
     
 
-async def handle_players_not_ready(room: Room):
+async def broadcast_room_patch(room_id: str, patch: str):
+    """Send the patch of a new version of the room to its clients. A client missing a version resyncs with GET /room/{room_id}."""
+    await broadcast_event(BroadcastMessageRequest(room_id=room_id, type=MESSAGE_TYPE_ROOM_PATCH), patch)
+
+async def broadcast_players_not_ready(room: Room):
     logger.info(f"Not all players in room {room.room_id} are ready")
     waiting_for_players = [player.id for player in room.players if not player.ready]
-    room.game.status = GameStatus(type=GAME_STATUS_WAITING_PLAYERS, detail=waiting_for_players)
     await broadcast_event(BroadcastMessageRequest(room_id=room.room_id, type=MESSAGE_TYPE_WAITING_FOR_PLAYERS), json.dumps(waiting_for_players))
-    return(room)
\ No newline at end of file
@@ -0,0 +1,219 @@
+import asyncio
+import math
+from typing import Any, Callable, List
+
+from ..logger import logger
+from ..settings import SCHEDULER_RESOLUTION, SCHEDULER_WHEEL_SLOTS, SCHEDULER_WHEEL_LEVELS
+
+
+class TimerHandle:
+    __slots__ = ("tick", "callback", "args", "cancelled")
+
+    def __init__(self, tick: int, callback: Callable, args: tuple):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimingWheel:
+    """Hierarchical timing wheel driving every timer of the worker from a single task.
+
+    Timers are keyed by absolute deadlines (event loop time) rounded up to the wheel's resolution, so they never fire early
+    and never drift. Level 0 holds the timers of the next `slots` ticks, each upper level covers `slots` times the span of
+    the level below and is cascaded down when the lower level wraps. A tick only touches the timers expiring in it."""
+
+    def __init__(self, resolution: float = SCHEDULER_RESOLUTION, slots: int = SCHEDULER_WHEEL_SLOTS, levels: int = SCHEDULER_WHEEL_LEVELS):
+        if slots & (slots - 1):
+            raise ValueError(f"The number of slots of the wheel must be a power of 2, got {slots}")
+
+        self.resolution = resolution
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = levels
+        self.wheels: List[List[List[TimerHandle]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow: List[TimerHandle] = [] # Timers beyond the span of the top level
+
+        self.origin: float = None
+        self.current_tick = 0
+        self.pending = 0
+        self.stats = {"scheduled": 0, "fired": 0, "cancelled": 0}
+
+        self.task: asyncio.Task = None
+        self.wakeup: asyncio.Event = None
+
+    def time(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def start(self):
+        if self.task and not self.task.done():
+            return
+        if self.origin is None:
+            self.origin = self.time()
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+
+    def get_tick(self, time: float) -> int:
+        return math.floor((time - self.origin) / self.resolution)
+
+    def call_at(self, deadline: float, callback: Callable, *args: Any) -> TimerHandle:
+        """Call callback(*args) at the first tick at or after the deadline (event loop time)."""
+
+        self.start()
+
+        # Idle wheel: skip the ticks elapsed since the last timer at once
+        if self.pending == 0:
+            self.current_tick = max(self.current_tick, self.get_tick(self.time()))
+
+        tick = max(math.ceil((deadline - self.origin) / self.resolution), self.current_tick + 1)
+        handle = TimerHandle(tick, callback, args)
+        self.place(handle)
+
+        self.pending += 1
+        self.stats["scheduled"] += 1
+        self.wakeup.set()
+        return handle
+
+    def call_later(self, delay: float, callback: Callable, *args: Any) -> TimerHandle:
+        return self.call_at(self.time() + delay, callback, *args)
+
+    def place(self, handle: TimerHandle):
+        delta = handle.tick - self.current_tick
+
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                slot = (handle.tick >> (self.bits * level)) & self.mask
+                self.wheels[level][slot].append(handle)
+                return
+
+        self.overflow.append(handle)
+
+    def cascade(self, level: int):
+        """Move the timers of the current slot of an upper level to the lower levels."""
+
+        slot = (self.current_tick >> (self.bits * level)) & self.mask
+        handles = self.wheels[level][slot]
+        self.wheels[level][slot] = []
+
+        # The top level wrapped: the overflowing timers may now fit in the wheel
+        if level == self.levels - 1 and slot == 0:
+            handles.extend(self.overflow)
+            self.overflow = []
+
+        for handle in handles:
+            if handle.cancelled:
+                self.pending -= 1
+                self.stats["cancelled"] += 1
+            else:
+                self.place(handle)
+
+    def advance(self):
+        """Process one tick: cascade the upper levels that wrapped, then fire the timers of the tick."""
+
+        for level in range(self.levels - 1, 0, -1):
+            if self.current_tick & ((1 << (self.bits * level)) - 1) == 0:
+                self.cascade(level)
+
+        slot = self.current_tick & self.mask
+        handles = self.wheels[0][slot]
+        self.wheels[0][slot] = []
+
+        for handle in handles:
+            self.pending -= 1
+            if handle.cancelled:
+                self.stats["cancelled"] += 1
+                continue
+
+            self.stats["fired"] += 1
+            try:
+                handle.callback(*handle.args)
+            except Exception as e:
+                logger.error(f"Error in scheduled callback {handle.callback}: {e}")
+
+    async def run(self):
+        while True:
+            # Nothing scheduled: sleep until a timer is added
+            if self.pending == 0:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            # Sleep until the next tick boundary, computed from the origin so that ticks do not drift
+            delay = self.origin + (self.current_tick + 1) * self.resolution - self.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # Catch up with every tick elapsed, e.g. after the event loop was blocked
+            now_tick = self.get_tick(self.time())
+            while self.current_tick < now_tick and self.pending:
+                self.current_tick += 1
+                self.advance()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pending": self.pending, "current_tick": self.current_tick}
+
+
+# Scheduler shared by all the rooms of the worker
+scheduler = TimingWheel()
+
+
+def resolve_waiter(waiter: asyncio.Future, result: bool = False):
+    if not waiter.done():
+        waiter.set_result(result)
+
+
+async def sleep_until(deadline: float):
+    """Sleep until the deadline (event loop time) using the worker's timing wheel."""
+
+    waiter = asyncio.get_running_loop().create_future()
+    handle = scheduler.call_at(deadline, resolve_waiter, waiter)
+    try:
+        await waiter
+    finally:
+        handle.cancel()
+
+
+class PhaseCancellation:
+    """Early end of a game phase. Replaces an asyncio.Event: the phase awaits its next deadline on the timing wheel, and set() wakes it up immediately."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.waiter: asyncio.Future = None
+
+    def set(self):
+        self.cancelled = True
+        if self.waiter:
+            resolve_waiter(self.waiter, True)
+
+    def clear(self):
+        self.cancelled = False
+
+    def is_set(self) -> bool:
+        return self.cancelled
+
+    async def wait_until(self, deadline: float) -> bool:
+        """Wait until the deadline (event loop time). Returns True if the phase was cancelled before."""
+
+        if self.cancelled:
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiter = waiter
+        handle = scheduler.call_at(deadline, resolve_waiter, waiter)
+        try:
+            return await waiter
+        finally:
+            handle.cancel()
+            self.waiter = None
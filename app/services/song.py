@@ -1,16 +1,253 @@
-import requests
-import json
+import time
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
 
-from app.settings import LYRICS_API_URL
+import httpx
+
+from app.settings import *
 from ..logger import logger
+from ..repository.lyrics import get_cached_lyrics, cache_lyrics
+from ..schemas.game import Song
+
+
+class LyricsUnavailable(Exception):
+    """The lyrics API could not be reached, or the circuit breaker is open."""
+
+
+class LyricsNotFound(Exception):
+    """The lyrics API does not know the song."""
+
+
+class CircuitBreaker:
+    """Fail fast while an upstream is down.
+
+    Closed: calls go through. After `max_failures` consecutive failures it opens and rejects every call for `reset_timeout`
+    seconds, then lets a single trial call through (half-open): its success closes the breaker, its failure opens it again."""
+
+    def __init__(self, max_failures: int = LYRICS_BREAKER_MAX_FAILURES, reset_timeout: float = LYRICS_BREAKER_RESET_TIMEOUT):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= self.max_failures:
+            if self.opened_at is None or self.trial_running:
+                logger.warning(f"Circuit breaker opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+
+class LyricsClient:
+    """Async client of the lyrics API, sharing one connection pool across the worker.
+
+    Each attempt is bounded by a timeout, transient failures (network errors, timeouts, 429 and 5xx) are retried with
+    jittered exponential backoff, and a circuit breaker rejects calls at once while the API keeps failing."""
+
+    def __init__(self, base_url: str = LYRICS_API_URL, timeout: float = LYRICS_TIMEOUT, max_retries: int = LYRICS_MAX_RETRIES, retry_backoff: float = LYRICS_RETRY_BACKOFF, breaker: CircuitBreaker = None):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, LYRICS_CONNECT_TIMEOUT))
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.client: httpx.AsyncClient = None
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+
+    async def start(self):
+        if self.client is None:
+            limits = httpx.Limits(max_connections=LYRICS_MAX_CONNECTIONS, max_keepalive_connections=LYRICS_MAX_CONNECTIONS)
+            self.client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits)
+
+    async def stop(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def get_backoff(self, attempt: int) -> float:
+        # Full jitter: retries of many rooms do not hit the API at the same time
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    async def get_lyrics(self, title: str, artist: str) -> str:
+        await self.start()
+
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise LyricsUnavailable(f"Lyrics API circuit breaker is {self.breaker.state}")
+
+        try:
+            return await self.fetch(f"/{quote(artist, safe='')}/{quote(title, safe='')}", f"{title} by {artist}")
+        finally:
+            # A cancelled trial call must not keep the breaker half-open forever. Calls let through before the breaker opened
+            # may still be running: they must not let a second trial through
+            if trial:
+                self.breaker.trial_running = False
+
+    async def fetch(self, url: str, description: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                await asyncio.sleep(self.get_backoff(attempt - 1))
+
+            self.stats["requests"] += 1
+            try:
+                response = await self.client.get(url)
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__} {e}"
+                logger.warning(f"Error while fetching lyrics of {description} (attempt {attempt + 1}): {error}")
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                error = f"HTTP {response.status_code}"
+                logger.warning(f"Error while fetching lyrics of {description} (attempt {attempt + 1}): {error}")
+                continue
+
+            # The API answered: a missing song is not an outage
+            self.breaker.record_success()
+            response.raise_for_status()
+            return response.json()["lyrics"]
+
+        self.stats["failures"] += 1
+        self.breaker.record_failure()
+        raise LyricsUnavailable(f"Lyrics API failed {self.max_retries + 1} times: {error}")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "breaker": self.breaker.state}
+
+
+# Client shared by the whole worker
+lyrics_client = LyricsClient()
+
+
+class LyricsCache:
+    """Two-tier lyrics cache: an in-process LRU in front of Redis, shared by the workers.
+
+    Songs unknown to the API are cached too, for a shorter time, so that they are not asked for again every turn.
+    Concurrent lookups of the same song wait for a single fetch. API outages are not cached."""
+
+    def __init__(self, client: LyricsClient = lyrics_client, max_size: int = LYRICS_CACHE_SIZE):
+        self.client = client
+        self.max_size = max_size
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Optional[str]]]" = OrderedDict()
+        self.in_flight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.stats = {"local_hits": 0, "redis_hits": 0, "negative_hits": 0, "misses": 0, "in_flight_joins": 0}
+
+    def get_key(self, title: str, artist: str) -> Tuple[str, str]:
+        return artist.strip().lower(), title.strip().lower()
+
+    def get_local(self, key: Tuple[str, str]):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return False, None
+
+        self.entries.move_to_end(key)
+        return True, entry[1]
+
+    def put_local(self, key: Tuple[str, str], lyrics: Optional[str]):
+        ttl = LYRICS_CACHE_TTL if lyrics is not None else LYRICS_NEGATIVE_CACHE_TTL
+        self.entries[key] = (time.monotonic() + ttl, lyrics)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get_lyrics(self, title: str, artist: str) -> str:
+        key = self.get_key(title, artist)
+
+        found, lyrics = self.get_local(key)
+        if found:
+            self.stats["local_hits"] += 1
+        else:
+            # Join the lookup of the same song already running, e.g. a prefetch
+            task = self.in_flight.get(key)
+            if task is not None:
+                self.stats["in_flight_joins"] += 1
+            else:
+                task = asyncio.create_task(self.load(key, title, artist))
+                self.in_flight[key] = task
+                task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+
+            # A caller giving up must not cancel the lookup shared with the others
+            lyrics = await asyncio.shield(task)
+
+        if lyrics is None:
+            self.stats["negative_hits"] += 1
+            raise LyricsNotFound(f"No lyrics found for {title} by {artist}")
+        return lyrics
+
+    async def load(self, key: Tuple[str, str], title: str, artist: str) -> Optional[str]:
+        found, lyrics = await get_cached_lyrics(title, artist)
+        if found:
+            self.stats["redis_hits"] += 1
+            self.put_local(key, lyrics)
+            return lyrics
+
+        self.stats["misses"] += 1
+        try:
+            lyrics = await self.client.get_lyrics(title, artist)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            lyrics = None
+
+        self.put_local(key, lyrics)
+        await cache_lyrics(title, artist, lyrics, LYRICS_CACHE_TTL if lyrics is not None else LYRICS_NEGATIVE_CACHE_TTL)
+        return lyrics
+
+    def prefetch(self, songs: List[Song]):
+        """Warm the cache with the lyrics of the songs, in the background."""
+        for song in songs:
+            task = asyncio.create_task(self.get_lyrics(song.title, song.artist))
+            task.add_done_callback(log_prefetch_error)
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "size": len(self.entries), "in_flight": len(self.in_flight)}
+
+
+def log_prefetch_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.info(f"Could not prefetch lyrics: {task.exception()}")
+
+
+# Cache shared by the whole worker
+lyrics_cache = LyricsCache()
+
 
 async def retrieve_lyrics(title: str, artist: str):
-  try:
-    response = requests.get(f'{LYRICS_API_URL}/{artist}/{title}')
-    response.raise_for_status()
-    data = response.text
-    lyrics = json.loads(data)['lyrics']
-    return lyrics
-  except requests.exceptions.HTTPError as errh: 
-    logger.error(f'Error while fetching lyrics: {errh.args[0]}')
-    raise errh
\ No newline at end of file
+    try:
+        return await lyrics_cache.get_lyrics(title, artist)
+    except (httpx.HTTPStatusError, LyricsUnavailable, LyricsNotFound) as e:
+        logger.error(f'Error while fetching lyrics: {e}')
+        raise
+
+def prefetch_lyrics(songs: List[Song]):
+    lyrics_cache.prefetch(songs)
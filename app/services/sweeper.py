@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict
+
+from ..logger import logger
+from ..repository.room import get_existing_rooms
+from ..repository.room_cache import room_cache
+from .game_runner import game_runner
+from .connections import connections
+from .websocket import close_room_websockets
+from ..settings import ROOM_SWEEP_INTERVAL, WEBSOCKET_ROOM_GONE_CLOSE_CODE
+
+
+class RoomSweeper:
+    """Reclaims the memory a worker holds for rooms that are gone or no longer active on it.
+
+    Redis forgets idle rooms by itself: the keys of a room expire ROOM_TTL after its last write, or ROOM_FINISHED_TTL
+    after its game ended, without any version published. Every sweep checks the rooms the worker still holds state or a
+    cached copy for in one round trip: the sockets of the rooms gone are closed, their game loops stopped and their cached
+    copies dropped. The state of the other rooms is only kept while they have a socket or their game loop on this worker."""
+
+    def __init__(self):
+        self.registries: Dict[str, dict] = {}
+        self.task: asyncio.Task = None
+        self.stats = {"sweeps": 0, "reaped_rooms": 0, "closed_websockets": 0, "cancelled_loops": 0, "dropped_entries": 0}
+
+    def register(self, name: str, registry: dict):
+        """Per room state keyed by room id, dropped once the room is inactive on this worker."""
+        self.registries[name] = registry
+
+    def get_room_ids(self) -> set:
+        room_ids = set(connections.room_ids()) | set(game_runner.tasks) | set(room_cache.rooms)
+        for registry in self.registries.values():
+            room_ids.update(registry)
+        return room_ids
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+        logger.info("Room sweeper started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+        logger.info("Room sweeper stopped")
+
+    async def sweep(self):
+        room_ids = list(self.get_room_ids())
+        if not room_ids:
+            return
+
+        gone = {room_id for room_id, exists in zip(room_ids, await get_existing_rooms(room_ids)) if not exists}
+        for room_id in gone:
+            logger.info(f"Room {room_id} expired, closing its websockets and game loop")
+            self.stats["closed_websockets"] += await close_room_websockets(room_id, WEBSOCKET_ROOM_GONE_CLOSE_CODE)
+            if game_runner.owns(room_id):
+                await game_runner.abandon(room_id)
+                self.stats["cancelled_loops"] += 1
+            room_cache.discard(room_id)
+
+        dropped = 0
+        for room_id in room_ids:
+            if room_id not in gone and (connections.count(room_id) or game_runner.owns(room_id)):
+                continue
+            if connections.drop_room(room_id):
+                dropped += 1
+            for registry in self.registries.values():
+                if registry.pop(room_id, None) is not None:
+                    dropped += 1
+
+        self.stats["sweeps"] += 1
+        self.stats["reaped_rooms"] += len(gone)
+        self.stats["dropped_entries"] += dropped
+        if gone or dropped:
+            logger.info(f"Swept {len(room_ids)} rooms: {len(gone)} reaped, {dropped} entries dropped")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(ROOM_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error while sweeping the rooms: {e}")
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "tracked_rooms": len(self.get_room_ids())}
+
+
+# Sweeper shared by the whole worker
+room_sweeper = RoomSweeper()
@@ -1,15 +1,34 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from ..repository.room import add_player
+from ..repository.room import add_player, get_room_safe, set_player_connected_atomic
 from ..schemas.chat import Message, NewMessageRequest
-from ..schemas.common import BroadcastMessage, BroadcastMessageRequest, PlayerWebsocket
-from typing import Dict, List, TypeVar, Generic, Union
+from ..schemas.common import BroadcastMessage, BroadcastMessageRequest, Ping
+from ..schemas.room import PlayerPresence
+from .broadcast_bus import bus
+from .connections import PlayerWebsocket, connections
+from .envelope import RawText, encode_event, encode_msgpack, encode_batch
+from typing import Awaitable, Callable, List, Optional, TypeVar, Generic, Union
 from ..logger import logger
 from fastapi import HTTPException
+from ..settings import MESSAGE_TYPE_ROOM_STATE, MESSAGE_TYPE_PING, MESSAGE_TYPE_PLAYER_PRESENCE, WEBSOCKET_SEND_QUEUE_SIZE, WEBSOCKET_DROPPABLE_QUEUE_DEPTH, WEBSOCKET_DROPPABLE_MESSAGE_TYPES, WEBSOCKET_SLOW_CONSUMER_CLOSE_CODE, WEBSOCKET_REPLACED_CLOSE_CODE, WEBSOCKET_IDLE_CLOSE_CODE, WEBSOCKET_PING_INTERVAL, WEBSOCKET_IDLE_TIMEOUT, WEBSOCKET_PONG_FRAME, WEBSOCKET_BATCH_WINDOW, WEBSOCKET_BATCH_MAX_MESSAGES, WEBSOCKET_MSGPACK_SUBPROTOCOL
+import asyncio
 import json
+import msgpack
+import time
 from pydantic import BaseModel
 
-# Dictionnary to store active rooms and their connections. Each room is associated with a list of WebSocket connections.
-active_rooms_websockets: Dict[str, List[PlayerWebsocket]] = {"b594d6ed-39d5-422e-8cca-1c14e9eca09a": []}
+# Counters of the outbound queues of this worker
+websocket_stats = {"sent_frames": 0, "dropped_frames": 0, "evicted_connections": 0, "max_queue_depth": 0, "batched_frames": 0, "batched_messages": 0, "pings": 0, "idle_timeouts": 0, "replaced_connections": 0}
+
+# Bus control message closing the previous socket of a player who connected again, possibly to another worker
+CONTROL_CONNECTION_REPLACED = "connection_replaced"
+
+# Runs the command frames sent by the clients, registered at startup (see services/commands.py). Returns False for other frames
+CommandHandler = Callable[[PlayerWebsocket, str], Awaitable[bool]]
+command_handler: CommandHandler = None
+
+def set_command_handler(handler: CommandHandler):
+    global command_handler
+    command_handler = handler
 
 # Define a generic type for Pydantic models
 T = TypeVar("T", bound=BaseModel)
@@ -31,30 +50,257 @@ async def websocket_endpoint_test(websocket: WebSocket):
         logger.info("Test WebSocket disconnected")
 
 
-async def room_websocket(websocket: WebSocket, room_id: str, player_id: str):
+async def room_websocket(websocket: WebSocket, room_id: str, player_id: str, batch: bool = False):
 
-    logger.info(f"Room WebSocket connected to room {room_id} with player {player_id}")
-    
-    # If the room does not exist, create it
-    if room_id not in active_rooms_websockets:
-        logger.info(f"Creating new room {room_id}")
-        active_rooms_websockets[room_id] = []
+    # Events are sent as MessagePack binary frames to the clients offering the subprotocol, as JSON text otherwise
+    binary = WEBSOCKET_MSGPACK_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
 
-    await websocket.accept()
+    logger.info(f"Room WebSocket connected to room {room_id} with player {player_id}{' in batch mode' if batch else ''}{' with MessagePack' if binary else ''}")
+
+    await websocket.accept(subprotocol=WEBSOCKET_MSGPACK_SUBPROTOCOL if binary else None)
 
-    # Creating the player websocket
-    player_websocket: PlayerWebsocket = PlayerWebsocket(websocket=websocket, player_id=player_id)
-    active_rooms_websockets[room_id].append(player_websocket)
+    # Creating the player websocket and its writer task
+    player_websocket = PlayerWebsocket(websocket, player_id, room_id, batch=batch, binary=binary)
+    start_websocket_writer(player_websocket)
+
+    # The player is marked connected with this socket first: its previous socket going away can not mark it disconnected
+    previous_connection_id = await set_player_presence(player_websocket, True)
+    replace_player_websocket(player_websocket)
+    if previous_connection_id and bus.connected:
+        await bus.publish_control(CONTROL_CONNECTION_REPLACED, room_id, player_id=player_id, connection_id=player_websocket.connection_id)
+
+    # Receive the room's events published by the other workers
+    await bus.subscribe_room(room_id)
+
+    # Then send the room to the new client: the patches it receives from now on apply to this version or a later one
+    await send_room_state(player_websocket)
 
     try:
         while True:
-            data = await websocket.receive_text()
-            for player_websocket in active_rooms_websockets[room_id]:
-                await player_websocket.websocket.send_text(f"{player_id}: {data}")
+            data = await receive_frame(websocket)
+            player_websocket.last_seen = time.monotonic()
+            if data is None or data == WEBSOCKET_PONG_FRAME:
+                continue
+
+            # Commands are handled in order, one at a time per socket, and acknowledged to the sender
+            if command_handler and await command_handler(player_websocket, data):
+                continue
+
+            # Any other text is echoed to the room, as before the commands
+            echo = RawText(f"{player_id}: {data}")
+            for room_player_websocket in connections.room(room_id):
+                enqueue_message(room_player_websocket, echo)
 
     except WebSocketDisconnect:
-        disconnected_player_websocket = next((pws for pws in active_rooms_websockets[room_id] if pws.websocket == websocket), None)
-        active_rooms_websockets[room_id].remove(disconnected_player_websocket)
+        logger.info(f"Room WebSocket disconnected from room {room_id} with player {player_id}")
+
+    finally:
+        await remove_player_websocket(player_websocket)
+        await set_player_presence(player_websocket, False)
+
+def replace_player_websocket(player_websocket: PlayerWebsocket):
+    """Add a socket to its room in place of the other sockets of its player, in one step: from now on, the player's frames
+    only go to the new socket."""
+    replaced = connections.add(player_websocket)
+    if replaced:
+        close_replaced_websocket(replaced)
+
+def close_replaced_websocket(player_websocket: PlayerWebsocket):
+    logger.info(f"Replacing the previous websocket of player {player_websocket.player_id} in room {player_websocket.room_id}")
+    websocket_stats["replaced_connections"] += 1
+    close_in_background(player_websocket, WEBSOCKET_REPLACED_CLOSE_CODE)
+
+async def close_replaced_websockets(room_id: str, player_id: str, connection_id: str):
+    """Close the socket of a player if it is not its current one. Registered on the bus for the players connecting again to another worker."""
+    player_websocket = connections.get(room_id, player_id)
+    if player_websocket and player_websocket.connection_id != connection_id:
+        close_replaced_websocket(player_websocket)
+
+async def set_player_presence(player_websocket: PlayerWebsocket, connected: bool) -> Optional[str]:
+    """Mark the player of a socket connected or disconnected, and tell the room if that changed. Returns the previous connection of the player."""
+    try:
+        previous_connection_id, changed, _ = await set_player_connected_atomic(player_websocket.player_id, player_websocket.connection_id, connected, player_websocket.room_id)
+    except HTTPException as e:
+        # Sockets of players not in the room, or of a room gone, have no presence
+        logger.debug(f"No presence for player {player_websocket.player_id} in room {player_websocket.room_id}: {e.detail}")
+        return None
+    except Exception as e:
+        logger.error(f"Error updating the presence of player {player_websocket.player_id} in room {player_websocket.room_id}: {e}")
+        return None
+
+    if changed:
+        await broadcast_event(BroadcastMessageRequest(room_id=player_websocket.room_id, type=MESSAGE_TYPE_PLAYER_PRESENCE), PlayerPresence(player_id=player_websocket.player_id, connected=connected))
+    return previous_connection_id
+
+async def send_room_state(player_websocket: PlayerWebsocket):
+    """Send the whole room, with its version, to one client."""
+    try:
+        room = await get_room_safe(player_websocket.room_id)
+    except HTTPException:
+        return
+    enqueue_message(player_websocket, encode_event(MESSAGE_TYPE_ROOM_STATE, room))
+
+def start_websocket_writer(player_websocket: PlayerWebsocket):
+    """Create the bounded outbound queue of the socket and the task draining it."""
+    player_websocket.queue = asyncio.Queue(maxsize=WEBSOCKET_SEND_QUEUE_SIZE)
+    player_websocket.writer = asyncio.create_task(websocket_writer(player_websocket))
+
+async def websocket_writer(player_websocket: PlayerWebsocket):
+    """Send the queued messages of one socket, so that a slow client only ever delays itself."""
+    try:
+        while True:
+            message = await player_websocket.queue.get()
+
+            if player_websocket.batch:
+                frame = encode_batch(await collect_batch(player_websocket, message), player_websocket.binary)
+            elif player_websocket.binary:
+                frame = encode_msgpack(message)
+            else:
+                frame = message
+
+            if player_websocket.binary:
+                await player_websocket.websocket.send_bytes(frame)
+            else:
+                await player_websocket.websocket.send_text(frame)
+            websocket_stats["sent_frames"] += 1
+
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.debug(f"Writer of player {player_websocket.player_id} in room {player_websocket.room_id} stopped: {e}")
+
+async def collect_batch(player_websocket: PlayerWebsocket, message: str) -> List[str]:
+    """Wait a few milliseconds for the messages following this one, e.g. the events of a phase change, to send them in
+    order in one array frame."""
+
+    await asyncio.sleep(WEBSOCKET_BATCH_WINDOW)
+
+    messages = [message]
+    queue = player_websocket.queue
+    while len(messages) < WEBSOCKET_BATCH_MAX_MESSAGES and not queue.empty():
+        messages.append(queue.get_nowait())
+
+    websocket_stats["batched_frames"] += 1
+    websocket_stats["batched_messages"] += len(messages)
+    return messages
+
+async def receive_frame(websocket: WebSocket) -> str:
+    """Text of the next frame. Binary frames are MessagePack, decoded to the same JSON as a text frame. None if unreadable."""
+
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    if message.get("text") is not None:
+        return message["text"]
+
+    try:
+        data = msgpack.unpackb(message.get("bytes") or b"")
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable binary frame: {e}")
+        return None
+    return data if isinstance(data, str) else json.dumps(data)
+
+def enqueue_message(player_websocket: PlayerWebsocket, message: str, droppable: bool = False) -> bool:
+    """Queue a message for a socket without waiting on it. Returns False if the message was dropped."""
+
+    if player_websocket.evicted:
+        return False
+
+    depth = player_websocket.queue.qsize()
+
+    # Droppable frames (e.g. timers) are skipped as soon as the client lags behind
+    if droppable and depth >= WEBSOCKET_DROPPABLE_QUEUE_DEPTH:
+        player_websocket.dropped += 1
+        websocket_stats["dropped_frames"] += 1
+        return False
+
+    try:
+        player_websocket.queue.put_nowait(message)
+        websocket_stats["max_queue_depth"] = max(websocket_stats["max_queue_depth"], depth + 1)
+        return True
+
+    # The client can not keep up with important frames: disconnect it
+    except asyncio.QueueFull:
+        player_websocket.dropped += 1
+        websocket_stats["dropped_frames"] += 1
+        evict_slow_consumer(player_websocket)
+        return False
+
+def evict_slow_consumer(player_websocket: PlayerWebsocket):
+    logger.warning(f"Evicting slow player {player_websocket.player_id} from room {player_websocket.room_id}: send queue full")
+
+    websocket_stats["evicted_connections"] += 1
+    close_in_background(player_websocket, WEBSOCKET_SLOW_CONSUMER_CLOSE_CODE)
+
+def close_in_background(player_websocket: PlayerWebsocket, code: int):
+    """Stop sending to a socket at once, and close it without waiting on the client."""
+    player_websocket.evicted = True
+    player_websocket.writer.cancel()
+    asyncio.create_task(close_player_websocket(player_websocket, code))
+
+async def close_player_websocket(player_websocket: PlayerWebsocket, code: int):
+    try:
+        await player_websocket.websocket.close(code=code)
+    except Exception as e:
+        logger.debug(f"Error while closing websocket of player {player_websocket.player_id}: {e}")
+    await remove_player_websocket(player_websocket)
+
+async def close_all_websockets(code: int):
+    """Close every socket of this worker, e.g. with 1012 before a restart so that the clients reconnect."""
+    player_websockets = list(connections)
+    if player_websockets:
+        logger.info(f"Closing {len(player_websockets)} websockets with code {code}")
+    await asyncio.gather(*(close_player_websocket(pws, code) for pws in player_websockets))
+
+async def close_room_websockets(room_id: str, code: int) -> int:
+    """Close the sockets of a room connected to this worker. Returns the number of sockets closed."""
+    player_websockets = connections.room(room_id)
+    await asyncio.gather(*(close_player_websocket(pws, code) for pws in player_websockets))
+    return len(player_websockets)
+
+async def remove_player_websocket(player_websocket: PlayerWebsocket):
+    """Remove a socket from its room and stop its writer. Safe to call several times."""
+
+    if player_websocket.writer:
+        player_websocket.writer.cancel()
+
+    if not connections.remove(player_websocket):
+        return
+
+    # No local socket left for this room: stop receiving its events
+    if not connections.count(player_websocket.room_id):
+        await bus.unsubscribe_room(player_websocket.room_id)
+
+async def deliver_local_event(room_id: str, message: str, player_id: str = None, droppable: bool = False) -> bool:
+    """Queue a formatted message for the sockets of the room connected to this worker. If player_id is set, only that player receives it."""
+
+    # Send the message to everyone
+    if not player_id:
+        for player_websocket in connections.room(room_id):
+            enqueue_message(player_websocket, message, droppable)
+        return True
+
+    # Send the message to one player, if connected to this worker
+    player_websocket = connections.get(room_id, player_id)
+    if player_websocket:
+        enqueue_message(player_websocket, message, droppable)
+        return True
+
+    return False
+
+def get_websocket_stats() -> dict:
+    """Counters of the outbound queues of this worker."""
+    queue_depths = [pws.queue.qsize() for pws in connections if pws.queue]
+    room_counts = connections.get_counts()
+    return {
+        **websocket_stats,
+        "connections": len(connections),
+        "rooms": len(room_counts),
+        "max_room_connections": max(room_counts.values(), default=0),
+        "queued_frames": sum(queue_depths),
+        "current_max_queue_depth": max(queue_depths, default=0),
+    }
 
 async def broadcast_event(request: BroadcastMessageRequest, model: Union[T, str], player_id=False, debug=False) -> bool:
     """Broadcast an event to all the players in the room. If player_id is set, then the message will be broadcast only to that player."""
@@ -62,50 +308,29 @@ async def broadcast_event(request: BroadcastMessageRequest, model: Union[T, str]
     try:
         if debug and player_id: logger.debug(f"Broadcasting event received to a single player {player_id}")
 
-        # Check if the websocket still exists
-        if request.room_id not in active_rooms_websockets:
+        # Serialize the event once, the same message is queued for every recipient
+        message = encode_event(request.type, model)
+
+        # Timers are refreshed every second: a lagging client can skip some
+        droppable = request.type in WEBSOCKET_DROPPABLE_MESSAGE_TYPES
+
+        # Publish the message once, every worker delivers it to its own sockets
+        if bus.connected:
+            await bus.publish(request.room_id, message, player_id=player_id or None, droppable=droppable)
+            if debug: logger.debug(f"Message published successfully in room {request.room_id}")
+            return(True)
+
+        # Single worker mode: deliver the message directly
+        if request.room_id not in connections:
             error_message = f"No active websocket for room {request.room_id} found"
             logger.error(error_message)
             raise HTTPException(status_code=404, detail=error_message)
-        
-        # Handle formatting for arrays of models
-        if isinstance(model, list):
-            model = [json.loads(m.model_dump_json()) for m in model]
-            model = json.dumps(model)
-
-        # Handle formatting for simple strings vs typed objects
-        elif not isinstance(model, str):
-            model = model.model_dump_json()
-
-        else: 
-            pass
-
-        # Create a nice message object
-        json_data = {"type": request.type, "content": json.loads(model)} 
-        json_message = json.dumps(json_data)
-        message = json_message
-        
-        # Send the message to everyone
-        if not player_id:
-
-            for player_websocket in active_rooms_websockets[request.room_id]:
-                await player_websocket.websocket.send_text(message)
-
-            if debug: logger.debug(f"Message broadcasted successfully in room {request.room_id}")
-        
-
-        # Send the message to one player
-        else:
-            player_websocket = next((wsp for wsp in active_rooms_websockets[request.room_id] if wsp.player_id == player_id), None)
-            logger.debug(f"{active_rooms_websockets[request.room_id]}")
-            
-            # If the player_id is found
-            if player_websocket:
-                await player_websocket.websocket.send_text(message)
-                if debug: logger.debug(f"Message broadcasted successfully to player {player_id} in room {request.room_id}")
 
-            else:
-                logger.error(f"No player with ID {player_id} found in room {request.room_id}")
+        delivered = await deliver_local_event(request.room_id, message, player_id=player_id or None, droppable=droppable)
+        if player_id and not delivered:
+            logger.error(f"No player with ID {player_id} found in room {request.room_id}")
+        elif debug:
+            logger.debug(f"Message broadcasted successfully in room {request.room_id}")
 
         return(True)
 
@@ -113,3 +338,54 @@ async def broadcast_event(request: BroadcastMessageRequest, model: Union[T, str]
         logger.warning(f"Error while broadcasting {model} in room {request.room_id}: {e}")
         return(False)
     
+
+
+class Heartbeat:
+    """Pings every socket of the worker, and closes the ones whose client went silent.
+
+    A half-open connection never fails on its own: it would keep its place in the room, and fill its queue, until the OS
+    times it out. Clients answer the pings with a pong frame, any other frame counting as well."""
+
+    def __init__(self):
+        self.task: asyncio.Task = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+        logger.info("Websocket heartbeat started")
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.task = None
+        logger.info("Websocket heartbeat stopped")
+
+    def beat(self):
+        now = time.monotonic()
+        ping = encode_event(MESSAGE_TYPE_PING, Ping(server_time=time.time()))
+
+        for player_websocket in list(connections):
+            if player_websocket.evicted:
+                continue
+
+            if now - player_websocket.last_seen > WEBSOCKET_IDLE_TIMEOUT:
+                logger.info(f"Closing the idle websocket of player {player_websocket.player_id} in room {player_websocket.room_id}")
+                websocket_stats["idle_timeouts"] += 1
+                close_in_background(player_websocket, WEBSOCKET_IDLE_CLOSE_CODE)
+            elif enqueue_message(player_websocket, ping):
+                websocket_stats["pings"] += 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(WEBSOCKET_PING_INTERVAL)
+            try:
+                self.beat()
+            except Exception as e:
+                logger.error(f"Error while pinging the websockets: {e}")
+
+
+# Heartbeat shared by the whole worker
+heartbeat = Heartbeat()
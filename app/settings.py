@@ -6,12 +6,43 @@ MESSAGE_TYPE_ALL_PLAYERS_READY = "all_players_ready"
 MESSAGE_TYPE_NEW_MESSAGE = "new_message"
 MESSAGE_TYPE_PLAYER_READY = "player_ready"
 MESSAGE_TYPE_ROOM_STATE = "room_state"
+MESSAGE_TYPE_ROOM_PATCH = "room_patch"
 MESSAGE_TYPE_GAME_START = "game_start"
 MESSAGE_TYPE_PHASE_ENDED_PREMATURELY = "turn_ended_prematurely"
 MESSAGE_TYPE_NO_SONG_CHOSEN = "no_song_chosen"
 MESSAGE_TYPE_ROUND_CHANGE = "round_change"
 MESSAGE_TYPE_TURN_CHANGE = "turn_change"
 MESSAGE_TYPE_SINGER_SONG_DATA = "singer_song_data"
+MESSAGE_TYPE_TIMER = "timer"
+MESSAGE_TYPE_PHASE_DEADLINE = "phase_deadline"
+MESSAGE_TYPE_TIMER_SYNC = "timer_sync"
+MESSAGE_TYPE_ACK = "ack"
+MESSAGE_TYPE_PING = "ping"
+MESSAGE_TYPE_PLAYER_PRESENCE = "player_presence"
+
+# Compact codes sent instead of the message types in the MessagePack frames, never reuse a code
+MESSAGE_TYPE_CODES = {
+    MESSAGE_TYPE_WAITING_FOR_PLAYERS: 1,
+    MESSAGE_TYPE_ALL_PLAYERS_READY: 2,
+    MESSAGE_TYPE_NEW_MESSAGE: 3,
+    MESSAGE_TYPE_PLAYER_READY: 4,
+    MESSAGE_TYPE_ROOM_STATE: 5,
+    MESSAGE_TYPE_ROOM_PATCH: 6,
+    MESSAGE_TYPE_GAME_START: 7,
+    MESSAGE_TYPE_PHASE_ENDED_PREMATURELY: 8,
+    MESSAGE_TYPE_NO_SONG_CHOSEN: 9,
+    MESSAGE_TYPE_ROUND_CHANGE: 10,
+    MESSAGE_TYPE_TURN_CHANGE: 11,
+    MESSAGE_TYPE_SINGER_SONG_DATA: 12,
+    MESSAGE_TYPE_TIMER: 13,
+    MESSAGE_TYPE_PHASE_DEADLINE: 14,
+    MESSAGE_TYPE_TIMER_SYNC: 15,
+    MESSAGE_TYPE_ACK: 16,
+    "phase_change": 17,
+    "pick_song": 18,
+    MESSAGE_TYPE_PING: 19,
+    MESSAGE_TYPE_PLAYER_PRESENCE: 20,
+}
 
 GAME_STATUS_INITIALIZED = "initialized"
 GAME_STATUS_WAITING_PLAYERS = "waiting_players"
@@ -30,5 +61,67 @@ ROOM_STATUS_FINISHED = "finished"
 GAME_CONFIG_NUMBER_OF_ROUNDS = 3
 GAME_CONFIG_ROUND_DURATION = 90
 GAME_CONFIG_PICK_SONG_DURATION = 15
+GAME_CONFIG_NUMBER_OF_SONG_CHOICES = 3
+
+SONG_CATALOG_PATH = "data/songs.jsonl" # JSONL or CSV file with id, title, artist, language and genre fields
+SONG_CATALOG_SAMPLING_ATTEMPTS = 50 # Random draws per song before a filtered sample falls back to a scan
+GUESS_ARTICLES = ["the", "a", "an", "le", "la", "les", "l", "un", "une", "des"] # Ignored when matching guesses
+GUESS_MAX_TYPOS = [(4, 0), (9, 1), (16, 2), (30, 3)] # (answer length, typos tolerated up to that length), the last one applies beyond
+
+SONG_DECK_DRAW_ATTEMPTS = 20 # Draws per song rejected as already played before a game's deck is rebuilt without them
+
+# Timer protocols: "tick" broadcasts the remaining time every second,
+# "deadline" sends the phase deadline once and clients count down locally
+TIMER_MODE_TICK = "tick"
+TIMER_MODE_DEADLINE = "deadline"
+TIMER_SYNC_INTERVAL = 10 # Seconds between two sync frames in deadline mode
+
+LYRICS_API_URL = 'https://api.lyrics.ovh/v1'
+LYRICS_TIMEOUT = 5.0 # Seconds per attempt
+LYRICS_CONNECT_TIMEOUT = 2.0
+LYRICS_MAX_RETRIES = 2 # Attempts after the first one, for network errors, timeouts, 429 and 5xx
+LYRICS_RETRY_BACKOFF = 0.2 # Base of the jittered exponential backoff, in seconds
+LYRICS_MAX_CONNECTIONS = 20 # Connections pooled per worker
+LYRICS_BREAKER_MAX_FAILURES = 5 # Consecutive failed calls before failing fast
+LYRICS_BREAKER_RESET_TIMEOUT = 30 # Seconds before a trial call is let through
+LYRICS_CACHE_SIZE = 512 # Songs kept in memory per worker, in front of Redis
+LYRICS_CACHE_TTL = 7 * 24 * 3600 # Seconds lyrics are cached for
+LYRICS_NEGATIVE_CACHE_TTL = 3600 # Seconds a song unknown to the API is remembered for
+
+WEBSOCKET_SEND_QUEUE_SIZE = 64 # Frames queued per connection before it is considered too slow
+WEBSOCKET_DROPPABLE_QUEUE_DEPTH = 16 # Droppable frames are skipped beyond this queue depth
+WEBSOCKET_DROPPABLE_MESSAGE_TYPES = ["timer"]
+WEBSOCKET_SLOW_CONSUMER_CLOSE_CODE = 1013 # Try again later
+WEBSOCKET_RESTART_CLOSE_CODE = 1012 # Service restart: clients reconnect, to another worker or to the new process
+WEBSOCKET_ROOM_GONE_CLOSE_CODE = 4404 # The room expired or was deleted: clients must not reconnect
+WEBSOCKET_REPLACED_CLOSE_CODE = 4409 # The player connected again with another socket: the old one must not reconnect
+WEBSOCKET_IDLE_CLOSE_CODE = 4408 # Nothing received within the idle timeout, e.g. a half-open connection
+WEBSOCKET_PING_INTERVAL = 20 # Seconds between two pings sent to every socket
+WEBSOCKET_IDLE_TIMEOUT = 60 # Seconds without any frame from a client, pongs included, before its socket is closed
+WEBSOCKET_PONG_FRAME = "pong" # Frame clients answer the pings with
+WEBSOCKET_BATCH_WINDOW = 0.005 # Seconds a batching connection waits for more frames before sending
+WEBSOCKET_BATCH_MAX_MESSAGES = 32 # Messages sent at most in one array frame
+WEBSOCKET_MSGPACK_SUBPROTOCOL = "karavan.msgpack" # Clients offering it get binary MessagePack frames instead of JSON text
+
+CHAT_MAX_MESSAGES = 500 # Messages kept per room, older ones are trimmed
+CHAT_PAGE_SIZE = 100 # Default number of messages returned by GET /chat
+CHAT_MAX_PAGE_SIZE = 500
+CHAT_CURSOR_PATTERN = r"^\d+-\d+$" # Stream ID of the last message read
+
+ROOM_CACHE_SIZE = 1024 # Decoded rooms kept per worker
+ROOM_VERSIONS_CHANNEL = "rooms:versions" # Redis channel the new version of a room is published on after every write
+ROOM_TTL = 24 * 3600 # Seconds a room and its chat, deck and turns are kept after their last write
+ROOM_FINISHED_TTL = 3600 # Seconds a room is kept after its last write once its game is over
+ROOM_SWEEP_INTERVAL = 60 # Seconds between two sweeps of the rooms held in the memory of a worker
+ROOM_MAX_ROUND_TRIPS_PER_REQUEST = 3 # Room reads and writes expected at most per request, more are logged as a warning
+
+ENVELOPE_CACHE_SIZE = 256 # Encoded events kept for repeated payloads such as timers
+
+SCHEDULER_RESOLUTION = 0.05 # Seconds per tick of the timing wheel
+SCHEDULER_WHEEL_SLOTS = 64 # Slots per level, must be a power of 2
+SCHEDULER_WHEEL_LEVELS = 4 # 64^4 ticks of 50ms cover about 9 days
 
-LYRICS_API_URL = 'https://api.lyrics.ovh/v1'
\ No newline at end of file
+GAME_LEASE_TTL = 10 # Seconds a game loop's owner is trusted without renewing its lease, then another worker takes over
+GAME_LEASE_RENEW_INTERVAL = 3 # Seconds between two renewals of the leases of a worker
+GAME_WATCHER_INTERVAL = 5 # Seconds between two scans of the active games for an expired lease
+GAMES_ACTIVE_KEY = "games:active" # Redis set of the rooms with a game loop running on some worker
@@ -0,0 +1,91 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.repository.catalog import SongCatalog
+from app.schemas.game import Song
+
+NUMBER_OF_SONGS = 200000
+NUMBER_OF_ARTISTS = 20000
+LANGUAGES = ["fr", "en", "es", "it", "de"]
+GENRES = ["pop", "rock", "rap", "folk", "electro", "chanson", "latin", "disco", "jazz", "metal"]
+NUMBER = 10000
+
+
+def write_catalog(path: str):
+    random.seed(0)
+    with open(path, "w", encoding="utf-8") as file:
+        for song_id in range(1, NUMBER_OF_SONGS + 1):
+            record = {
+                "id": song_id,
+                "title": f"Song title number {song_id}",
+                "artist": f"Artist {random.randrange(NUMBER_OF_ARTISTS)}",
+                "language": random.choice(LANGUAGES),
+                "genre": random.choice(GENRES),
+                "popularity": random.randint(1, 100),
+            }
+            file.write(json.dumps(record) + "\n")
+
+
+# One Pydantic model per song, as the hard-coded songs were stored. The records keep the language and genre Song does not have
+def load_models(path: str):
+    with open(path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    return [Song(id=record["id"], title=record["title"], artist=record["artist"]) for record in records], records
+
+
+def measure(load, path: str):
+    # Tracing allocations slows the load down: time it on its own
+    start = time.perf_counter()
+    load(path)
+    load_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    result = load(path)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, load_time, memory
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "songs.jsonl")
+        write_catalog(path)
+
+        catalog, catalog_time, catalog_memory = measure(lambda path: SongCatalog().load(path), path)
+        (models, records), models_time, models_memory = measure(load_models, path)
+
+    print(f"{NUMBER_OF_SONGS} songs")
+    print(f"{'storage':<16}{'load (s)':>10}{'memory (MB)':>14}")
+    print(f"{'models':<16}{models_time:>10.2f}{models_memory / 1e6:>14.1f}")
+    print(f"{'catalog':<16}{catalog_time:>10.2f}{catalog_memory / 1e6:>14.1f}")
+
+    # Lookups and samples, against a scan of the models
+    models_by_id = {model.id: model for model in models}
+    weights = [record["popularity"] for record in records]
+    alias_table = catalog.get_alias_table()
+    queries = {
+        "get by id": (lambda: models_by_id[random.randrange(1, NUMBER_OF_SONGS)], lambda: catalog.get_song(random.randrange(1, NUMBER_OF_SONGS))),
+        "sample": (lambda: random.sample(models, 3), lambda: catalog.sample(3)),
+        "sample genre": (lambda: random.sample([model for model, record in zip(models, records) if record["genre"] == "rock"], 3), lambda: catalog.sample(3, genre="rock")),
+        "sample lang+genre": (lambda: random.sample([model for model, record in zip(models, records) if record["genre"] == "rock" and record["language"] == "fr"], 3), lambda: catalog.sample(3, language="fr", genre="rock")),
+        "weighted draw": (lambda: random.choices(models, weights=weights, k=3), lambda: [catalog.get_row(alias_table.draw()) for _ in range(3)]),
+        "sample artist": (lambda: random.sample([model for model, record in zip(models, records) if record["artist"] == "Artist 42"], 3), lambda: catalog.sample(3, artist="Artist 42")),
+    }
+
+    print(f"{'query':<20}{'models (us)':>14}{'catalog (us)':>14}")
+    for name, (models_query, catalog_query) in queries.items():
+        number = NUMBER if name in ("get by id", "sample") else 20
+        models_us = timeit.timeit(models_query, number=number) / number * 1e6
+        catalog_us = timeit.timeit(catalog_query, number=NUMBER) / NUMBER * 1e6
+        print(f"{name:<20}{models_us:>14.2f}{catalog_us:>14.2f}")
+
+if __name__ == "__main__":
+    main()
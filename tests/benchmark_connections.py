@@ -0,0 +1,57 @@
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.connections import ConnectionRegistry, PlayerWebsocket
+
+NUMBER = 2000
+REPEAT = 5
+ROOMS = 500
+
+
+# Lists of sockets per room, scanned for a player and rebuilt to replace or remove one
+def legacy_get(rooms, room_id, player_id):
+    return next((pws for pws in rooms.get(room_id, []) if pws.player_id == player_id), None)
+
+def legacy_replace(rooms, player_websocket):
+    room_websockets = rooms.setdefault(player_websocket.room_id, [])
+    room_websockets[:] = [pws for pws in room_websockets if pws.player_id != player_websocket.player_id] + [player_websocket]
+
+# The list was copied by every broadcast, as a socket may be removed while the messages are queued
+def legacy_fan_out(rooms, room_id):
+    return [pws.queue for pws in list(rooms.get(room_id, []))]
+
+
+def main():
+    # Sockets of one busy worker: ROOMS rooms of a few players, then one of the players reconnecting
+    print(f"{'players/room':<14}{'operation':<12}{'list (us)':>12}{'registry (us)':>16}{'speedup':>10}")
+    for room_size in [4, 16, 64]:
+        registry = ConnectionRegistry()
+        rooms = {}
+        for room in range(ROOMS):
+            for player in range(room_size):
+                player_websocket = PlayerWebsocket(None, f"player-{player}", f"room-{room}")
+                registry.add(player_websocket)
+                rooms.setdefault(player_websocket.room_id, []).append(player_websocket)
+
+        room_id, player_id = f"room-{ROOMS // 2}", f"player-{room_size - 1}"
+        reconnected = PlayerWebsocket(None, player_id, room_id)
+        assert legacy_get(rooms, room_id, player_id) is registry.get(room_id, player_id)
+
+        operations = {
+            "lookup": (lambda: legacy_get(rooms, room_id, player_id), lambda: registry.get(room_id, player_id)),
+            "replace": (lambda: legacy_replace(rooms, reconnected), lambda: registry.add(reconnected)),
+            "fan-out": (lambda: legacy_fan_out(rooms, room_id), lambda: [pws.queue for pws in registry.room(room_id)]),
+        }
+        for operation, (legacy, indexed) in operations.items():
+            # Best of a few runs: the others measure the machine more than the code
+            legacy = min(timeit.repeat(legacy, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+            indexed = min(timeit.repeat(indexed, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+            print(f"{room_size:<14}{operation:<12}{legacy:>12.2f}{indexed:>16.2f}{legacy / indexed:>9.1f}x")
+
+        assert len(registry) == ROOMS * room_size and registry.count(room_id) == room_size
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.schemas.game import Song, TimerMessage
+from app.schemas.room import PlayerSafe, Room
+from app.services.envelope import encode_event
+
+NUMBER = 20000
+
+
+# Formatting done by broadcast_event before the envelope builder
+def legacy_encode(message_type, model):
+    if isinstance(model, list):
+        model = [json.loads(m.model_dump_json()) for m in model]
+        model = json.dumps(model)
+    elif not isinstance(model, str):
+        model = model.model_dump_json()
+    return json.dumps({"type": message_type, "content": json.loads(model)})
+
+
+with open(os.path.join(os.path.dirname(__file__), "room.json")) as file:
+    room = Room.model_validate(json.load(file))
+
+events = {
+    "timer": TimerMessage(round=1, turn=2, remaining_time=42, current_phase="guessing_song"),
+    "pick_song": [Song(id=i, title=f"Song {i}", artist=f"Artist {i}") for i in range(3)],
+    "room_state": room,
+    "singer_song_data": Song(id=1, title="Ophelia", artist="The Lumineers", lyrics="I got a feeling\n" * 200),
+    "waiting_for_players": json.dumps([player.id for player in room.players]),
+}
+
+
+def main():
+    # Serialization cost per broadcast, the resulting message is then queued as is for every recipient
+    print(f"{'event':<20}{'legacy (us)':>14}{'envelope (us)':>16}{'speedup':>10}")
+    for message_type, model in events.items():
+        assert json.loads(legacy_encode(message_type, model)) == json.loads(encode_event(message_type, model))
+
+        legacy = timeit.timeit(lambda: legacy_encode(message_type, model), number=NUMBER) / NUMBER * 1e6
+        envelope = timeit.timeit(lambda: encode_event(message_type, model), number=NUMBER) / NUMBER * 1e6
+        print(f"{message_type:<20}{legacy:>14.2f}{envelope:>16.2f}{legacy / envelope:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.schemas.game import Song
+from app.services.guess import GuessMatcher
+
+NUMBER = 20000
+
+
+with open(os.path.join(os.path.dirname(__file__), "guess_corpus.json"), encoding="utf-8") as file:
+    corpus = json.load(file)
+
+
+# Every case of the corpus must be decided as expected
+def test_corpus():
+    failures = 0
+    for case in corpus:
+        matcher = GuessMatcher(Song(id=0, title=case["title"], artist=case["artist"]))
+        if matcher.match(case["guess"]) != case["match"]:
+            print(f"Expected {case['guess']!r} {'to match' if case['match'] else 'not to match'} {case['title']!r} by {case['artist']!r}")
+            failures += 1
+
+    if not failures:
+        print(f"Guess corpus test passed ({len(corpus)} cases).")
+
+
+# Guesses checked per second on a single core, matchers being built once per turn
+def benchmark():
+    cases = [(GuessMatcher(Song(id=0, title=case["title"], artist=case["artist"])), case["guess"]) for case in corpus]
+
+    start = time.perf_counter()
+    for _ in range(NUMBER // len(cases) + 1):
+        for matcher, guess in cases:
+            matcher.match(guess)
+    elapsed = time.perf_counter() - start
+    guesses = (NUMBER // len(cases) + 1) * len(cases)
+
+    print(f"{guesses / elapsed:,.0f} guesses per second, {elapsed / guesses * 1e6:.1f} us per guess")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        GuessMatcher(Song(id=0, title="Les Champs-Élysées", artist="Joe Dassin"))
+    print(f"{(time.perf_counter() - start) / 1000 * 1e6:.1f} us per matcher built")
+
+if __name__ == "__main__":
+    test_corpus()
+    benchmark()
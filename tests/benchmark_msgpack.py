@@ -0,0 +1,80 @@
+import json
+import os
+import sys
+import time
+import timeit
+import zlib
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.schemas.chat import Message
+from app.schemas.common import CommandAck, Ping, Text
+from app.schemas.game import Phase, PhaseDeadlineMessage, RoundAndTurnMessage, Song, TimerMessage
+from app.schemas.room import PlayerPresence, PlayerReady, Room
+from app.services.envelope import encode_event, encode_msgpack, msgpack_cache
+from app.settings import MESSAGE_TYPE_CODES
+
+NUMBER = 5000
+
+
+with open(os.path.join(os.path.dirname(__file__), "room.json")) as file:
+    room = Room.model_validate(json.load(file))
+
+now = time.time()
+player_ids = [player.id for player in room.players]
+
+# A typical event of each message type
+events = {
+    "waiting_for_players": json.dumps(player_ids),
+    "all_players_ready": "",
+    "new_message": Message(content="is it bohemian rhapsody?", sender_id=player_ids[0], id="1718000000000-0", timestamp="2025-02-03T23:47:08"),
+    "player_ready": PlayerReady(player_name="pedro", ready=True),
+    "room_state": room,
+    "room_patch": f'{{"version":12,"ops":[{{"op":"replace","path":"/players/{player_ids[0]}/ready","value":true}},{{"op":"replace","path":"/game/status","value":{{"type":"waiting_players","detail":null}}}}]}}',
+    "game_start": Text(content="Game started"),
+    "turn_ended_prematurely": Text(content="Guessing song phase ended prematurely"),
+    "no_song_chosen": Text(content="No song chosen"),
+    "round_change": RoundAndTurnMessage(round=1, turn=0),
+    "turn_change": RoundAndTurnMessage(round=1, turn=1),
+    "singer_song_data": Song(id=1, title="Ophelia", artist="The Lumineers", lyrics="Oh, Ophelia, you've been on my mind, girl, since the flood\n" * 40),
+    "timer": TimerMessage(round=1, turn=2, remaining_time=42, current_phase="guessing_song"),
+    "phase_deadline": PhaseDeadlineMessage(round=1, turn=2, current_phase="guessing_song", duration=60, deadline=now + 60, server_time=now, remaining_time=60),
+    "timer_sync": PhaseDeadlineMessage(round=1, turn=2, current_phase="guessing_song", duration=60, deadline=now + 60, server_time=now + 30, remaining_time=30),
+    "ack": CommandAck(id="42", ok=True),
+    "phase_change": Phase(phase="picking_song"),
+    "pick_song": [Song(id=i, title=f"Song {i}", artist=f"Artist {i}") for i in range(3)],
+    "ping": Ping(server_time=now),
+    "player_presence": PlayerPresence(player_id=player_ids[0], connected=False),
+}
+
+
+def deflate(data: bytes) -> int:
+    """Size of a message compressed on its own, as with permessage-deflate without context takeover."""
+    compressor = zlib.compressobj(wbits=-15)
+    return len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+
+def encode_msgpack_uncached(message: str) -> bytes:
+    msgpack_cache.clear()
+    return encode_msgpack(message)
+
+
+def main():
+    assert set(events) == set(MESSAGE_TYPE_CODES), "Every message type needs a code and an example"
+
+    # Bytes on the wire, and time to build the frame once per broadcast, on top of the JSON envelope
+    print(f"{'event':<24}{'json (B)':>10}{'msgpack (B)':>13}{'json+deflate':>14}{'msgpack+deflate':>17}{'msgpack (us)':>14}")
+    totals = [0, 0, 0, 0]
+    for message_type, model in events.items():
+        message = encode_event(message_type, model)
+        frame = encode_msgpack_uncached(message)
+        sizes = [len(message.encode()), len(frame), deflate(message.encode()), deflate(frame)]
+        totals = [total + size for total, size in zip(totals, sizes)]
+
+        encode_time = timeit.timeit(lambda: encode_msgpack_uncached(message), number=NUMBER) / NUMBER * 1e6
+        print(f"{message_type:<24}{sizes[0]:>10}{sizes[1]:>13}{sizes[2]:>14}{sizes[3]:>17}{encode_time:>14.2f}")
+
+    print(f"{'total':<24}{totals[0]:>10}{totals[1]:>13}{totals[2]:>14}{totals[3]:>17}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.broadcast_bus import BroadcastBus
+
+# Requires a local redis-server
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+
+# Two buses in the same process behave like two workers sharing the same Redis
+async def test_cross_worker_fan_out():
+    room_id = "bus-test-room"
+    received = {"worker_a": [], "worker_b": []}
+
+    def handler(worker):
+        async def deliver(room_id, message, player_id, droppable):
+            received[worker].append((room_id, message, player_id))
+            return True
+        return deliver
+
+    worker_a = BroadcastBus(REDIS_URL)
+    worker_b = BroadcastBus(REDIS_URL)
+    await worker_a.start(handler("worker_a"))
+    await worker_b.start(handler("worker_b"))
+
+    # Only worker B holds sockets for the room
+    await worker_b.subscribe_room(room_id)
+    await asyncio.sleep(0.2)
+
+    reached = await worker_a.publish(room_id, '{"type": "timer", "content": 10}')
+    await worker_a.publish(room_id, '{"type": "pick_song", "content": []}', player_id="singer")
+    await asyncio.sleep(0.5)
+
+    test_pass = True
+    if reached != 1:
+        print(f"Expected the event to reach 1 worker, reached {reached}")
+        test_pass = False
+    if received["worker_a"]:
+        print(f"Worker A is not subscribed and should not receive anything: {received['worker_a']}")
+        test_pass = False
+    if [player_id for _, _, player_id in received["worker_b"]] != [None, "singer"]:
+        print(f"Unexpected events received by worker B: {received['worker_b']}")
+        test_pass = False
+
+    # Once unsubscribed, the worker stops receiving the room's events
+    await worker_b.unsubscribe_room(room_id)
+    await asyncio.sleep(0.2)
+    await worker_a.publish(room_id, '{"type": "timer", "content": 9}')
+    await asyncio.sleep(0.5)
+    if len(received["worker_b"]) != 2:
+        print(f"Worker B received events after unsubscribing: {received['worker_b']}")
+        test_pass = False
+
+    await worker_a.stop()
+    await worker_b.stop()
+
+    if test_pass:
+        print("Broadcast bus test passed.")
+
+
+async def main():
+    await test_cross_worker_fan_out()
+
+if __name__ == "__main__":
+    asyncio.run(main())
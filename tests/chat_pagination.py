@@ -0,0 +1,86 @@
+import requests
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+
+# Settings of the server (see app/settings.py)
+CHAT_MAX_MESSAGES = 500
+CHAT_PAGE_SIZE = 100
+
+
+def create_room(session: requests.Session):
+    room_id = session.post(f"{SERVER_URL}/room").json()["success"]
+    player_id = session.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()["id"]
+    return room_id, player_id
+
+
+def send_messages(session: requests.Session, room_id: str, player_id: str, count: int):
+    for i in range(count):
+        session.post(f"{SERVER_URL}/chat", json={"room_id": room_id, "message": {"content": f"message {i}", "sender_id": player_id}})
+
+
+def read_chat(session: requests.Session, room_id: str, limit: int = CHAT_PAGE_SIZE) -> list:
+    """Every message of the room, page by page."""
+    messages, after = [], None
+    while True:
+        params = {"limit": limit, **({"after": after} if after else {})}
+        chat = session.get(f"{SERVER_URL}/chat/{room_id}", params=params).json()
+        if not chat["messages"]:
+            return messages
+        messages += chat["messages"]
+        after = chat["next_cursor"]
+
+
+# Following the cursor returns every message once, in order, and a malformed cursor is refused
+def test_pagination():
+    session = requests.Session()
+    room_id, player_id = create_room(session)
+    send_messages(session, room_id, player_id, 25)
+
+    test_pass = True
+    contents = [message["content"] for message in read_chat(session, room_id, limit=7)]
+    if contents != [f"message {i}" for i in range(25)]:
+        print(f"Expected the 25 messages in order, got {contents}")
+        test_pass = False
+
+    # Nothing new after the last cursor: the cursor stays put
+    chat = session.get(f"{SERVER_URL}/chat/{room_id}").json()
+    last = session.get(f"{SERVER_URL}/chat/{room_id}", params={"after": chat["messages"][-1]["id"]}).json()
+    if last["messages"] or last["next_cursor"] != chat["messages"][-1]["id"]:
+        print(f"Expected no message after the last one, got {last}")
+        test_pass = False
+
+    for cursor in ["foo", "1-", "-1", "1-2-3", "(1-2"]:
+        response = session.get(f"{SERVER_URL}/chat/{room_id}", params={"after": cursor})
+        if response.status_code != 422:
+            print(f"Expected 422 for the cursor {cursor}, got {response.status_code}")
+            test_pass = False
+
+    if test_pass:
+        print("Chat pagination test passed.")
+
+
+# The stream keeps about the last CHAT_MAX_MESSAGES messages: trimming is approximate, the oldest ones go first
+def test_retention():
+    session = requests.Session()
+    room_id, player_id = create_room(session)
+    sent = CHAT_MAX_MESSAGES + 2 * CHAT_PAGE_SIZE
+    send_messages(session, room_id, player_id, sent)
+
+    test_pass = True
+    contents = [message["content"] for message in read_chat(session, room_id, limit=CHAT_PAGE_SIZE)]
+    if not CHAT_MAX_MESSAGES <= len(contents) < sent:
+        print(f"Expected at least {CHAT_MAX_MESSAGES} and less than {sent} messages kept, got {len(contents)}")
+        test_pass = False
+    if contents != [f"message {i}" for i in range(sent - len(contents), sent)]:
+        print(f"Expected the last {len(contents)} messages to be kept, first one is {contents[:1]}")
+        test_pass = False
+
+    print(f"{len(contents)} of {sent} messages kept")
+    if test_pass:
+        print("Chat retention test passed.")
+
+
+if __name__ == "__main__":
+    test_pagination()
+    test_retention()
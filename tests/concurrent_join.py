@@ -0,0 +1,75 @@
+import asyncio
+import requests
+
+from collections import Counter
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+
+MAX_PLAYERS = 5
+PARALLEL_JOINS = 30
+
+
+def create_room():
+    return requests.post(f"{SERVER_URL}/room").json()["success"]
+
+def join(room_id: str, player_name: str):
+    return requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": player_name})
+
+def set_ready(room_id: str, player_name: str):
+    return requests.post(f"{SERVER_URL}/room/ready", json={"room_id": room_id, "player_name": player_name, "ready": True})
+
+
+# Hammer one room with parallel joins: exactly MAX_PLAYERS must get in, with a single owner
+async def test_parallel_joins():
+    room_id = create_room()
+    test_pass = True
+
+    responses = await asyncio.gather(*[asyncio.to_thread(join, room_id, f"player-{i}") for i in range(PARALLEL_JOINS)])
+    status_codes = Counter(response.status_code for response in responses)
+    print(f"Parallel joins status codes: {dict(status_codes)}")
+
+    if status_codes[200] != MAX_PLAYERS or status_codes[400] != PARALLEL_JOINS - MAX_PLAYERS:
+        print(f"Expected {MAX_PLAYERS} successful joins, got {status_codes[200]}")
+        test_pass = False
+
+    room = requests.get(f"{SERVER_URL}/room/{room_id}").json()
+    joined_ids = [response.json()["id"] for response in responses if response.status_code == 200]
+
+    if sorted(player["id"] for player in room["players"]) != sorted(joined_ids):
+        print(f"Players stored in the room do not match the successful joins: {room['players']}")
+        test_pass = False
+    if room["owner"] not in joined_ids:
+        print(f"Owner {room['owner']} is not one of the joined players")
+        test_pass = False
+
+    # Parallel ready toggles must all be kept, and end with the room waiting for its owner
+    await asyncio.gather(*[asyncio.to_thread(set_ready, room_id, player["name"]) for player in room["players"]])
+    room = requests.get(f"{SERVER_URL}/room/{room_id}").json()
+    if not all(player["ready"] for player in room["players"]) or room["game"]["status"]["type"] != "waiting_owner":
+        print(f"Lost ready updates: {room['players']} with status {room['game']['status']}")
+        test_pass = False
+
+    if test_pass:
+        print("Parallel joins test passed.")
+
+
+# The same name joining several times in parallel must only get in once
+async def test_parallel_duplicate_joins():
+    room_id = create_room()
+
+    responses = await asyncio.gather(*[asyncio.to_thread(join, room_id, "pedro") for _ in range(10)])
+    status_codes = Counter(response.status_code for response in responses)
+
+    if status_codes[200] == 1:
+        print("Parallel duplicate joins test passed.")
+    else:
+        print(f"Expected a single successful join, got status codes {dict(status_codes)}")
+
+
+async def main():
+    await test_parallel_joins()
+    await test_parallel_duplicate_joins()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import requests
+import websockets
+
+# URLs of two workers sharing the same Redis, e.g. two uvicorn processes on ports 8000 and 8001.
+# Restart the first one with SIGTERM (kill <pid>) while the test waits for it
+SERVER_URLS = ["http://127.0.0.1:8000", "http://127.0.0.1:8001"]
+WEBSOCKET_URLS = ["ws://127.0.0.1:8000/ws", "ws://127.0.0.1:8001/ws"]
+
+RESTART_CLOSE_CODE = 1012
+
+
+async def next_timer(websocket) -> dict:
+    while True:
+        message = json.loads(await websocket.recv())
+        if message["type"] == "timer":
+            return message["content"]
+
+
+# A game survives the restart of the worker running it: the clients are told to reconnect and the game goes on from the same phase
+async def test_drain():
+    room_id = requests.post(f"{SERVER_URLS[0]}/room").json()["success"]
+    player_ids = []
+    for name in ["pedro", "barb"]:
+        player_ids.append(requests.post(f"{SERVER_URLS[0]}/room/join", json={"room_id": room_id, "player_name": name}).json()["id"])
+        requests.post(f"{SERVER_URLS[0]}/room/ready", json={"room_id": room_id, "player_name": name, "ready": True})
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URLS[0]}/{room_id}/{player_ids[0]}") as websocket:
+        requests.post(f"{SERVER_URLS[0]}/game", json={"room_id": room_id})
+        timer = await next_timer(websocket)
+        print("Game started, restart the first worker now")
+
+        try:
+            while True:
+                timer = await next_timer(websocket)
+        except websockets.exceptions.ConnectionClosed as e:
+            if e.rcvd is None or e.rcvd.code != RESTART_CLOSE_CODE:
+                print(f"Expected the close code {RESTART_CLOSE_CODE}, got {e.rcvd}")
+                test_pass = False
+
+    async with websockets.connect(f"{WEBSOCKET_URLS[1]}/{room_id}/{player_ids[0]}") as websocket:
+        resumed = await asyncio.wait_for(next_timer(websocket), timeout=5)
+
+    if (resumed["round"], resumed["turn"], resumed["current_phase"]) != (timer["round"], timer["turn"], timer["current_phase"]):
+        print(f"Game did not resume where it stopped: {timer} then {resumed}")
+        test_pass = False
+    elif resumed["remaining_time"] < timer["remaining_time"] - 1:
+        print(f"The restart ate into the phase: {timer['remaining_time']}s left then {resumed['remaining_time']}s")
+        test_pass = False
+
+    if test_pass:
+        print("Game drain test passed.")
+
+
+async def main():
+    await test_drain()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# URLs of two workers sharing the same Redis, e.g. two uvicorn processes on ports 8000 and 8001
+SERVER_URLS = ["http://127.0.0.1:8000", "http://127.0.0.1:8001"]
+
+NUMBER_OF_STARTS = 20
+
+
+def get_owned_games() -> int:
+    return sum(requests.get(f"{url}/stats").json()["game_runner"]["owned"] for url in SERVER_URLS)
+
+
+# Starting a game many times at once, on any worker, runs a single game loop
+def test_idempotent_start():
+    room_id = requests.post(f"{SERVER_URLS[0]}/room").json()["success"]
+    for name in ["pedro", "barb"]:
+        requests.post(f"{SERVER_URLS[0]}/room/join", json={"room_id": room_id, "player_name": name})
+        requests.post(f"{SERVER_URLS[0]}/room/ready", json={"room_id": room_id, "player_name": name, "ready": True})
+
+    owned_before = get_owned_games()
+
+    def start(i: int) -> str:
+        return requests.post(f"{SERVER_URLS[i % len(SERVER_URLS)]}/game", json={"room_id": room_id}).json()["success"]
+
+    with ThreadPoolExecutor(max_workers=NUMBER_OF_STARTS) as executor:
+        responses = list(executor.map(start, range(NUMBER_OF_STARTS)))
+
+    started = [response for response in responses if response.startswith("Game started")]
+    owned = get_owned_games() - owned_before
+
+    test_pass = True
+    if len(started) != 1:
+        print(f"Expected a single start, got {len(started)}: {responses}")
+        test_pass = False
+    if owned != 1:
+        print(f"Expected a single game loop on the workers, got {owned}")
+        test_pass = False
+
+    if test_pass:
+        print("Idempotent game start test passed.")
+
+
+if __name__ == "__main__":
+    test_idempotent_start()
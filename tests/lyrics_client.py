@@ -0,0 +1,235 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.song import CircuitBreaker, LyricsClient, LyricsUnavailable, LyricsCache, LyricsNotFound
+from app.schemas.game import Song
+from app.repository import lyrics as lyrics_repository
+
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8765
+
+
+# Local stand-in for lyrics.ovh, its behaviour is switched by the tests
+class StubLyricsHandler(BaseHTTPRequestHandler):
+    mode = "ok"
+    hits = 0
+
+    def do_GET(self):
+        StubLyricsHandler.hits += 1
+
+        if self.mode == "slow":
+            time.sleep(1)
+        if self.mode == "down":
+            self.send_response(503)
+            self.end_headers()
+            return
+        if self.mode == "flaky" and StubLyricsHandler.hits % 2 == 1:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if self.path.startswith("/unknown"):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = json.dumps({"lyrics": f"lyrics of {self.path}"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle(self):
+        # The client gives up on slow answers
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def set_mode(mode: str):
+    StubLyricsHandler.mode = mode
+    StubLyricsHandler.hits = 0
+
+
+async def test_lyrics_client():
+    server = ThreadingHTTPServer((STUB_HOST, STUB_PORT), StubLyricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    client = LyricsClient(f"http://{STUB_HOST}:{STUB_PORT}", timeout=0.3, max_retries=2, retry_backoff=0.01, breaker=CircuitBreaker(max_failures=2, reset_timeout=0.5))
+    test_pass = True
+
+    # Titles are escaped, and the pooled connection is reused
+    set_mode("ok")
+    lyrics = await client.get_lyrics("La Quête", "Orelsan")
+    if lyrics != "lyrics of /Orelsan/La%20Qu%C3%AAte":
+        print(f"Unexpected lyrics: {lyrics}")
+        test_pass = False
+
+    # A failure every other attempt is absorbed by the retries
+    set_mode("flaky")
+    await client.get_lyrics("Ophelia", "The Lumineers")
+    if StubLyricsHandler.hits != 2:
+        print(f"Expected 2 attempts for a flaky upstream, got {StubLyricsHandler.hits}")
+        test_pass = False
+
+    # A slow upstream does not block the caller for longer than the timeouts
+    set_mode("slow")
+    start = time.monotonic()
+    try:
+        await client.get_lyrics("Ophelia", "The Lumineers")
+        print("Expected the slow upstream to time out")
+        test_pass = False
+    except LyricsUnavailable:
+        pass
+    if time.monotonic() - start > 1.5:
+        print(f"Timeouts took {time.monotonic() - start:.2f}s")
+        test_pass = False
+
+    # Once the breaker is open, calls fail without reaching the upstream
+    set_mode("down")
+    while client.breaker.state != "open":
+        try:
+            await client.get_lyrics("Ophelia", "The Lumineers")
+        except LyricsUnavailable:
+            pass
+    set_mode("down")
+    for _ in range(3):
+        try:
+            await client.get_lyrics("Ophelia", "The Lumineers")
+        except LyricsUnavailable:
+            pass
+    if client.breaker.state != "open" or StubLyricsHandler.hits != 0 or client.stats["rejected"] != 3:
+        print(f"Expected the open breaker to reject calls, state {client.breaker.state}, {StubLyricsHandler.hits} upstream hits, stats {client.stats}")
+        test_pass = False
+
+    # After the reset timeout, a successful trial call closes the breaker
+    await asyncio.sleep(0.6)
+    set_mode("ok")
+    await client.get_lyrics("Ophelia", "The Lumineers")
+    if client.breaker.state != "closed":
+        print(f"Expected the breaker to close after a successful trial, got {client.breaker.state}")
+        test_pass = False
+
+    # A missing song is an answer, not an outage
+    try:
+        await client.get_lyrics("song", "unknown")
+        print("Expected a 404 error for an unknown song")
+        test_pass = False
+    except Exception:
+        pass
+    if client.breaker.failures != 0:
+        print("A 404 should not count as a failure of the upstream")
+        test_pass = False
+
+    await client.stop()
+    server.shutdown()
+    server.server_close()
+
+    if test_pass:
+        print("Lyrics client test passed.")
+
+
+# A call let through while the breaker was closed, still running once it is half-open, does not let a second trial through
+async def test_single_trial():
+    client = LyricsClient(f"http://{STUB_HOST}:{STUB_PORT}", breaker=CircuitBreaker(max_failures=1, reset_timeout=0.1))
+    released = {"closed": asyncio.Event(), "trial": asyncio.Event()}
+
+    async def fetch(url, description):
+        event = released.get(description.split(" by ")[0])
+        if event:
+            await event.wait()
+        return description
+
+    client.fetch = fetch
+    test_pass = True
+
+    closed_call = asyncio.create_task(client.get_lyrics("closed", "artist"))
+    await asyncio.sleep(0)
+    client.breaker.opened_at = time.monotonic() - 0.1
+    trial_call = asyncio.create_task(client.get_lyrics("trial", "artist"))
+    await asyncio.sleep(0)
+
+    released["closed"].set()
+    await closed_call
+    try:
+        await client.get_lyrics("second trial", "artist")
+        print("Expected a second trial to be rejected while the first one runs")
+        test_pass = False
+    except LyricsUnavailable:
+        pass
+
+    released["trial"].set()
+    await trial_call
+    if client.breaker.trial_running:
+        print("The trial call did not clear its flag")
+        test_pass = False
+
+    await client.stop()
+
+    if test_pass:
+        print("Lyrics breaker trial test passed.")
+
+
+# Requires a local redis-server: prefetched and unknown songs are only fetched once
+async def test_lyrics_cache():
+    server = ThreadingHTTPServer((STUB_HOST, STUB_PORT), StubLyricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+    lyrics_repository.REDIS_URL = os.environ["REDIS_URL"]
+    await lyrics_repository.init_redis()
+    for title, artist in [("Ophelia", "The Lumineers"), ("song", "unknown")]:
+        await lyrics_repository.redis.delete(lyrics_repository.get_lyrics_key(title, artist))
+
+    client = LyricsClient(f"http://{STUB_HOST}:{STUB_PORT}", timeout=0.3, retry_backoff=0.01)
+    cache = LyricsCache(client)
+    test_pass = True
+
+    set_mode("ok")
+    cache.prefetch([Song(id=1, title="Ophelia", artist="The Lumineers"), Song(id=2, title="song", artist="unknown")])
+    await cache.get_lyrics("Ophelia", "The Lumineers")
+    for _ in range(2):
+        try:
+            await cache.get_lyrics("song", "unknown")
+            print("Expected no lyrics for an unknown song")
+            test_pass = False
+        except LyricsNotFound:
+            pass
+
+    # A new worker finds both songs in Redis
+    other_worker = LyricsCache(client)
+    await other_worker.get_lyrics("ophelia", "the lumineers")
+
+    if StubLyricsHandler.hits != 2:
+        print(f"Expected a single upstream call per song, got {StubLyricsHandler.hits}")
+        test_pass = False
+    if other_worker.stats["redis_hits"] != 1:
+        print(f"Expected the second worker to hit Redis: {other_worker.stats}")
+        test_pass = False
+
+    await client.stop()
+    server.shutdown()
+    server.server_close()
+
+    if test_pass:
+        print("Lyrics cache test passed.")
+
+
+async def main():
+    await test_lyrics_client()
+    await test_single_trial()
+    await test_lyrics_cache()
+
+if __name__ == "__main__":
+    asyncio.run(main())
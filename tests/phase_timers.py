@@ -0,0 +1,113 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import game
+from app.services.connections import PlayerWebsocket, connections
+from app.services.scheduler import PhaseCancellation, scheduler
+
+ROOM_ID = "timers"
+TOLERANCE = 0.15 # Seconds, a few ticks of the timing wheel
+
+# Sync frames every second instead of every TIMER_SYNC_INTERVAL, to keep the test short
+game.TIMER_SYNC_INTERVAL = 1
+
+
+async def run_countdown(duration: int, timer_mode: str, cancel_after: float = None):
+    """Frames a client of the room receives during a phase, with the seconds elapsed when queued, and whether the phase was cancelled."""
+
+    # A client on this worker, without a socket: the frames stay in its queue
+    player_websocket = PlayerWebsocket(None, "pedro", ROOM_ID)
+    player_websocket.queue = asyncio.Queue()
+    connections.add(player_websocket)
+    game.turn_cancellations[ROOM_ID] = PhaseCancellation()
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    if cancel_after is not None:
+        loop.call_later(cancel_after, game.turn_cancellations[ROOM_ID].set)
+
+    frames = []
+
+    async def receive():
+        while True:
+            frame = json.loads(await player_websocket.queue.get())
+            frames.append((round(loop.time() - start, 2), frame["type"], frame["content"]))
+
+    receiver = asyncio.create_task(receive())
+    cancelled = await game.run_phase_countdown(ROOM_ID, 0, 0, "guessing_song", duration, timer_mode)
+    await asyncio.sleep(0)
+    receiver.cancel()
+    connections.remove(player_websocket)
+    return frames, cancelled, loop.time() - start
+
+
+# Tick mode: one timer frame per second, on absolute deadlines so that the countdown does not drift
+async def test_tick():
+    frames, cancelled, elapsed = await run_countdown(3, "tick")
+
+    test_pass = True
+    remaining = [content["remaining_time"] for _, message_type, content in frames if message_type == "timer"]
+    if remaining != [3, 2, 1, 0] or cancelled:
+        print(f"Expected the timers 3, 2, 1, 0, got {remaining} (cancelled: {cancelled})")
+        test_pass = False
+    for i, (at, _, _) in enumerate(frames):
+        if abs(at - i) > TOLERANCE:
+            print(f"Timer {i} sent after {at}s")
+            test_pass = False
+    if abs(elapsed - 4) > TOLERANCE:
+        print(f"Expected the phase to last 4s, got {elapsed:.2f}s")
+        test_pass = False
+
+    frames, cancelled, elapsed = await run_countdown(5, "tick", cancel_after=1.5)
+    if not cancelled or len(frames) != 2 or abs(elapsed - 1.5) > TOLERANCE:
+        print(f"Expected the phase to end after 1.5s and 2 timers, got {len(frames)} timers after {elapsed:.2f}s")
+        test_pass = False
+
+    if test_pass:
+        print("Tick timers test passed.")
+
+
+# Deadline mode: the deadline once, then only sync frames with the same deadline, and one more when cancelled
+async def test_deadline():
+    frames, cancelled, elapsed = await run_countdown(3, "deadline")
+
+    test_pass = True
+    types = [message_type for _, message_type, _ in frames]
+    if types != ["phase_deadline", "timer_sync", "timer_sync"] or cancelled:
+        print(f"Expected the deadline and 2 sync frames, got {types} (cancelled: {cancelled})")
+        test_pass = False
+
+    first = frames[0][2]
+    if abs(first["deadline"] - time.time() - (3 - elapsed)) > TOLERANCE or first["duration"] != 3:
+        print(f"Unexpected deadline: {first}")
+        test_pass = False
+    for at, _, content in frames:
+        if content["deadline"] != first["deadline"] or abs(content["deadline"] - content["server_time"] - content["remaining_time"]) > 0.01 or abs(content["remaining_time"] - (3 - at)) > TOLERANCE:
+            print(f"Sync frame after {at}s does not match the deadline: {content}")
+            test_pass = False
+    if abs(elapsed - 3) > TOLERANCE:
+        print(f"Expected the phase to last 3s, got {elapsed:.2f}s")
+        test_pass = False
+
+    frames, cancelled, elapsed = await run_countdown(5, "deadline", cancel_after=1.5)
+    at, message_type, content = frames[-1]
+    if not cancelled or message_type != "timer_sync" or not content["cancelled"] or abs(at - 1.5) > TOLERANCE:
+        print(f"Expected a cancelled sync frame after 1.5s, got {frames[-1]} (cancelled: {cancelled})")
+        test_pass = False
+
+    if test_pass:
+        print("Deadline timers test passed.")
+
+
+async def main():
+    await test_tick()
+    await test_deadline()
+    await scheduler.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+# The second test requires a local redis-server
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+from app.repository import room as room_repository, room_cache as room_cache_repository
+from app.repository.room_cache import RoomCache
+from app.schemas.room import Room
+
+
+with open(os.path.join(os.path.dirname(__file__), "room.json")) as file:
+    room = Room.model_validate(json.load(file))
+
+
+class LocalRoomCache(RoomCache):
+    """Cache enabled without listening to the versions: the test invalidates it by hand."""
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+
+# Versions only move forward: an invalidated room leaves a tombstone that older reads can not overwrite
+def test_tombstones():
+    cache = LocalRoomCache(max_size=3)
+    test_pass = True
+
+    cache.put(room.room_id, 1, room)
+    cached = cache.get(room.room_id)
+    cached.players[0].ready = not room.players[0].ready
+    if cache.get(room.room_id).players[0].ready != room.players[0].ready:
+        print("Changing a cached copy changed the cache")
+        test_pass = False
+
+    # A write elsewhere: the read started before it comes back with the previous version
+    cache.invalidate(room.room_id, 2)
+    cache.put(room.room_id, 1, room)
+    if cache.get(room.room_id) is not None:
+        print("An outdated read was put back over the tombstone")
+        test_pass = False
+
+    cache.put(room.room_id, 2, room)
+    cache.invalidate(room.room_id, 2)
+    cache.invalidate(room.room_id, 1)
+    if cache.get(room.room_id) is None:
+        print("The version already cached, or an older one, invalidated the room")
+        test_pass = False
+
+    # Tombstones count in the size: the least recently used entries go first
+    for i in range(3):
+        cache.invalidate(f"other-{i}", 1)
+    if room.room_id in cache.rooms or len(cache.rooms) != 3:
+        print(f"Expected the least recently used room to be evicted, got {list(cache.rooms)}")
+        test_pass = False
+
+    stats = cache.get_stats()
+    if stats["size"] != 0 or stats["invalidations"] != 4:
+        print(f"Unexpected cache stats: {stats}")
+        test_pass = False
+
+    if test_pass:
+        print("Room cache tombstones test passed.")
+
+
+# A write on one worker drops the room cached by the others, through the published versions
+async def test_invalidation():
+    room_repository.REDIS_URL = room_cache_repository.REDIS_URL = os.environ["REDIS_URL"]
+    await room_repository.init_redis()
+    await room_repository.room_cache.start()
+    other_worker = RoomCache()
+    await other_worker.start()
+
+    room_id = await room_repository.create_room()
+    await room_repository.join_room_atomic("pedro", room_id)
+    cached = await room_repository.get_room(room_id)
+    other_worker.put(room_id, cached.version, cached)
+
+    test_pass = True
+    if other_worker.get(room_id) is None or room_repository.room_cache.get(room_id) is None:
+        print("Expected both workers to cache the room")
+        test_pass = False
+
+    await room_repository.set_player_ready_atomic("pedro", True, room_id)
+    await asyncio.sleep(0.2)
+    if other_worker.get(room_id) is not None:
+        print("The other worker still caches the room after the write")
+        test_pass = False
+
+    room = await room_repository.get_room(room_id)
+    if not room.players[0].ready or room.version != cached.version + 1:
+        print(f"Expected the written room back from Redis, got version {room.version}")
+        test_pass = False
+
+    await other_worker.stop()
+    await room_repository.room_cache.stop()
+
+    if test_pass:
+        print("Room cache invalidation test passed.")
+
+
+if __name__ == "__main__":
+    test_tombstones()
+    asyncio.run(test_invalidation())
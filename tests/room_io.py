@@ -0,0 +1,45 @@
+import requests
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+
+# Most room round trips expected per request, see the X-Room-* response headers
+EXPECTED_ROUND_TRIPS = {
+    "create": 1,
+    "join": 1,
+    "ready": 1,
+    "get": 1,
+    "start": 2,
+}
+
+
+def get_round_trips(response) -> int:
+    return int(response.headers["X-Room-Reads"]) + int(response.headers["X-Room-Writes"])
+
+
+# Every step of a game's setup must stay within a bounded number of room reads and writes
+def test_room_round_trips():
+    responses = {}
+
+    responses["create"] = requests.post(f"{SERVER_URL}/room")
+    room_id = responses["create"].json()["success"]
+
+    responses["join"] = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"})
+    responses["ready"] = requests.post(f"{SERVER_URL}/room/ready", json={"room_id": room_id, "player_name": "pedro", "ready": True})
+    responses["get"] = requests.get(f"{SERVER_URL}/room/{room_id}")
+    responses["start"] = requests.post(f"{SERVER_URL}/game", json={"room_id": room_id})
+
+    test_pass = True
+    for step, response in responses.items():
+        round_trips = get_round_trips(response)
+        print(f"{step}: {response.status_code}, {response.headers['X-Room-Reads']} reads, {response.headers['X-Room-Cached-Reads']} cached reads, {response.headers['X-Room-Writes']} writes")
+        if round_trips > EXPECTED_ROUND_TRIPS[step]:
+            print(f"Expected at most {EXPECTED_ROUND_TRIPS[step]} room round trips for {step}, got {round_trips}")
+            test_pass = False
+
+    if test_pass:
+        print("Room round trips test passed.")
+
+
+if __name__ == "__main__":
+    test_room_round_trips()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import requests
+import websockets
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+WEBSOCKET_URL = "ws://127.0.0.1:8000/ws"
+
+
+# Client side of the room patches: players are addressed by id, other paths by key
+def apply_patch(room: dict, patch: dict) -> dict:
+    for op in patch["ops"]:
+        keys = op["path"].strip("/").split("/")
+
+        if keys[0] == "players" and len(keys) > 1:
+            players = room["players"]
+            index = next((i for i, player in enumerate(players) if player["id"] == keys[1]), None)
+            if op["op"] == "add":
+                players.append(op["value"])
+            elif op["op"] == "remove":
+                players.pop(index)
+            else:
+                players[index][keys[2]] = op["value"]
+            continue
+
+        target = room
+        for key in keys[:-1]:
+            target = target[key]
+        target[keys[-1]] = op["value"]
+
+    room["version"] = patch["version"]
+    return room
+
+
+class RoomClient:
+    """Keeps a copy of the room up to date from the websocket events, and resyncs when it misses a version."""
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+        self.room = None
+        self.patch_bytes = 0
+        self.patch_paths = []
+        self.resyncs = 0
+
+    def resync(self):
+        self.resyncs += 1
+        self.room = requests.get(f"{SERVER_URL}/room/{self.room_id}").json()
+
+    def handle(self, message: str):
+        event = json.loads(message)
+
+        if event["type"] == "room_state":
+            self.room = event["content"]
+        elif event["type"] == "room_patch":
+            self.patch_bytes += len(message)
+            patch = event["content"]
+            self.patch_paths += [op["path"] for op in patch["ops"]]
+            if patch["version"] <= self.room["version"]:
+                return
+            if patch["version"] != self.room["version"] + 1:
+                self.resync()
+                return
+            apply_patch(self.room, patch)
+
+
+async def receive(websocket, client: RoomClient, duration: float):
+    try:
+        while True:
+            client.handle(await asyncio.wait_for(websocket.recv(), timeout=duration))
+    except asyncio.TimeoutError:
+        pass
+
+
+# The room kept up to date from the patches must match the room stored on the server
+async def test_room_patches():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    owner = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()
+    client = RoomClient(room_id)
+
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{owner['id']}") as websocket:
+        await receive(websocket, client, 0.5)
+
+        players = [requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": f"player-{i}"}).json() for i in range(3)]
+        requests.post(f"{SERVER_URL}/room/ready", json={"room_id": room_id, "player_name": "player-1", "ready": True})
+        requests.post(f"{SERVER_URL}/room/leave", json={"room_id": room_id, "player_id": owner["id"]})
+        requests.post(f"{SERVER_URL}/room/leave", json={"room_id": room_id, "player_id": players[0]["id"]})
+        requests.post(f"{SERVER_URL}/room/ready", json={"room_id": room_id, "player_name": "player-1", "ready": True})
+        await receive(websocket, client, 1)
+
+    server_room = requests.get(f"{SERVER_URL}/room/{room_id}").json()
+    room_size = len(json.dumps(server_room))
+
+    test_pass = True
+    if client.room != server_room:
+        print(f"Room rebuilt from the patches differs from the server:\n{client.room}\n{server_room}")
+        test_pass = False
+    if client.resyncs:
+        print(f"Unexpected resyncs: {client.resyncs}")
+        test_pass = False
+
+    # The owner changes with the two first leaves, the status with every change but the last one, which changes nothing
+    owner_ops, status_ops = client.patch_paths.count("/owner"), client.patch_paths.count("/game/status")
+    if owner_ops != 2 or status_ops != 6:
+        print(f"Expected the owner and the game status only in the patches that change them, got {owner_ops} and {status_ops} times")
+        test_pass = False
+
+    print(f"{client.patch_bytes} bytes of patches for 7 changes, against {room_size} bytes per full room")
+    if test_pass:
+        print("Room patches test passed.")
+
+
+async def main():
+    await test_room_patches()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+# Requires a local redis-server
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379")
+
+from app.repository import room as room_repository, chat as chat_repository, game_loop as game_loop_repository
+from app.repository.game import end_game
+from app.schemas.chat import Message, NewMessageRequest
+from app.repository.room_cache import room_cache
+from app.services.game_runner import game_runner
+from app.services.sweeper import RoomSweeper
+from app.services.connections import PlayerWebsocket, connections
+from app.settings import ROOM_TTL, ROOM_FINISHED_TTL
+
+
+# Rooms expire unless written: joining and chatting bring the time to live of an idle room back up
+async def test_room_ttl():
+    room_id = await room_repository.create_room()
+    room_key = room_repository.get_room_key(room_id)
+    redis = room_repository.redis
+
+    test_pass = True
+    if not ROOM_TTL - 5 <= await redis.ttl(room_key) <= ROOM_TTL:
+        print(f"New room should live {ROOM_TTL}s, got {await redis.ttl(room_key)}")
+        test_pass = False
+
+    await redis.expire(room_key, 10)
+    player, _ = await room_repository.join_room_atomic("pedro", room_id)
+    if await redis.ttl(room_key) < ROOM_TTL - 5:
+        print(f"Joining did not refresh the room, {await redis.ttl(room_key)}s left")
+        test_pass = False
+
+    await redis.expire(room_key, 10)
+    await chat_repository.add_message(NewMessageRequest(room_id=room_id, message=Message(content="hello", sender_id=player.id)))
+    for key in [room_key, chat_repository.get_chat_key(room_id)]:
+        if await redis.ttl(key) < ROOM_TTL - 5:
+            print(f"Chatting did not refresh {key}, {await redis.ttl(key)}s left")
+            test_pass = False
+
+    if test_pass:
+        print("Room TTL test passed.")
+
+
+# Once its game is over, a room is only kept alive for the finished TTL: the players leaving or chatting do not bring it back to ROOM_TTL
+async def test_finished_room_ttl():
+    room_id = await room_repository.create_room()
+    room_key = room_repository.get_room_key(room_id)
+    redis = room_repository.redis
+    pedro, _ = await room_repository.join_room_atomic("pedro", room_id)
+    barb, _ = await room_repository.join_room_atomic("barb", room_id)
+
+    await end_game(await room_repository.get_room(room_id))
+
+    test_pass = True
+    room = await room_repository.get_room(room_id)
+    if room.room_state != "finished":
+        print(f"Expected the room to be finished, got {room.room_state}")
+        test_pass = False
+
+    await room_repository.set_player_connected_atomic(pedro.id, "connection", True, room_id)
+    await room_repository.leave_room_atomic(barb.id, room_id)
+    await chat_repository.add_message(NewMessageRequest(room_id=room_id, message=Message(content="gg", sender_id=pedro.id)), finished=True)
+    for key in [room_key, chat_repository.get_chat_key(room_id)]:
+        if not 0 < await redis.ttl(key) <= ROOM_FINISHED_TTL:
+            print(f"Writes to the finished room brought {key} back to {await redis.ttl(key)}s")
+            test_pass = False
+
+    if test_pass:
+        print("Finished room TTL test passed.")
+
+
+# A sweep stops the loops of the rooms gone, forgets their cached copies and drops the state of the rooms without sockets or loop on the worker
+async def test_sweep():
+    live_room_id = await room_repository.create_room()
+    idle_room_id = await room_repository.create_room()
+    gone_room_id = await room_repository.create_room()
+    expired_room_id = await room_repository.create_room()
+
+    room_cache.rooms.clear()
+    # The expired room is only cached, e.g. after a GET /room: it expires without any version published
+    room_cache.rooms[idle_room_id] = (0, await room_repository.get_room(idle_room_id))
+    room_cache.rooms[expired_room_id] = (0, await room_repository.get_room(expired_room_id))
+    await room_repository.redis.delete(room_repository.get_room_key(gone_room_id), room_repository.get_room_key(expired_room_id))
+
+    matchers = {live_room_id: "matcher", idle_room_id: "matcher", gone_room_id: "matcher"}
+    sweeper = RoomSweeper()
+    sweeper.register("turn_matchers", matchers)
+
+    # The live room has its game loop on this worker, the idle one only had a socket
+    live_task = asyncio.create_task(asyncio.sleep(60))
+    gone_task = asyncio.create_task(asyncio.sleep(60))
+    game_runner.tasks.update({live_room_id: live_task, gone_room_id: gone_task})
+    idle_websocket = PlayerWebsocket(None, "pedro", idle_room_id)
+    connections.add(idle_websocket)
+    connections.remove(idle_websocket)
+
+    await sweeper.sweep()
+    await asyncio.sleep(0)
+
+    test_pass = True
+    if set(matchers) != {live_room_id}:
+        print(f"Expected only the live room to be kept, got {matchers}")
+        test_pass = False
+    if idle_room_id in connections:
+        print("Empty room of the idle room was not dropped")
+        test_pass = False
+    if set(room_cache.rooms) != {idle_room_id}:
+        print(f"Expected only the cached copy of the idle room to be kept, got {set(room_cache.rooms)}")
+        test_pass = False
+    if not gone_task.cancelled() or live_task.done():
+        print("Expected only the loop of the room gone to be cancelled")
+        test_pass = False
+    if sweeper.stats["reaped_rooms"] != 2 or sweeper.stats["cancelled_loops"] != 1:
+        print(f"Unexpected sweep counts: {sweeper.stats}")
+        test_pass = False
+
+    live_task.cancel()
+    game_runner.tasks.clear()
+    room_cache.rooms.clear()
+
+    print(f"Sweep: {sweeper.get_stats()}")
+    if test_pass:
+        print("Room sweeper test passed.")
+
+
+async def main():
+    for repository in [room_repository, chat_repository, game_loop_repository]:
+        repository.REDIS_URL = os.environ["REDIS_URL"]
+        await repository.init_redis()
+
+    await test_room_ttl()
+    await test_finished_room_ttl()
+    await test_sweep()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+import asyncio
+import math
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.scheduler import TimingWheel, PhaseCancellation, scheduler
+
+NUMBER = 100000
+
+
+class ManualWheel(TimingWheel):
+    """Wheel driven by the test: its clock only moves when told, and its ticks are processed without a task."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def start(self):
+        if self.origin is None:
+            self.origin = 0.0
+            self.wakeup = asyncio.Event()
+
+    def run_until(self, now: float):
+        """Process every tick up to the given time, as the wheel's task catches up."""
+        self.now = now
+        now_tick = self.get_tick(now)
+        while self.current_tick < now_tick and self.pending:
+            self.current_tick += 1
+            self.advance()
+
+
+# Timers fire at the first tick at or after their deadline, across the level boundaries and from the overflow
+def test_deadlines():
+    # 4 slots and 2 levels: level 0 covers the next 4 ticks, level 1 the next 16, later timers overflow
+    wheel = ManualWheel(resolution=1.0, slots=4, levels=2)
+    fired = []
+
+    deadlines = [0.5, 1, 3, 3.5, 4, 5, 15, 16, 17, 31.2, 64, 100]
+    for deadline in deadlines:
+        wheel.call_at(deadline, lambda deadline: fired.append((deadline, wheel.current_tick)), deadline)
+
+    test_pass = True
+    if len(wheel.overflow) != 5:
+        print(f"Expected the timers from tick 16 on to overflow, got {len(wheel.overflow)}")
+        test_pass = False
+
+    wheel.run_until(200)
+    expected = [(deadline, math.ceil(deadline)) for deadline in deadlines]
+    if fired != expected:
+        print(f"Expected the timers to fire at\n{expected}, got\n{fired}")
+        test_pass = False
+    if wheel.pending != 0 or wheel.stats["fired"] != len(deadlines):
+        print(f"Unexpected wheel state after firing everything: {wheel.get_stats()}")
+        test_pass = False
+
+    # A timer added while the wheel runs is placed relative to the current tick
+    wheel.call_at(wheel.now + 37, lambda: fired.append(("late", wheel.current_tick)))
+    wheel.run_until(wheel.now + 40)
+    if fired[-1] != ("late", 237):
+        print(f"Expected the late timer at tick 237, got {fired[-1]}")
+        test_pass = False
+
+    if test_pass:
+        print("Timing wheel deadlines test passed.")
+
+
+# A timer cancelled before its tick never fires, cancelling one that fired has no effect
+def test_cancel():
+    wheel = ManualWheel(resolution=1.0, slots=4, levels=2)
+    fired = []
+
+    early = wheel.call_at(2, fired.append, "early")
+    cascaded = wheel.call_at(9, fired.append, "cascaded")
+    overflowing = wheel.call_at(40, fired.append, "overflowing")
+    kept = wheel.call_at(41, fired.append, "kept")
+
+    wheel.run_until(3)
+    cascaded.cancel()
+    overflowing.cancel()
+    early.cancel()
+    wheel.run_until(50)
+
+    test_pass = True
+    if fired != ["early", "kept"]:
+        print(f"Expected only the timers not cancelled before their tick to fire, got {fired}")
+        test_pass = False
+    if wheel.pending != 0 or wheel.stats["cancelled"] != 2 or wheel.stats["fired"] != 2:
+        print(f"Unexpected wheel state after cancelling: {wheel.get_stats()}")
+        test_pass = False
+
+    if test_pass:
+        print("Timing wheel cancel test passed.")
+
+
+# A phase waits for its deadline on the worker's wheel, and wakes up as soon as it is cancelled
+async def test_phase_cancellation():
+    loop = asyncio.get_running_loop()
+    test_pass = True
+
+    cancellation = PhaseCancellation()
+    start = loop.time()
+    cancelled = await cancellation.wait_until(start + 0.3)
+    elapsed = loop.time() - start
+    if cancelled or not 0.3 <= elapsed < 0.3 + 2 * scheduler.resolution:
+        print(f"Expected the wait to time out after 0.3s, got {cancelled} after {elapsed:.3f}s")
+        test_pass = False
+
+    start = loop.time()
+    loop.call_later(0.1, cancellation.set)
+    cancelled = await cancellation.wait_until(start + 5)
+    elapsed = loop.time() - start
+    if not cancelled or elapsed > 0.2:
+        print(f"Expected the wait to be cancelled after 0.1s, got {cancelled} after {elapsed:.3f}s")
+        test_pass = False
+
+    # Set before the wait, e.g. a guess right before the phase starts waiting
+    if not await asyncio.wait_for(cancellation.wait_until(loop.time() + 5), timeout=0.1):
+        print("Expected a cancellation set before the wait to return at once")
+        test_pass = False
+
+    cancellation.clear()
+    if await cancellation.wait_until(loop.time() + 0.1):
+        print("Expected a cleared cancellation to wait again")
+        test_pass = False
+
+    # Only the waits which did not return at once used a timer
+    if scheduler.stats["scheduled"] != 3:
+        print(f"Expected 3 timers scheduled: {scheduler.get_stats()}")
+        test_pass = False
+
+    await scheduler.stop()
+    if test_pass:
+        print("Phase cancellation test passed.")
+
+
+# Cost of scheduling and firing timers spread over a few minutes, e.g. the phases of many rooms
+def benchmark():
+    wheel = ManualWheel()
+    start = time.perf_counter()
+    for i in range(NUMBER):
+        wheel.call_at(i % 3600 * 0.05, lambda: None)
+    scheduled = time.perf_counter() - start
+    wheel.run_until(3600 * 0.05)
+    fired = time.perf_counter() - start - scheduled
+    print(f"{NUMBER} timers: {scheduled / NUMBER * 1e6:.2f}us to schedule, {fired / NUMBER * 1e6:.2f}us to fire")
+
+
+if __name__ == "__main__":
+    test_deadlines()
+    test_cancel()
+    asyncio.run(test_phase_cancellation())
+    benchmark()
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import requests
+import websockets
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+WEBSOCKET_URL = "ws://127.0.0.1:8000/ws"
+
+NUMBER_OF_MESSAGES = 50
+
+
+async def receive_events(websocket, duration: float):
+    """Events received until nothing comes for the given duration, and the number of frames they came in."""
+    events, frames = [], 0
+    try:
+        while True:
+            frame = json.loads(await asyncio.wait_for(websocket.recv(), timeout=duration))
+            frames += 1
+            events += frame if isinstance(frame, list) else [frame]
+    except asyncio.TimeoutError:
+        pass
+    return events, frames
+
+
+# A batching client receives the same events in the same order as a regular one, in fewer frames
+async def test_batch():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()
+    batch_player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "barb"}).json()
+
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player['id']}") as websocket, websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{batch_player['id']}?batch=1") as batch_websocket:
+        await receive_events(websocket, 0.5)
+        await receive_events(batch_websocket, 0.5)
+
+        # Send a burst of messages without waiting for their acks
+        for i in range(NUMBER_OF_MESSAGES):
+            await batch_websocket.send(json.dumps({"id": str(i), "command": "chat", "payload": {"content": str(i)}}))
+
+        (events, frames), (batch_events, batch_frames) = await asyncio.gather(receive_events(websocket, 1), receive_events(batch_websocket, 1))
+
+    test_pass = True
+    messages = [event["content"]["content"] for event in events if event["type"] == "new_message"]
+    batch_messages = [event["content"]["content"] for event in batch_events if event["type"] == "new_message"]
+    acks = [event["content"]["id"] for event in batch_events if event["type"] == "ack"]
+    expected = [str(i) for i in range(NUMBER_OF_MESSAGES)]
+
+    if messages != expected or batch_messages != expected:
+        print(f"Messages out of order or missing:\n{messages}\n{batch_messages}")
+        test_pass = False
+    if acks != expected:
+        print(f"Acks out of order or missing: {acks}")
+        test_pass = False
+    if batch_frames >= frames:
+        print(f"Batching did not reduce the frames: {batch_frames} against {frames}")
+        test_pass = False
+
+    print(f"Regular client: {len(events)} events in {frames} frames, batching client: {len(batch_events)} events in {batch_frames} frames")
+    if test_pass:
+        print("Websocket batch test passed.")
+
+
+# Echoed text is sent as a JSON string in the array frames, even when it looks like JSON
+async def test_batch_echo():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    batch_player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "barb"}).json()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{batch_player['id']}?batch=1") as batch_websocket, websockets.connect(f"{WEBSOCKET_URL}/{room_id}/%7Bpedro") as websocket:
+        await receive_events(batch_websocket, 0.5)
+        await websocket.send("hello")
+        try:
+            events, _ = await receive_events(batch_websocket, 0.5)
+            if "{pedro: hello" not in events:
+                print(f"Echo missing from the array frames: {events}")
+                test_pass = False
+        except json.JSONDecodeError as e:
+            print(f"Malformed array frame: {e}")
+            test_pass = False
+
+    if test_pass:
+        print("Websocket batch echo test passed.")
+
+
+async def main():
+    await test_batch()
+    await test_batch_echo()
+
+if __name__ == "__main__":
+    asyncio.run(main())
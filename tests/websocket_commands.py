@@ -0,0 +1,192 @@
+import asyncio
+import json
+import msgpack
+import statistics
+import time
+import requests
+import websockets
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+WEBSOCKET_URL = "ws://127.0.0.1:8000/ws"
+
+NUMBER_OF_MESSAGES = 100
+
+
+async def wait_for(websocket, message_type: str, request_id: str = None) -> dict:
+    """Next event of the given type, and with the given request id for acks."""
+    while True:
+        event = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+        if event["type"] == message_type and (request_id is None or event["content"]["id"] == request_id):
+            return event["content"]
+
+async def send_command(websocket, request_id: str, command: str, payload: dict = {}, event_type: str = None):
+    """Send a command and return its ack, and the first event of event_type if set: broadcasts may arrive before or after the ack."""
+    await websocket.send(json.dumps({"id": request_id, "command": command, "payload": payload}))
+
+    ack, event = None, None
+    while ack is None or (event_type and event is None):
+        received = json.loads(await asyncio.wait_for(websocket.recv(), timeout=5))
+        if received["type"] == "ack" and received["content"]["id"] == request_id:
+            ack = received["content"]
+        elif received["type"] == event_type and event is None:
+            event = received["content"]
+    return (ack, event) if event_type else ack
+
+
+# Each command is acknowledged to its sender, with the status the HTTP route would have answered
+async def test_commands():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player['id']}") as websocket:
+        await wait_for(websocket, "room_state")
+
+        ack, message = await send_command(websocket, "1", "chat", {"content": "hello"}, "new_message")
+        if not ack["ok"] or message["content"] != "hello" or message["sender_id"] != player["id"]:
+            print(f"Chat command failed: {ack} {message}")
+            test_pass = False
+
+        ack, ready = await send_command(websocket, "2", "ready", {"ready": True}, "player_ready")
+        if not ack["ok"] or ready != {"player_name": "pedro", "ready": True}:
+            print(f"Ready command failed: {ack} {ready}")
+            test_pass = False
+
+        ack, room = await send_command(websocket, "3", "resync", event_type="room_state")
+        if not ack["ok"] or room["room_id"] != room_id:
+            print(f"Resync command failed: {ack}")
+            test_pass = False
+
+        ack = await send_command(websocket, "4", "pick_song", {"song_id": 1})
+        if ack["ok"] or ack["status"] != 403:
+            print(f"Pick song command should be refused outside of the singer's turn: {ack}")
+            test_pass = False
+
+        ack = await send_command(websocket, "5", "dance")
+        if ack["ok"] or ack["status"] != 422:
+            print(f"Unknown command should be refused: {ack}")
+            test_pass = False
+
+        # Frames which are not commands are still echoed to the room
+        await websocket.send("plain text")
+        echo = await asyncio.wait_for(websocket.recv(), timeout=5)
+        if echo != f"{player['id']}: plain text":
+            print(f"Plain text was not echoed: {echo}")
+            test_pass = False
+
+    if test_pass:
+        print("Websocket commands test passed.")
+
+
+# Clients offering the MessagePack subprotocol get binary [type code, content] frames, and can send binary commands
+async def test_msgpack_commands():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player['id']}", subprotocols=["karavan.msgpack"]) as websocket:
+        code, room = msgpack.unpackb(await asyncio.wait_for(websocket.recv(), timeout=5))
+        if websocket.subprotocol != "karavan.msgpack" or code != 5 or room["room_id"] != room_id:
+            print(f"Room state not received as MessagePack: {websocket.subprotocol} {code}")
+            test_pass = False
+
+        await websocket.send(msgpack.packb({"id": "1", "command": "chat", "payload": {"content": "hello"}}))
+        events = {}
+        while len(events) < 2:
+            code, content = msgpack.unpackb(await asyncio.wait_for(websocket.recv(), timeout=5))
+            events[code] = content
+        if not events.get(16, {}).get("ok") or events.get(3, {}).get("content") != "hello":
+            print(f"MessagePack chat command failed: {events}")
+            test_pass = False
+
+    if test_pass:
+        print("Websocket MessagePack test passed.")
+
+
+# The singer knows the song: the title in their chat is not a guess, while the same message from another player ends the phase
+async def test_singer_guess():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    player_ids = []
+    for name in ["pedro", "barb"]:
+        player_ids.append(requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": name}).json()["id"])
+        requests.post(f"{SERVER_URL}/room/ready", json={"room_id": room_id, "player_name": name, "ready": True})
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player_ids[0]}") as pedro, websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player_ids[1]}") as barb:
+        requests.post(f"{SERVER_URL}/game", json={"room_id": room_id})
+
+        # Only the singer receives the song choices
+        receivers = {asyncio.create_task(wait_for(websocket, "pick_song")): websocket for websocket in [pedro, barb]}
+        done, pending = await asyncio.wait(receivers, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        singer_task = done.pop()
+        singer = receivers[singer_task]
+        guesser = barb if singer is pedro else pedro
+
+        choices = singer_task.result()
+        ack, song = await send_command(singer, "1", "pick_song", {"song_id": choices[0]["id"]}, "singer_song_data")
+        await wait_for(guesser, "phase_change")
+
+        # Timers keep coming during the phase: bound the wait for the events expected
+        try:
+            ack, message = await asyncio.wait_for(send_command(singer, "2", "chat", {"content": song["title"]}, "new_message"), timeout=5)
+            if not ack["ok"] or message["content"] != song["title"]:
+                print(f"The singer's message should only be chat: {ack} {message}")
+                test_pass = False
+
+            # Picking another song while the others guess would change the answer
+            if len(choices) > 1:
+                ack = await asyncio.wait_for(send_command(singer, "3", "pick_song", {"song_id": choices[1]["id"]}), timeout=5)
+                if ack["ok"] or ack["status"] != 409:
+                    print(f"Pick song command should be refused during the guessing phase: {ack}")
+                    test_pass = False
+
+            ack, ended = await asyncio.wait_for(send_command(guesser, "4", "chat", {"content": song["title"]}, "turn_ended_prematurely"), timeout=5)
+            if not ack["ok"]:
+                print(f"The other player's guess was not handled: {ack}")
+                test_pass = False
+        except asyncio.TimeoutError:
+            print("The singer's message was taken as a guess")
+            test_pass = False
+
+    if test_pass:
+        print("Websocket singer guess test passed.")
+
+
+# Time from sending a chat message to receiving it back, through HTTP and through a command
+async def benchmark_chat_latency():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    player = requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": "pedro"}).json()
+    session = requests.Session()
+
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{player['id']}") as websocket:
+        await wait_for(websocket, "room_state")
+
+        http_times = []
+        for i in range(NUMBER_OF_MESSAGES):
+            start = time.perf_counter()
+            session.post(f"{SERVER_URL}/chat", json={"room_id": room_id, "message": {"content": f"http {i}", "sender_id": player["id"]}})
+            await wait_for(websocket, "new_message")
+            http_times.append(time.perf_counter() - start)
+
+        command_times = []
+        for i in range(NUMBER_OF_MESSAGES):
+            start = time.perf_counter()
+            await send_command(websocket, str(i), "chat", {"content": f"command {i}"}, "new_message")
+            command_times.append(time.perf_counter() - start)
+
+    for name, times in (("HTTP", http_times), ("Command", command_times)):
+        times.sort()
+        print(f"{name}: mean {statistics.mean(times) * 1000:.2f}ms, p95 {times[int(len(times) * 0.95)] * 1000:.2f}ms, max {times[-1] * 1000:.2f}ms")
+
+
+async def main():
+    await test_commands()
+    await test_msgpack_commands()
+    await test_singer_guess()
+    await benchmark_chat_latency()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import requests
+import websockets
+
+# URL of the server
+SERVER_URL = "http://127.0.0.1:8000"
+WEBSOCKET_URL = "ws://127.0.0.1:8000/ws"
+
+# Settings of the server (see app/settings.py)
+PING_INTERVAL = 20
+IDLE_TIMEOUT = 60
+REPLACED_CLOSE_CODE = 4409
+IDLE_CLOSE_CODE = 4408
+
+
+async def receive_events(websocket, duration: float) -> list:
+    """Events received until nothing comes for the given duration."""
+    events = []
+    try:
+        while True:
+            events.append(json.loads(await asyncio.wait_for(websocket.recv(), timeout=duration)))
+    except asyncio.TimeoutError:
+        pass
+    return events
+
+
+def get_connected(room_id: str, player_id: str) -> bool:
+    room = requests.get(f"{SERVER_URL}/room/{room_id}").json()
+    return next(player["connected"] for player in room["players"] if player["id"] == player_id)
+
+
+def create_room():
+    room_id = requests.post(f"{SERVER_URL}/room").json()["success"]
+    players = [requests.post(f"{SERVER_URL}/room/join", json={"room_id": room_id, "player_name": name}).json() for name in ["pedro", "barb"]]
+    return room_id, [player["id"] for player in players]
+
+
+# The other players see a player leave and come back
+async def test_presence():
+    room_id, (pedro_id, barb_id) = create_room()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{barb_id}") as barb:
+        async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{pedro_id}"):
+            await receive_events(barb, 0.5)
+
+        presences = [event["content"] for event in await receive_events(barb, 0.5) if event["type"] == "player_presence"]
+        if presences != [{"player_id": pedro_id, "connected": False}] or get_connected(room_id, pedro_id):
+            print(f"Expected pedro to be disconnected, got {presences}")
+            test_pass = False
+
+        async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{pedro_id}"):
+            presences = [event["content"] for event in await receive_events(barb, 0.5) if event["type"] == "player_presence"]
+            if presences != [{"player_id": pedro_id, "connected": True}] or not get_connected(room_id, pedro_id):
+                print(f"Expected pedro to be connected again, got {presences}")
+                test_pass = False
+
+    if test_pass:
+        print("Websocket presence test passed.")
+
+
+# A player connecting again replaces its previous socket: frames are not duplicated, and the player stays connected
+async def test_replace():
+    room_id, (pedro_id, barb_id) = create_room()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{pedro_id}") as old, websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{pedro_id}") as new:
+        try:
+            await receive_events(old, 1)
+            print("Previous socket was not closed")
+            test_pass = False
+        except websockets.exceptions.ConnectionClosed as e:
+            if e.rcvd is None or e.rcvd.code != REPLACED_CLOSE_CODE:
+                print(f"Expected the close code {REPLACED_CLOSE_CODE}, got {e.rcvd}")
+                test_pass = False
+
+        await receive_events(new, 0.5)
+        requests.post(f"{SERVER_URL}/chat", json={"room_id": room_id, "message": {"content": "hello", "sender_id": barb_id}})
+        messages = [event for event in await receive_events(new, 0.5) if event["type"] == "new_message"]
+        if len(messages) != 1:
+            print(f"Expected the message once, got {messages}")
+            test_pass = False
+        if not get_connected(room_id, pedro_id):
+            print("The previous socket going away marked the player disconnected")
+            test_pass = False
+
+    if test_pass:
+        print("Websocket replace test passed.")
+
+
+# A client answering the pings stays connected, a silent one is closed after the idle timeout. Takes about two minutes
+async def test_heartbeat():
+    room_id, (pedro_id, barb_id) = create_room()
+
+    test_pass = True
+    async with websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{pedro_id}") as pedro, websockets.connect(f"{WEBSOCKET_URL}/{room_id}/{barb_id}") as barb:
+
+        async def answer_pings():
+            while True:
+                if json.loads(await pedro.recv())["type"] == "ping":
+                    await pedro.send("pong")
+
+        answering = asyncio.create_task(answer_pings())
+        try:
+            await asyncio.wait_for(barb.wait_closed(), timeout=IDLE_TIMEOUT + 2 * PING_INTERVAL)
+            if barb.close_code != IDLE_CLOSE_CODE:
+                print(f"Expected the close code {IDLE_CLOSE_CODE}, got {barb.close_code}")
+                test_pass = False
+        except asyncio.TimeoutError:
+            print("The silent socket was not closed")
+            test_pass = False
+
+        if answering.done():
+            print(f"The socket answering the pings was closed: {answering.exception()}")
+            test_pass = False
+        answering.cancel()
+
+    if test_pass:
+        print("Websocket heartbeat test passed.")
+
+
+async def main():
+    await test_presence()
+    await test_replace()
+    await test_heartbeat()
+
+if __name__ == "__main__":
+    asyncio.run(main())